@@ -0,0 +1,5 @@
+"""Headless benchmarks of the plugins in this package
+
+Not loaded by Sublime Text, which only loads plugins from the top level of a
+package.
+"""
@@ -0,0 +1,237 @@
+"""Headless editor that loads the plugins of this package and feeds them editor events
+
+The plugins are imported as the ``Nextflow`` package against the stand-in
+``sublime`` and ``sublime_plugin`` modules in ``bench/headless``, so listeners
+and commands run unchanged. Events are dispatched like Sublime Text does:
+synchronous handlers run right away and ``*_async`` handlers are queued and run
+with the other timeouts by `Editor.run_timers`.
+
+    editor = Editor.load()
+    window = editor.open_window(['/path/to/pipeline'])
+    view = editor.open_file(window, '/path/to/pipeline/main.nf')
+    items = editor.query_completions(view, point)
+    popup = editor.move_cursor(view, point)
+"""
+
+import importlib
+import sys
+import time
+import types
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+HEADLESS_DIR = Path(__file__).resolve().parent / 'headless'
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = 'Nextflow'
+SETTINGS_FILE = 'Nextflow.sublime-settings'
+# longest time to wait for background jobs like project indexing to finish
+IDLE_TIMEOUT_S = 60
+# virtual time after an interaction in which debounced work like popups is run
+SETTLE_MS = 1000
+
+
+def install_headless_api() -> None:
+    """Make `import sublime` and `import sublime_plugin` import the headless stand-ins"""
+    if str(HEADLESS_DIR) not in sys.path:
+        sys.path.insert(0, str(HEADLESS_DIR))
+    import sublime
+    if Path(sublime.__file__).resolve().parent != HEADLESS_DIR:
+        raise ImportError(f'The real sublime module is already imported from {sublime.__file__}')
+
+
+def load_package(package_dir: Path = PACKAGE_DIR, name: str = PACKAGE_NAME) -> List[types.ModuleType]:
+    """Import the plugins of a package like Sublime Text does, returning the plugin modules"""
+    install_headless_api()
+    import sublime
+    settings_path = package_dir / SETTINGS_FILE
+    if settings_path.exists() and SETTINGS_FILE not in sublime._settings:
+        sublime._settings[SETTINGS_FILE] = sublime.Settings(sublime.decode_value(settings_path.read_text()))
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [str(package_dir)]
+        sys.modules[name] = package
+    return [importlib.import_module(f'{name}.{path.stem}') for path in sorted(package_dir.glob('*.py'))]
+
+
+class Editor:
+    """Listeners and commands of the loaded plugins with helpers to simulate editing"""
+
+    def __init__(self, modules: List[types.ModuleType]):
+        import sublime
+        import sublime_plugin
+        self.sublime = sublime
+        self.sublime_plugin = sublime_plugin
+        self.modules = modules
+        names = {x.__name__ for x in modules}
+        self.listeners = [cls() for cls in sublime_plugin.listener_classes if cls.__module__ in names]
+        self.view_listener_classes = [cls for cls in sublime_plugin.view_listener_classes if cls.__module__ in names]
+        self.commands = {sublime_plugin.command_name(cls): cls
+                         for cls in sublime_plugin.command_classes if cls.__module__ in names}
+        self.view_listeners: Dict[int, list] = {}
+        sublime.event_hook = self.dispatch
+        sublime.command_hook = self.run_command
+        for module in modules:
+            if hasattr(module, 'plugin_loaded'):
+                module.plugin_loaded()
+
+    @classmethod
+    def load(cls, package_dir: Path = PACKAGE_DIR, name: str = PACKAGE_NAME) -> 'Editor':
+        return cls(load_package(package_dir, name))
+
+    def module(self, name: str) -> types.ModuleType:
+        """Get a module of the loaded package, e.g. `nflib.index`"""
+        return importlib.import_module(f'{PACKAGE_NAME}.{name}')
+
+    # -- events
+
+    def listeners_for(self, view: Optional[Any]) -> list:
+        listeners = list(self.listeners)
+        if isinstance(view, self.sublime.View):
+            if view.id() not in self.view_listeners:
+                self.view_listeners[view.id()] = [cls(view) for cls in self.view_listener_classes
+                                                  if cls.is_applicable(view.settings())]
+            listeners += self.view_listeners[view.id()]
+        return listeners
+
+    def _call(self, listener: Any, event: str, args: tuple) -> Any:
+        method = getattr(listener, event)
+        if isinstance(listener, self.sublime_plugin.ViewEventListener) and args \
+                and isinstance(args[0], self.sublime.View):
+            # view event listeners are not passed the view
+            args = args[1:]
+        return method(*args)
+
+    def dispatch(self, event: str, *args) -> List[Any]:
+        """Call the handlers of an event, queueing the `_async` handlers, and return the results of the others"""
+        results = []
+        listeners = self.listeners_for(args[0] if args else None)
+        for listener in listeners:
+            if hasattr(listener, event):
+                results.append(self._call(listener, event, args))
+            async_event = f'{event}_async'
+            if hasattr(listener, async_event):
+                self.sublime.set_timeout_async(lambda x=listener: self._call(x, async_event, args))
+        if event == 'on_close' and args:
+            self.view_listeners.pop(args[0].id(), None)
+        return results
+
+    def run_command(self, target: Any, name: str, args: Optional[Dict[str, Any]] = None) -> bool:
+        """Run a plugin command on a view or window, returning whether the command exists"""
+        cls = self.commands.get(name)
+        if cls is None:
+            return False
+        args = args or {}
+        if issubclass(cls, self.sublime_plugin.TextCommand):
+            view = target if isinstance(target, self.sublime.View) else target.active_view()
+            if view is None:
+                return False
+            cls(view).run(self.sublime.Edit(), **args)
+        elif issubclass(cls, self.sublime_plugin.WindowCommand):
+            window = target if isinstance(target, self.sublime.Window) else target.window()
+            cls(window).run(**args)
+        else:
+            cls().run(**args)
+        return True
+
+    def run_timers(self, until_ms: float = SETTLE_MS) -> int:
+        """Run the timeouts due within `until_ms` of virtual time, like queued `_async` event handlers"""
+        return self.sublime.run_timers(until_ms)
+
+    def wait_idle(self, timeout: float = IDLE_TIMEOUT_S) -> None:
+        """Run timeouts and wait for background jobs until there is nothing left to do"""
+        fetcher = self.module('nflib.fetch').fetcher
+        deadline = time.monotonic() + timeout
+        while True:
+            self.run_timers()
+            jobs = fetcher.running_jobs()
+            if not jobs and not self.sublime.pending_timers():
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Background jobs still running: {[x.title for x in jobs]}')
+            for job in jobs:
+                job.wait(max(deadline - time.monotonic(), 0))
+
+    # -- windows and views
+
+    def open_window(self, folders: List[Union[str, Path]]) -> Any:
+        window = self.sublime.Window([str(x) for x in folders])
+        self.dispatch('on_new_window', window)
+        return window
+
+    def open_file(self, window: Any, path: Union[str, Path]) -> Any:
+        view = window.open_file(str(path))
+        self.run_timers()
+        return view
+
+    def new_view(self, window: Any, text: str, syntax: str = 'source.nextflow') -> Any:
+        view = window.new_file(syntax=syntax)
+        view.set_text(text)
+        self.run_timers()
+        return view
+
+    # -- interactions
+
+    def query_completions(self, view: Any, point: int, prefix: Optional[str] = None) -> list:
+        """Get the completion items all listeners offer at a point, waiting for deferred completion lists"""
+        if prefix is None:
+            word = view.word(point)
+            prefix = view.substr(self.sublime.Region(word.begin(), point)) if word.begin() < point else ''
+        items = []
+        for result in self.dispatch('on_query_completions', view, prefix, [point]):
+            if result is None:
+                continue
+            if isinstance(result, self.sublime.CompletionList):
+                if result.completions is None:
+                    self.wait_idle()
+                items.extend(result.completions or [])
+            elif isinstance(result, tuple):
+                items.extend(result[0])
+            else:
+                items.extend(result)
+        return items
+
+    def move_cursor(self, view: Any, point: int) -> Optional[str]:
+        """Move the cursor, run the lookups it triggers and return the content of any popup shown"""
+        view.hide_popup()
+        view.set_cursor(point)
+        self.run_timers()
+        return view.popup[0] if view.popup else None
+
+    def hover(self, view: Any, point: int) -> Optional[str]:
+        """Hover over a point, run the lookups it triggers and return the content of any popup shown"""
+        view.hide_popup()
+        self.dispatch('on_hover', view, point, self.sublime.HOVER_TEXT)
+        self.run_timers()
+        return view.popup[0] if view.popup else None
+
+    def type_text(self, view: Any, point: int, text: str) -> None:
+        """Insert text at a point as if typed, moving the cursor after it"""
+        view.selection.clear()
+        view.selection.add(point)
+        view.run_command('insert', {'characters': text})
+        self.run_timers()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Load the plugins and index a project, printing what was loaded"""
+    import argparse
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('project_dir', nargs='?', type=Path, help='Nextflow pipeline directory to open')
+    args = parser.parse_args(argv)
+    editor = Editor.load()
+    print(f'{len(editor.modules)} plugins, {len(editor.listeners)} event listeners, '
+          f'{len(editor.view_listener_classes)} view event listeners, {len(editor.commands)} commands:')
+    for name in sorted(editor.commands):
+        print(f'  {name}')
+    if args.project_dir is not None:
+        window = editor.open_window([args.project_dir.resolve()])
+        main_script = args.project_dir / 'main.nf'
+        if main_script.exists():
+            editor.open_file(window, main_script.resolve())
+        editor.wait_idle()
+        if window.status_messages:
+            print(window.status_messages[-1])
+
+
+if __name__ == '__main__':
+    main()
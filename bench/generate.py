@@ -0,0 +1,326 @@
+"""Generate synthetic Nextflow pipelines laid out like nf-core pipelines
+
+A pipeline has a ``main.nf`` running a ``PIPELINE`` workflow, which includes
+and calls modules and subworkflows, nf-core style modules with labels, conda
+directives and named outputs, helper functions, ``nextflow.config`` including
+configs with ``withLabel`` and ``withName`` selectors, a
+``nextflow_schema.json`` with grouped params and a ``work/`` directory of task
+directories that should never be walked.
+
+    python -m bench.generate /tmp/pipeline --modules 500 --labels 50
+"""
+
+import argparse
+import json
+import random
+import shutil
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+LABELS = ['process_single', 'process_low', 'process_medium', 'process_high', 'process_long', 'process_high_memory']
+
+
+class PipelineSpec(NamedTuple):
+    modules: int = 200
+    subworkflows: int = 20
+    # modules included and called by the main workflow
+    includes: int = 50
+    functions: int = 20
+    # withLabel selectors in conf/base.config
+    labels: int = 20
+    # extra configs included by nextflow.config, each with withName selectors
+    configs: int = 5
+    params: int = 300
+    profiles: int = 5
+    # task directories under work/
+    work_dirs: int = 2000
+    seed: int = 0
+
+
+def module_name(i: int) -> str:
+    return f'TOOL{i}_RUN'
+
+
+def module_path(i: int) -> str:
+    return f'modules/nf-core/tool{i}/run/main.nf'
+
+
+def subworkflow_name(i: int) -> str:
+    return f'SUBWF_{i}'
+
+
+def label_name(i: int) -> str:
+    return LABELS[i] if i < len(LABELS) else f'process_custom_{i}'
+
+
+def param_name(i: int) -> str:
+    return f'param_{i}'
+
+
+def module_script(i: int, n_labels: int) -> str:
+    name = module_name(i)
+    return f'''process {name} {{
+    tag "$meta.id"
+    label '{label_name(i % max(n_labels, 1))}'
+
+    conda "bioconda::tool{i}=1.{i % 10}.0"
+    container "quay.io/biocontainers/tool{i}:1.{i % 10}.0--h0000000_0"
+
+    input:
+    tuple val(meta), path(reads)
+    path reference
+
+    output:
+    tuple val(meta), path("*.out"), emit: results
+    tuple val(meta), path("*.log"), emit: log
+    path "versions.yml"            , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def args = task.ext.args ?: ''
+    def prefix = task.ext.prefix ?: "${{meta.id}}"
+    """
+    tool{i} run \\\\
+        $args \\\\
+        --threads $task.cpus \\\\
+        --reference $reference \\\\
+        $reads > ${{prefix}}.out 2> ${{prefix}}.log
+
+    cat <<-END_VERSIONS > versions.yml
+    "${{task.process}}":
+        tool{i}: \\$(tool{i} --version | sed 's/tool{i} //')
+    END_VERSIONS
+    """
+}}
+'''
+
+
+def relative_include(from_dir: str, path: str) -> str:
+    depth = from_dir.count('/') + 1 if from_dir else 0
+    prefix = '../' * depth if depth else './'
+    return prefix + path[:-len('.nf')]
+
+
+def subworkflow_script(i: int, modules: List[int]) -> str:
+    name = subworkflow_name(i)
+    from_dir = f'subworkflows/local/subwf_{i}'
+    includes = '\n'.join(f"include {{ {module_name(m)} }} from '{relative_include(from_dir, module_path(m))}'"
+                         for m in modules)
+    calls = []
+    channel = 'ch_input'
+    for m in modules:
+        calls.append(f'    {module_name(m)}({channel}, reference)')
+        calls.append(f'    ch_versions = ch_versions.mix({module_name(m)}.out.versions.first())')
+        channel = f'{module_name(m)}.out.results'
+    body = '\n'.join(calls)
+    return f'''{includes}
+
+workflow {name} {{
+    take:
+    ch_input  // channel: [ val(meta), [ reads ] ]
+    reference // path: reference
+
+    main:
+    ch_versions = Channel.empty()
+{body}
+
+    emit:
+    results  = {channel}
+    versions = ch_versions
+}}
+'''
+
+
+def functions_script(n: int) -> str:
+    out = []
+    for i in range(n):
+        out.append(f'''def helperFunction{i}(meta, value) {{
+    def out = [:]
+    out.id = meta.id + "_{i}"
+    out.value = value * {i}
+    return out
+}}
+''')
+    return '\n'.join(out)
+
+
+def pipeline_script(spec: PipelineSpec) -> str:
+    from_dir = 'workflows'
+    includes = [f"include {{ {module_name(m)} }} from '{relative_include(from_dir, module_path(m))}'"
+                for m in range(min(spec.includes, spec.modules))]
+    includes += [f"include {{ {subworkflow_name(i)} }} from "
+                 f"'{relative_include(from_dir, f'subworkflows/local/subwf_{i}/main.nf')}'"
+                 for i in range(spec.subworkflows)]
+    includes.append("include { " + '; '.join(f'helperFunction{i}' for i in range(min(spec.functions, 5)))
+                    + " } from '../subworkflows/local/utils'")
+    calls = []
+    for m in range(min(spec.includes, spec.modules)):
+        calls.append(f'    {module_name(m)}(ch_reads, ch_reference)')
+        calls.append(f'    ch_versions = ch_versions.mix({module_name(m)}.out.versions)')
+    for i in range(spec.subworkflows):
+        calls.append(f'    {subworkflow_name(i)}(ch_reads, ch_reference)')
+        calls.append(f'    ch_versions = ch_versions.mix({subworkflow_name(i)}.out.versions)')
+    includes_text = '\n'.join(includes)
+    calls_text = '\n'.join(calls)
+    return f'''{includes_text}
+
+workflow PIPELINE {{
+    ch_versions = Channel.empty()
+    ch_reads = Channel.fromFilePairs(params.input)
+    ch_reference = file(params.{param_name(0)})
+
+{calls_text}
+
+    ch_versions.unique().collectFile(name: 'versions.yml', storeDir: params.outdir)
+}}
+'''
+
+
+def main_script(spec: PipelineSpec) -> str:
+    params = '\n'.join(f'params.{param_name(i)} = WorkflowMain.getGenomeAttribute(params, "{param_name(i)}")'
+                       for i in range(min(spec.params, 5)))
+    return f'''#!/usr/bin/env nextflow
+nextflow.enable.dsl = 2
+
+{params}
+
+include {{ PIPELINE }} from './workflows/pipeline'
+
+workflow {{
+    PIPELINE()
+}}
+'''
+
+
+def nextflow_config(spec: PipelineSpec) -> str:
+    params = '\n'.join(f"    {param_name(i)} = '{i}'" for i in range(spec.params))
+    includes = '\n'.join(f"includeConfig 'conf/modules_{i}.config'" for i in range(spec.configs))
+    profiles = '\n'.join(f'''    profile_{i} {{
+        params.{param_name(i)} = 'profile_{i}'
+        process {{
+            withLabel: '{label_name(i % max(spec.labels, 1))}' {{
+                cpus = {i + 1}
+            }}
+        }}
+    }}''' for i in range(spec.profiles))
+    return f'''params {{
+    input = null
+    outdir = 'results'
+{params}
+}}
+
+includeConfig 'conf/base.config'
+{includes}
+
+profiles {{
+{profiles}
+}}
+'''
+
+
+def base_config(spec: PipelineSpec) -> str:
+    selectors = '\n'.join(f'''    withLabel: '{label_name(i)}' {{
+        cpus   = {{ check_max( {i % 16 + 1} * task.attempt, 'cpus' ) }}
+        memory = {{ check_max( {(i % 8 + 1) * 6}.GB * task.attempt, 'memory' ) }}
+        time   = {{ check_max( {i % 24 + 1}.h * task.attempt, 'time' ) }}
+    }}''' for i in range(spec.labels))
+    return f'''process {{
+    cpus   = {{ check_max( 1    * task.attempt, 'cpus'   ) }}
+    memory = {{ check_max( 6.GB * task.attempt, 'memory' ) }}
+    time   = {{ check_max( 4.h  * task.attempt, 'time'   ) }}
+
+    errorStrategy = {{ task.exitStatus in [143,137,104,134,139] ? 'retry' : 'finish' }}
+
+{selectors}
+}}
+'''
+
+
+def modules_config(spec: PipelineSpec, i: int) -> str:
+    modules = range(i, spec.modules, max(spec.configs, 1))
+    selectors = '\n'.join(f'''    withName: '.*:{module_name(m)}' {{
+        ext.args = '--fast'
+        publishDir = [ path: {{ "${{params.outdir}}/tool{m}" }}, mode: params.publish_dir_mode ]
+    }}''' for m in modules)
+    return f'''process {{
+{selectors}
+}}
+'''
+
+
+def schema(spec: PipelineSpec, groups: int = 10) -> dict:
+    definitions: Dict[str, dict] = {}
+    for g in range(groups):
+        properties = {}
+        for i in range(g, spec.params, groups):
+            properties[param_name(i)] = {
+                'type': 'string',
+                'default': str(i),
+                'description': f'Param {i} of group {g}',
+                'help_text': f'A longer description of param {i}. ' * 3,
+                'fa_icon': 'fas fa-cog',
+            }
+        definitions[f'group_{g}'] = {
+            'title': f'Group {g}',
+            'type': 'object',
+            'description': f'Params of group {g}',
+            'properties': properties,
+        }
+    return {
+        '$schema': 'http://json-schema.org/draft-07/schema',
+        'title': 'Synthetic pipeline parameters',
+        'type': 'object',
+        'definitions': definitions,
+        'allOf': [{'$ref': f'#/definitions/{x}'} for x in definitions],
+    }
+
+
+def write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def generate_pipeline(out_dir: Path, spec: PipelineSpec = PipelineSpec()) -> Path:
+    """Write a synthetic pipeline to `out_dir`, replacing anything already there"""
+    rng = random.Random(spec.seed)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    write(out_dir / 'main.nf', main_script(spec))
+    write(out_dir / 'workflows' / 'pipeline.nf', pipeline_script(spec))
+    for i in range(spec.modules):
+        write(out_dir / module_path(i), module_script(i, spec.labels))
+    for i in range(spec.subworkflows):
+        modules = rng.sample(range(spec.modules), min(3, spec.modules))
+        write(out_dir / 'subworkflows' / 'local' / f'subwf_{i}' / 'main.nf', subworkflow_script(i, modules))
+    write(out_dir / 'subworkflows' / 'local' / 'utils.nf', functions_script(spec.functions))
+    write(out_dir / 'nextflow.config', nextflow_config(spec))
+    write(out_dir / 'conf' / 'base.config', base_config(spec))
+    for i in range(spec.configs):
+        write(out_dir / 'conf' / f'modules_{i}.config', modules_config(spec, i))
+    write(out_dir / 'nextflow_schema.json', json.dumps(schema(spec), indent=4))
+    write(out_dir / '.gitignore', '.nextflow*\nwork/\nresults/\n')
+    # task directories with staged scripts that must not be indexed
+    for i in range(spec.work_dirs):
+        task_dir = out_dir / 'work' / f'{rng.randrange(256):02x}' / f'{rng.getrandbits(120):030x}'
+        write(task_dir / '.command.sh', f'#!/bin/bash -ue\ntool{i} run\n')
+        write(task_dir / '.command.log', '')
+        write(task_dir / 'staged.nf', module_script(i, spec.labels))
+    return out_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate a synthetic Nextflow pipeline')
+    parser.add_argument('out_dir', type=Path)
+    defaults = PipelineSpec()
+    for field in PipelineSpec._fields:
+        parser.add_argument(f'--{field.replace("_", "-")}', type=int, default=getattr(defaults, field))
+    args = parser.parse_args()
+    spec = PipelineSpec(**{field: getattr(args, field) for field in PipelineSpec._fields})
+    generate_pipeline(args.out_dir, spec)
+    print(f'Generated {args.out_dir} with {spec}')
+
+
+if __name__ == '__main__':
+    main()
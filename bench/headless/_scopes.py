@@ -0,0 +1,280 @@
+"""Scope selectors and an approximate Nextflow scoper for the headless editor
+
+Without Sublime Text's syntax engine, buffers are scoped by a small lexer and a
+few regexes that reproduce the extents of the scopes the plugins query in
+``Nextflow.sublime-syntax``: process and workflow definitions, process names
+and calls, ``.out`` channel access, ``params.x``, conda directives, strings and
+comments. Scope selectors support descendant paths, ``|``, ``,``, ``&``, ``-``
+and parentheses.
+"""
+
+import re
+from typing import Callable, List, Optional, Tuple
+
+# (begin, end, scope) with regions of enclosing scopes listed before the regions they contain
+ScopeRegion = Tuple[int, int, str]
+
+# ------------------------------------------------------------------------------------------------
+# Selectors
+
+regex_selector_token = re.compile(r'\s*(?:([()|,&])|(?<![\w.])(-)(?![\w.])|([\w][\w.\-]*))')
+
+Matcher = Callable[[List[str]], int]
+
+
+def _atom_matches(atom: str, scope: str) -> bool:
+    return scope == atom or scope.startswith(atom + '.')
+
+
+def _path(atoms: List[str]) -> Matcher:
+    """Match a descendant path like `source.nextflow string`, scoring deeper matches higher"""
+
+    def match(stack: List[str]) -> int:
+        score = 0
+        i = 0
+        for atom in atoms:
+            while i < len(stack) and not _atom_matches(atom, stack[i]):
+                i += 1
+            if i == len(stack):
+                return 0
+            score += 1 << min(i, 30)
+            i += 1
+        return max(score, 1)
+
+    return match
+
+
+class _SelectorParser:
+    def __init__(self, selector: str):
+        self.tokens: List[Tuple[str, str]] = []
+        pos = 0
+        selector = selector.strip()
+        while pos < len(selector):
+            m = regex_selector_token.match(selector, pos)
+            if m is None or m.end() == pos:
+                raise ValueError(f'Invalid scope selector: {selector!r}')
+            op, minus, atom = m.groups()
+            if atom:
+                self.tokens.append(('atom', atom))
+            elif op or minus:
+                self.tokens.append(('op', op or minus))
+            pos = m.end()
+            while pos < len(selector) and selector[pos].isspace():
+                pos += 1
+        self.pos = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Matcher:
+        if not self.tokens:
+            return lambda stack: 1
+        matcher = self.alternatives()
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected {self.peek()[1]!r} in scope selector')
+        return matcher
+
+    def alternatives(self) -> Matcher:
+        options = [self.conjunction()]
+        while self.peek() in (('op', '|'), ('op', ',')):
+            self.take()
+            options.append(self.conjunction())
+        if len(options) == 1:
+            return options[0]
+        return lambda stack: max(x(stack) for x in options)
+
+    def conjunction(self) -> Matcher:
+        parts = [self.difference()]
+        while self.peek() == ('op', '&'):
+            self.take()
+            parts.append(self.difference())
+        if len(parts) == 1:
+            return parts[0]
+        return lambda stack: min(x(stack) for x in parts)
+
+    def difference(self) -> Matcher:
+        positive = self.term()
+        negatives = []
+        while self.peek() == ('op', '-'):
+            self.take()
+            negatives.append(self.term())
+
+        def match(stack: List[str]) -> int:
+            score = positive(stack)
+            if score and any(x(stack) for x in negatives):
+                return 0
+            return score
+
+        return match if negatives else positive
+
+    def term(self) -> Matcher:
+        token = self.peek()
+        if token == ('op', '('):
+            self.take()
+            matcher = self.alternatives()
+            if self.peek() != ('op', ')'):
+                raise ValueError('Unbalanced parentheses in scope selector')
+            self.take()
+            return matcher
+        atoms = []
+        while self.peek() is not None and self.peek()[0] == 'atom':
+            atoms.append(self.take()[1])
+        if not atoms:
+            # e.g. a leading `- comment`, which excludes from everything
+            return lambda stack: 1
+        return _path(atoms)
+
+
+_selectors = {}
+
+
+def compile_selector(selector: str) -> Matcher:
+    try:
+        return _selectors[selector]
+    except KeyError:
+        matcher = _selectors[selector] = _SelectorParser(selector).parse()
+        return matcher
+
+
+def score_selector(scope: str, selector: str) -> int:
+    """Score a space separated scope name like `source.nextflow string.quoted` against a selector"""
+    return compile_selector(selector)(scope.split())
+
+
+# ------------------------------------------------------------------------------------------------
+# Nextflow scoper
+
+regex_process = re.compile(r'^[ \t]*(process)\s+(\w+)\s*(\{)', re.MULTILINE)
+regex_workflow = re.compile(r'^[ \t]*(workflow)[ \t]*(\w+)?[^\n{]*(\{)', re.MULTILINE)
+regex_method = re.compile(r'^[ \t]*(def)\s+(\w+)\s*(?=\()', re.MULTILINE)
+regex_include = re.compile(r'\b(include)\b[^\n]*', re.MULTILINE)
+regex_params = re.compile(r'\b(params)(\.)(\w+)?')
+regex_directive = re.compile(
+    r'^[ \t]+(afterScript|beforeScript|cache|cpus|container|containerOptions|clusterOptions|disk|echo|'
+    r'errorStrategy|executor|ext|label|maxErrors|maxForks|maxRetries|memory|module|penv|pod|publishDir|queue|'
+    r'scratch|stageInMode|stageOutMode|storeDir|tag|time|validExitStatus)\b',
+    re.MULTILINE,
+)
+regex_conda = re.compile(r'^[ \t]*(conda)\s+[^\n]*', re.MULTILINE)
+regex_process_name = re.compile(r'\b([A-Z][A-Z0-9_]+)')
+regex_out = re.compile(r'\.(out)\b[ \t]*(\.)?(\w+)?')
+
+STRING_SCOPES = {
+    '"""': 'string.quoted.triple.double.nextflow',
+    "'''": 'string.quoted.triple.single.nextflow',
+    '"': 'string.quoted.double.nextflow',
+    "'": 'string.quoted.single.nextflow',
+}
+
+
+def lex(text: str) -> Tuple[str, List[ScopeRegion]]:
+    """Find strings and comments, returning the text with them blanked out and their regions"""
+    regions = []
+    masked = list(text)
+    pos = 0
+    n = len(text)
+    while pos < n:
+        c = text[pos]
+        if c == '/' and text.startswith('//', pos):
+            end = text.find('\n', pos)
+            end = n if end == -1 else end
+            regions.append((pos, end, 'comment.line.double-slash.nextflow'))
+        elif c == '/' and text.startswith('/*', pos):
+            end = text.find('*/', pos + 2)
+            end = n if end == -1 else end + 2
+            regions.append((pos, end, 'comment.block.nextflow'))
+        elif c in '"\'':
+            quote = text[pos:pos + 3] if text.startswith(c * 3, pos) else c
+            end = pos + len(quote)
+            while end < n:
+                if text[end] == '\\':
+                    end += 2
+                    continue
+                if text.startswith(quote, end):
+                    end += len(quote)
+                    break
+                if len(quote) == 1 and text[end] == '\n':
+                    break
+                end += 1
+            end = min(end, n)
+            regions.append((pos, end, STRING_SCOPES[quote]))
+        else:
+            pos += 1
+            continue
+        for i in range(pos, end):
+            if masked[i] != '\n':
+                masked[i] = ' '
+        pos = end
+    return ''.join(masked), regions
+
+
+def matching(masked: str, start: int, open_char: str = '{', close_char: str = '}') -> int:
+    """Get the position after the bracket closing the one at `start` (or the end of the text)"""
+    depth = 0
+    for i in range(start, len(masked)):
+        c = masked[i]
+        if c == open_char:
+            depth += 1
+        elif c == close_char:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(masked)
+
+
+def _workflow_body(masked: str, begin: int, end: int, regions: List[ScopeRegion]) -> None:
+    for m in regex_process_name.finditer(masked, begin, end):
+        regions.append((m.start(1), m.end(1), 'entity.name.class.process.nextflow'))
+    pos = masked.find('(', begin, end)
+    while pos != -1:
+        regions.append((pos, matching(masked, pos, '(', ')'), 'meta.process-call.nextflow'))
+        pos = masked.find('(', pos + 1, end)
+    for m in regex_out.finditer(masked, begin, end):
+        regions.append((m.start(1), m.end(1), 'keyword.process.out.nextflow'))
+        if m.group(2):
+            regions.append((m.start(2), m.end(2), 'punctuation.accessor.dot.process-out.nextflow'))
+        if m.group(3):
+            regions.append((m.start(3), m.end(3), 'variable.channel.process-output-emit.nextflow'))
+
+
+def scope_nextflow(text: str) -> List[ScopeRegion]:
+    masked, regions = lex(text)
+    for m in regex_process.finditer(masked):
+        end = matching(masked, m.start(3))
+        regions.append((m.start(), end, 'meta.definition.process.nextflow'))
+        regions.append((m.start(1), m.end(1), 'storage.type.return-type.def.nextflow'))
+        regions.append((m.start(2), m.end(2), 'entity.name.class.process.nextflow'))
+        for d in regex_directive.finditer(masked, m.end(), end):
+            regions.append((d.start(1), d.end(1), 'support.type.nextflow'))
+        for d in regex_conda.finditer(masked, m.end(), end):
+            regions.append((d.start(), d.end(), 'meta.definition.conda-directive.nextflow'))
+            regions.append((d.start(1), d.end(1), 'support.type.conda.nextflow'))
+    for m in regex_workflow.finditer(masked):
+        end = matching(masked, m.start(3))
+        regions.append((m.start(), end, 'meta.definition.workflow.nextflow'))
+        regions.append((m.start(1), m.end(1), 'keyword.declaration.workflow.nextflow'))
+        if m.group(2):
+            regions.append((m.start(2), m.end(2), 'entity.name.workflow.nextflow'))
+        _workflow_body(masked, m.end(), end, regions)
+    for m in regex_method.finditer(masked):
+        end = masked.find('{', m.end())
+        line_end = masked.find('\n', m.end())
+        end = min(x for x in (end + 1 if end != -1 else len(masked), line_end if line_end != -1 else len(masked)))
+        regions.append((m.start(), end, 'meta.definition.method.nextflow'))
+        regions.append((m.start(2), m.end(2), 'entity.name.function.nextflow'))
+    for m in regex_include.finditer(masked):
+        regions.append((m.start(), m.end(), 'meta.import-module.nextflow'))
+        regions.append((m.start(1), m.end(1), 'keyword.control.include-module.nextflow'))
+    for m in regex_params.finditer(masked):
+        regions.append((m.start(1), m.end(1), 'support.variable.params.nextflow'))
+        regions.append((m.start(2), m.end(2), 'punctuation.params.dot'))
+        if m.group(3):
+            regions.append((m.start(3), m.end(3), 'entity.name.parameter.nextflow'))
+    # enclosing regions first
+    regions.sort(key=lambda x: (x[0], -x[1]))
+    return regions
@@ -0,0 +1,1056 @@
+"""Headless stand-in for the Sublime Text ``sublime`` API module
+
+Implements the parts of the API used by the plugins in this package, backed
+by plain Python objects, so that listeners and commands can be run and timed
+outside the editor. Buffers are scoped by an approximation of the Nextflow
+syntax (see ``_scopes``). Timeouts are queued and run by `run_timers` on a
+virtual clock rather than by an event loop.
+
+Functions and attributes that are not part of the Sublime Text API are marked
+as headless extensions.
+"""
+
+import bisect
+import heapq
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import _scopes
+
+# ------------------------------------------------------------------------------------------------
+# Constants
+
+HOVER_TEXT = 1
+HOVER_GUTTER = 2
+HOVER_MARGIN = 3
+
+ENCODED_POSITION = 1
+TRANSIENT = 4
+FORCE_GROUP = 8
+SEMI_TRANSIENT = 16
+ADD_TO_SELECTION = 32
+REPLACE_MRU = 64
+CLEAR_TO_RIGHT = 128
+
+LITERAL = 1
+IGNORECASE = 2
+WHOLEWORD = 4
+REVERSE = 8
+WRAP = 16
+
+MONOSPACE_FONT = 1
+KEEP_OPEN_ON_FOCUS_LOST = 2
+WANT_EVENT = 4
+
+COOPERATE_WITH_AUTO_COMPLETE = 2
+HIDE_ON_MOUSE_MOVE = 4
+HIDE_ON_MOUSE_MOVE_AWAY = 8
+KEEP_ON_SELECTION_MODIFIED = 16
+HIDE_ON_CHARACTER_EVENT = 32
+
+INHIBIT_WORD_COMPLETIONS = 8
+INHIBIT_EXPLICIT_COMPLETIONS = 16
+DYNAMIC_COMPLETIONS = 32
+INHIBIT_REORDER = 128
+
+COMPLETION_FORMAT_TEXT = 0
+COMPLETION_FORMAT_SNIPPET = 1
+COMPLETION_FORMAT_COMMAND = 2
+
+KIND_ID_AMBIGUOUS = 0
+KIND_ID_KEYWORD = 1
+KIND_ID_TYPE = 2
+KIND_ID_FUNCTION = 3
+KIND_ID_NAMESPACE = 4
+KIND_ID_NAVIGATION = 5
+KIND_ID_MARKUP = 6
+KIND_ID_VARIABLE = 7
+KIND_ID_SNIPPET = 8
+
+KIND_AMBIGUOUS = (KIND_ID_AMBIGUOUS, '', '')
+KIND_KEYWORD = (KIND_ID_KEYWORD, 'k', 'Keyword')
+KIND_TYPE = (KIND_ID_TYPE, 't', 'Type')
+KIND_FUNCTION = (KIND_ID_FUNCTION, 'f', 'Function')
+KIND_NAMESPACE = (KIND_ID_NAMESPACE, 'a', 'Namespace')
+KIND_NAVIGATION = (KIND_ID_NAVIGATION, 's', 'Navigation')
+KIND_MARKUP = (KIND_ID_MARKUP, 'm', 'Markup')
+KIND_VARIABLE = (KIND_ID_VARIABLE, 'v', 'Variable')
+KIND_SNIPPET = (KIND_ID_SNIPPET, 's', 'Snippet')
+
+WORD_SEPARATORS = "./\\()\"'-:,.;<>~!@#$%^&*|+=[]{}`~?"
+
+# ------------------------------------------------------------------------------------------------
+# Application
+
+
+def version() -> str:
+    return '4169'
+
+
+def channel() -> str:
+    return 'stable'
+
+
+def platform() -> str:
+    return 'linux'
+
+
+def arch() -> str:
+    return 'x64'
+
+
+_cache_dir: Optional[str] = None
+
+
+def cache_path() -> str:
+    global _cache_dir
+    if _cache_dir is None:
+        _cache_dir = tempfile.mkdtemp(prefix='sublime-headless-cache-')
+    return _cache_dir
+
+
+def set_cache_path(path: str) -> None:
+    """Headless extension: use `path` as the cache directory"""
+    global _cache_dir
+    _cache_dir = path
+
+
+def packages_path() -> str:
+    return os.path.join(cache_path(), 'Packages')
+
+
+def installed_packages_path() -> str:
+    return os.path.join(cache_path(), 'Installed Packages')
+
+
+# messages shown with `status_message`, `error_message` and `message_dialog` (headless extension)
+messages: List[str] = []
+
+
+def status_message(msg: str) -> None:
+    messages.append(msg)
+
+
+def error_message(msg: str) -> None:
+    messages.append(msg)
+
+
+def message_dialog(msg: str) -> None:
+    messages.append(msg)
+
+
+def ok_cancel_dialog(msg: str, ok_title: str = '', title: str = '') -> bool:
+    messages.append(msg)
+    return True
+
+
+def set_clipboard(text: str) -> None:
+    global _clipboard
+    _clipboard = text
+
+
+def get_clipboard(size_limit: int = 16777216) -> str:
+    return _clipboard
+
+
+_clipboard = ''
+
+# ------------------------------------------------------------------------------------------------
+# Timeouts
+
+
+_timers: List[Tuple[float, int, Callable[[], None]]] = []
+_timers_lock = threading.Lock()
+_timer_seq = itertools.count()
+# virtual time in ms (headless extension)
+clock_ms = 0.0
+
+
+def set_timeout(callback: Callable[[], None], delay: float = 0) -> None:
+    with _timers_lock:
+        heapq.heappush(_timers, (clock_ms + delay, next(_timer_seq), callback))
+
+
+def set_timeout_async(callback: Callable[[], None], delay: float = 0) -> None:
+    set_timeout(callback, delay)
+
+
+def run_timers(until_ms: float = 0) -> int:
+    """Headless extension: run queued timeouts in order, advancing the virtual clock by `until_ms`
+
+    Timeouts scheduled by the timeouts that are run are also run if they are
+    due by then. Returns how many timeouts were run.
+    """
+    global clock_ms
+    deadline = clock_ms + until_ms
+    n = 0
+    while True:
+        with _timers_lock:
+            if not _timers or _timers[0][0] > deadline:
+                break
+            due, _, callback = heapq.heappop(_timers)
+            clock_ms = max(clock_ms, due)
+        callback()
+        n += 1
+    clock_ms = deadline
+    return n
+
+
+def pending_timers() -> int:
+    """Headless extension: number of queued timeouts"""
+    with _timers_lock:
+        return len(_timers)
+
+
+# ------------------------------------------------------------------------------------------------
+# Settings
+
+
+class Settings:
+    def __init__(self, values: Optional[Dict[str, Any]] = None):
+        self.values: Dict[str, Any] = dict(values or {})
+        self.callbacks: Dict[str, Callable[[], None]] = {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def has(self, key: str) -> bool:
+        return key in self.values
+
+    def set(self, key: str, value: Any) -> None:
+        self.values[key] = value
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def erase(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.values)
+
+    def add_on_change(self, tag: str, callback: Callable[[], None]) -> None:
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag: str) -> None:
+        self.callbacks.pop(tag, None)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+
+_settings: Dict[str, Settings] = {}
+
+
+def load_settings(base_name: str) -> Settings:
+    try:
+        return _settings[base_name]
+    except KeyError:
+        settings = _settings[base_name] = Settings()
+        return settings
+
+
+def save_settings(base_name: str) -> None:
+    pass
+
+
+def decode_value(data: str) -> Any:
+    """Decode JSON with comments and trailing commas, like Sublime Text resource files"""
+    out = []
+    pos = 0
+    n = len(data)
+    while pos < n:
+        c = data[pos]
+        if c == '"':
+            end = pos + 1
+            while end < n and data[end] != '"':
+                end += 2 if data[end] == '\\' else 1
+            out.append(data[pos:end + 1])
+            pos = end + 1
+        elif data.startswith('//', pos):
+            end = data.find('\n', pos)
+            pos = n if end == -1 else end
+        elif data.startswith('/*', pos):
+            end = data.find('*/', pos + 2)
+            pos = n if end == -1 else end + 2
+        else:
+            out.append(c)
+            pos += 1
+    return json.loads(re.sub(r',(\s*[}\]])', r'\1', ''.join(out)))
+
+
+def encode_value(value: Any, pretty: bool = False) -> str:
+    return json.dumps(value, indent=4 if pretty else None)
+
+
+# ------------------------------------------------------------------------------------------------
+# Regions
+
+
+class Region:
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a: int, b: Optional[int] = None, xpos: int = -1):
+        self.a = a
+        self.b = a if b is None else b
+        self.xpos = xpos
+
+    def __repr__(self) -> str:
+        return f'Region({self.a}, {self.b})'
+
+    def __len__(self) -> int:
+        return self.size()
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __hash__(self) -> int:
+        return hash((self.a, self.b))
+
+    def __lt__(self, other: 'Region') -> bool:
+        return self.begin() < other.begin()
+
+    def __contains__(self, x: Union['Region', int]) -> bool:
+        return self.contains(x)
+
+    def to_tuple(self) -> Tuple[int, int]:
+        return self.a, self.b
+
+    def empty(self) -> bool:
+        return self.a == self.b
+
+    def begin(self) -> int:
+        return min(self.a, self.b)
+
+    def end(self) -> int:
+        return max(self.a, self.b)
+
+    def size(self) -> int:
+        return abs(self.b - self.a)
+
+    def contains(self, x: Union['Region', int]) -> bool:
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def cover(self, region: 'Region') -> 'Region':
+        return Region(min(self.begin(), region.begin()), max(self.end(), region.end()))
+
+    def intersection(self, region: 'Region') -> 'Region':
+        begin = max(self.begin(), region.begin())
+        end = min(self.end(), region.end())
+        return Region(begin, end) if begin < end else Region(0, 0)
+
+    def intersects(self, region: 'Region') -> bool:
+        return self.begin() < region.end() and region.begin() < self.end()
+
+
+class Selection:
+    def __init__(self):
+        self.regions: List[Region] = []
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def __getitem__(self, index: int) -> Region:
+        return self.regions[index]
+
+    def __iter__(self) -> Iterator[Region]:
+        return iter(list(self.regions))
+
+    def __repr__(self) -> str:
+        return f'Selection({self.regions!r})'
+
+    def is_valid(self) -> bool:
+        return True
+
+    def clear(self) -> None:
+        self.regions.clear()
+
+    def add(self, x: Union[Region, int]) -> None:
+        region = x if isinstance(x, Region) else Region(x)
+        self.regions.append(region)
+        self.regions.sort()
+
+    def add_all(self, regions) -> None:
+        for region in regions:
+            self.add(region)
+
+    def subtract(self, region: Region) -> None:
+        self.regions = [x for x in self.regions if not region.contains(x)]
+
+    def contains(self, region: Region) -> bool:
+        return any(x.contains(region) for x in self.regions)
+
+
+class Edit:
+    def __init__(self, edit_token: int = 0):
+        self.edit_token = edit_token
+
+
+class Syntax:
+    def __init__(self, path: str, name: str, hidden: bool, scope: str):
+        self.path = path
+        self.name = name
+        self.hidden = hidden
+        self.scope = scope
+
+    def __repr__(self) -> str:
+        return f'Syntax({self.path!r}, {self.name!r}, {self.hidden!r}, {self.scope!r})'
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Syntax) and self.path == other.path
+
+
+SYNTAX_NEXTFLOW = Syntax('Packages/Nextflow/Nextflow.sublime-syntax', 'Nextflow', False, 'source.nextflow')
+SYNTAX_PLAIN_TEXT = Syntax('Packages/Text/Plain text.tmLanguage', 'Plain Text', False, 'text.plain')
+SYNTAX_JSON = Syntax('Packages/JSON/JSON.sublime-syntax', 'JSON', False, 'source.json')
+SYNTAX_GROOVY = Syntax('Packages/Groovy/Groovy.sublime-syntax', 'Groovy', False, 'source.groovy')
+
+_syntax_by_suffix = {'.nf': SYNTAX_NEXTFLOW, '.nextflow': SYNTAX_NEXTFLOW, '.json': SYNTAX_JSON,
+                     '.config': SYNTAX_GROOVY, '.groovy': SYNTAX_GROOVY}
+
+# scopers by syntax scope (headless extension)
+scopers: Dict[str, Callable[[str], List[_scopes.ScopeRegion]]] = {'source.nextflow': _scopes.scope_nextflow}
+
+
+def find_syntax_for_file(path: str, first_line: str = '') -> Syntax:
+    return _syntax_by_suffix.get(os.path.splitext(path)[1], SYNTAX_PLAIN_TEXT)
+
+
+def find_syntax_by_name(name: str) -> List[Syntax]:
+    return [x for x in (SYNTAX_NEXTFLOW, SYNTAX_PLAIN_TEXT, SYNTAX_JSON, SYNTAX_GROOVY) if x.name == name]
+
+
+def score_selector(scope_name: str, selector: str) -> int:
+    return _scopes.score_selector(scope_name, selector)
+
+
+# ------------------------------------------------------------------------------------------------
+# Events and commands
+
+# hooks set by the headless editor to dispatch events and plugin commands (headless extension)
+event_hook: Optional[Callable[..., None]] = None
+command_hook: Optional[Callable[[Union['View', 'Window'], str, Dict[str, Any]], bool]] = None
+
+
+def _emit(event: str, *args) -> None:
+    if event_hook is not None:
+        event_hook(event, *args)
+
+
+_ids = itertools.count(1)
+
+
+# ------------------------------------------------------------------------------------------------
+# Views
+
+
+class View:
+    def __init__(self, text: str = '', file_name: Optional[str] = None, window: Optional['Window'] = None,
+                 syntax: Optional[Syntax] = None):
+        """Headless extension: create a view of `text` shown in `window`"""
+        self.view_id = next(_ids)
+        self._buffer_id = next(_ids)
+        self._text = text
+        self._file_name = file_name
+        self._name = ''
+        self._window = window
+        self._syntax = syntax or (find_syntax_for_file(file_name) if file_name else SYNTAX_PLAIN_TEXT)
+        self._change_count = 0
+        self._saved_change_count = 0
+        self._settings = Settings({'syntax': self._syntax.path})
+        self._status: Dict[str, str] = {}
+        self._scratch = False
+        self._valid = True
+        self._scope_cache: Optional[Tuple[int, List[int], List[Tuple[str, ...]]]] = None
+        self.selection = Selection()
+        self.selection.add(0)
+        # last popup shown as (content, location, on_navigate) (headless extension)
+        self.popup: Optional[Tuple[str, int, Optional[Callable[[str], None]]]] = None
+
+    def __repr__(self) -> str:
+        return f'View({self.view_id})'
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, View) and self.view_id == other.view_id
+
+    def __hash__(self) -> int:
+        return self.view_id
+
+    def __len__(self) -> int:
+        return self.size()
+
+    def id(self) -> int:
+        return self.view_id
+
+    def buffer_id(self) -> int:
+        return self._buffer_id
+
+    def is_valid(self) -> bool:
+        return self._valid
+
+    def is_primary(self) -> bool:
+        return True
+
+    def window(self) -> Optional['Window']:
+        return self._window
+
+    def file_name(self) -> Optional[str]:
+        return self._file_name
+
+    def name(self) -> str:
+        return self._name
+
+    def set_name(self, name: str) -> None:
+        self._name = name
+
+    def is_loading(self) -> bool:
+        return False
+
+    def is_dirty(self) -> bool:
+        return self._change_count != self._saved_change_count
+
+    def is_read_only(self) -> bool:
+        return False
+
+    def is_scratch(self) -> bool:
+        return self._scratch
+
+    def set_scratch(self, scratch: bool) -> None:
+        self._scratch = scratch
+
+    def settings(self) -> Settings:
+        return self._settings
+
+    def syntax(self) -> Optional[Syntax]:
+        return self._syntax
+
+    def assign_syntax(self, syntax: Union[Syntax, str]) -> None:
+        if isinstance(syntax, str):
+            found = [x for x in (SYNTAX_NEXTFLOW, SYNTAX_PLAIN_TEXT, SYNTAX_JSON, SYNTAX_GROOVY)
+                     if syntax in (x.path, x.scope)]
+            syntax = found[0] if found else SYNTAX_PLAIN_TEXT
+        self._syntax = syntax
+        self._settings.set('syntax', syntax.path)
+        self._scope_cache = None
+
+    def set_syntax_file(self, syntax_file: str) -> None:
+        self.assign_syntax(syntax_file)
+
+    def change_count(self) -> int:
+        return self._change_count
+
+    def size(self) -> int:
+        return len(self._text)
+
+    def substr(self, x: Union[Region, int]) -> str:
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def sel(self) -> Selection:
+        return self.selection
+
+    # -- editing
+
+    def _modified(self) -> None:
+        self._change_count += 1
+        self._scope_cache = None
+        _emit('on_modified', self)
+
+    def insert(self, edit: Edit, pt: int, text: str) -> int:
+        self._text = self._text[:pt] + text + self._text[pt:]
+        self.selection.regions = [Region(x.a + len(text) if x.a >= pt else x.a,
+                                         x.b + len(text) if x.b >= pt else x.b) for x in self.selection.regions]
+        self._modified()
+        return len(text)
+
+    def erase(self, edit: Edit, region: Region) -> None:
+        self.replace(edit, region, '')
+
+    def replace(self, edit: Edit, region: Region, text: str) -> None:
+        begin, end = region.begin(), region.end()
+        self._text = self._text[:begin] + text + self._text[end:]
+        delta = len(text) - (end - begin)
+        self.selection.regions = [Region(x.a + delta if x.a >= end else min(x.a, begin + len(text)),
+                                         x.b + delta if x.b >= end else min(x.b, begin + len(text)))
+                                  for x in self.selection.regions]
+        self._modified()
+
+    def set_text(self, text: str) -> None:
+        """Headless extension: replace the whole buffer"""
+        self.replace(Edit(), Region(0, self.size()), text)
+
+    def save(self) -> None:
+        """Headless extension: write the buffer to its file and emit `on_post_save`"""
+        if self._file_name is None:
+            raise ValueError('Cannot save a view without a file name')
+        Path(self._file_name).write_text(self._text)
+        self._saved_change_count = self._change_count
+        _emit('on_post_save', self)
+
+    def set_cursor(self, point: int) -> None:
+        """Headless extension: move the (single) cursor to `point` and emit `on_selection_modified`"""
+        self.selection.clear()
+        self.selection.add(point)
+        _emit('on_selection_modified', self)
+
+    def run_command(self, cmd: str, args: Optional[Dict[str, Any]] = None) -> None:
+        args = args or {}
+        if cmd in ('insert', 'insert_snippet'):
+            text = args.get('characters', args.get('contents', ''))
+            if cmd == 'insert_snippet':
+                # drop snippet fields like `${1:x}` and `$0`, keeping placeholder text
+                text = re.sub(r'\$\{\d+:([^}]*)\}', r'\1', text)
+                text = re.sub(r'\$\{?\d+\}?', '', text)
+            for region in reversed(list(self.selection)):
+                self.replace(Edit(), region, text)
+        elif cmd == 'append':
+            self.insert(Edit(), self.size(), args.get('characters', ''))
+        elif command_hook is not None:
+            command_hook(self, cmd, args)
+
+    # -- positions
+
+    def rowcol(self, tp: int) -> Tuple[int, int]:
+        row = self._text.count('\n', 0, tp)
+        line_start = self._text.rfind('\n', 0, tp) + 1
+        return row, tp - line_start
+
+    def rowcol_utf16(self, tp: int) -> Tuple[int, int]:
+        return self.rowcol(tp)
+
+    def text_point(self, row: int, col: int, *, clamp_column: bool = False) -> int:
+        pos = 0
+        for _ in range(row):
+            pos = self._text.find('\n', pos)
+            if pos == -1:
+                return self.size()
+            pos += 1
+        return min(pos + col, self.size())
+
+    def line(self, x: Union[Region, int]) -> Region:
+        begin, end = (x.begin(), x.end()) if isinstance(x, Region) else (x, x)
+        start = self._text.rfind('\n', 0, begin) + 1
+        stop = self._text.find('\n', end)
+        return Region(start, self.size() if stop == -1 else stop)
+
+    def full_line(self, x: Union[Region, int]) -> Region:
+        region = self.line(x)
+        return Region(region.a, min(region.b + 1, self.size()))
+
+    def lines(self, region: Region) -> List[Region]:
+        out = []
+        pos = self.line(region.begin()).a
+        while pos <= region.end():
+            line = self.line(pos)
+            out.append(line)
+            if line.b >= self.size():
+                break
+            pos = line.b + 1
+        return out
+
+    def split_by_newlines(self, region: Region) -> List[Region]:
+        return [x.intersection(region) if x.intersects(region) else x for x in self.lines(region)]
+
+    def _is_word_char(self, pos: int) -> bool:
+        if pos < 0 or pos >= self.size():
+            return False
+        c = self._text[pos]
+        return not c.isspace() and c not in WORD_SEPARATORS
+
+    def word(self, x: Union[Region, int]) -> Region:
+        begin, end = (x.begin(), x.end()) if isinstance(x, Region) else (x, x)
+        if not self._is_word_char(begin) and not self._is_word_char(begin - 1):
+            return Region(begin, end)
+        while self._is_word_char(begin - 1):
+            begin -= 1
+        while self._is_word_char(end):
+            end += 1
+        return Region(begin, end)
+
+    def find(self, pattern: str, start_pt: int, flags: int = 0) -> Region:
+        regex = re.compile(re.escape(pattern) if flags & LITERAL else pattern,
+                           re.MULTILINE | (re.IGNORECASE if flags & IGNORECASE else 0))
+        m = regex.search(self._text, start_pt)
+        if m is None:
+            return Region(-1, -1)
+        return Region(m.start(), m.end())
+
+    def find_all(self, pattern: str, flags: int = 0, fmt: Optional[str] = None,
+                 extractions: Optional[List[str]] = None) -> List[Region]:
+        regex = re.compile(re.escape(pattern) if flags & LITERAL else pattern,
+                           re.MULTILINE | (re.IGNORECASE if flags & IGNORECASE else 0))
+        out = []
+        for m in regex.finditer(self._text):
+            out.append(Region(m.start(), m.end()))
+            if fmt is not None and extractions is not None:
+                extractions.append(m.expand(fmt))
+        return out
+
+    # -- scopes
+
+    def _scopes(self) -> Tuple[List[int], List[Tuple[str, ...]]]:
+        """Get the start of each run of text with the same scopes and its scopes, outermost first"""
+        cache = self._scope_cache
+        if cache is not None and cache[0] == self._change_count:
+            return cache[1], cache[2]
+        base = self._syntax.scope
+        scoper = scopers.get(base)
+        regions = scoper(self._text) if scoper else []
+        boundaries = sorted({0, self.size()} | {x[0] for x in regions} | {x[1] for x in regions})
+        starts: List[int] = []
+        stacks: List[Tuple[str, ...]] = []
+        active: List[_scopes.ScopeRegion] = []
+        i = 0
+        for point in boundaries:
+            active = [x for x in active if x[1] > point]
+            while i < len(regions) and regions[i][0] <= point:
+                if regions[i][1] > point:
+                    active.append(regions[i])
+                i += 1
+            active.sort(key=lambda x: (x[0], -x[1]))
+            starts.append(point)
+            stacks.append((base,) + tuple(x[2] for x in active))
+        self._scope_cache = (self._change_count, starts, stacks)
+        return starts, stacks
+
+    def _scope_stack(self, pt: int) -> Tuple[str, ...]:
+        starts, stacks = self._scopes()
+        i = bisect.bisect_right(starts, pt) - 1
+        return stacks[max(i, 0)]
+
+    def scope_name(self, pt: int) -> str:
+        return ' '.join(self._scope_stack(pt)) + ' '
+
+    def match_selector(self, pt: int, selector: str) -> bool:
+        return self.score_selector(pt, selector) > 0
+
+    def score_selector(self, pt: int, selector: str) -> int:
+        return _scopes.compile_selector(selector)(list(self._scope_stack(pt)))
+
+    def find_by_selector(self, selector: str) -> List[Region]:
+        matcher = _scopes.compile_selector(selector)
+        starts, stacks = self._scopes()
+        out: List[Region] = []
+        for i, (start, stack) in enumerate(zip(starts, stacks)):
+            end = starts[i + 1] if i + 1 < len(starts) else self.size()
+            if start >= end or not matcher(list(stack)):
+                continue
+            if out and out[-1].b == start:
+                out[-1] = Region(out[-1].a, end)
+            else:
+                out.append(Region(start, end))
+        return out
+
+    def extract_scope(self, pt: int) -> Region:
+        starts, stacks = self._scopes()
+        i = max(bisect.bisect_right(starts, pt) - 1, 0)
+        stack = stacks[i]
+        begin = i
+        while begin > 0 and stacks[begin - 1][:len(stack)] == stack:
+            begin -= 1
+        end = i + 1
+        while end < len(stacks) and stacks[end][:len(stack)] == stack:
+            end += 1
+        return Region(starts[begin], starts[end] if end < len(starts) else self.size())
+
+    # -- UI
+
+    def show_popup(self, content: str, flags: int = 0, location: int = -1, max_width: int = 320,
+                   max_height: int = 240, on_navigate: Optional[Callable[[str], None]] = None,
+                   on_hide: Optional[Callable[[], None]] = None) -> None:
+        self.popup = (content, location, on_navigate)
+
+    def update_popup(self, content: str) -> None:
+        if self.popup is not None:
+            self.popup = (content,) + self.popup[1:]
+
+    def is_popup_visible(self) -> bool:
+        return self.popup is not None
+
+    def hide_popup(self) -> None:
+        self.popup = None
+
+    def is_auto_complete_visible(self) -> bool:
+        return False
+
+    def set_status(self, key: str, value: str) -> None:
+        self._status[key] = value
+
+    def get_status(self, key: str) -> str:
+        return self._status.get(key, '')
+
+    def erase_status(self, key: str) -> None:
+        self._status.pop(key, None)
+
+    def show(self, x, show_surrounds: bool = True, keep_to_left: bool = False, animate: bool = True) -> None:
+        pass
+
+    def show_at_center(self, x, animate: bool = True) -> None:
+        pass
+
+    def visible_region(self) -> Region:
+        return Region(0, self.size())
+
+    def add_regions(self, key: str, regions: List[Region], *args, **kwargs) -> None:
+        pass
+
+    def erase_regions(self, key: str) -> None:
+        pass
+
+    def close(self) -> bool:
+        if self._window is not None:
+            self._window.close_view(self)
+        return True
+
+
+# ------------------------------------------------------------------------------------------------
+# Windows
+
+
+class Window:
+    def __init__(self, folders: Optional[List[str]] = None):
+        """Headless extension: create a window with project `folders`"""
+        self.window_id = next(_ids)
+        self._folders = [str(x) for x in folders or []]
+        self._views: List[View] = []
+        self._active_view: Optional[View] = None
+        self._panels: Dict[str, View] = {}
+        self._active_panel: Optional[str] = None
+        self._settings = Settings()
+        self._valid = True
+        # status messages shown in the window (headless extension)
+        self.status_messages: List[str] = []
+        # last quick panel shown as (items, on_select, on_highlight) (headless extension)
+        self.quick_panel: Optional[Tuple[list, Callable[[int], None], Optional[Callable[[int], None]]]] = None
+        # last input panel shown as (caption, initial text, on_done) (headless extension)
+        self.input_panel: Optional[Tuple[str, str, Optional[Callable[[str], None]]]] = None
+        _windows.append(self)
+
+    def __repr__(self) -> str:
+        return f'Window({self.window_id})'
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Window) and self.window_id == other.window_id
+
+    def __hash__(self) -> int:
+        return self.window_id
+
+    def id(self) -> int:
+        return self.window_id
+
+    def is_valid(self) -> bool:
+        return self._valid
+
+    def folders(self) -> List[str]:
+        return list(self._folders)
+
+    def set_folders(self, folders: List[str]) -> None:
+        """Headless extension: change the project folders"""
+        self._folders = [str(x) for x in folders]
+
+    def project_file_name(self) -> Optional[str]:
+        return None
+
+    def project_data(self) -> Optional[dict]:
+        return {'folders': [{'path': x} for x in self._folders]}
+
+    def extract_variables(self) -> Dict[str, str]:
+        out = {'platform': 'Linux', 'packages': packages_path()}
+        if self._folders:
+            out['folder'] = self._folders[0]
+        view = self.active_view()
+        if view is not None and view.file_name():
+            out['file'] = view.file_name()
+            out['file_path'] = os.path.dirname(view.file_name())
+        return out
+
+    def settings(self) -> Settings:
+        return self._settings
+
+    def views(self) -> List[View]:
+        return list(self._views)
+
+    def active_view(self) -> Optional[View]:
+        return self._active_view
+
+    def focus_view(self, view: View) -> None:
+        self._active_view = view
+        _emit('on_activated', view)
+
+    def new_file(self, flags: int = 0, syntax: str = '') -> View:
+        view = View(window=self)
+        if syntax:
+            view.assign_syntax(syntax)
+        self._views.append(view)
+        _emit('on_new', view)
+        self.focus_view(view)
+        return view
+
+    def open_file(self, fname: str, flags: int = 0, group: int = -1) -> View:
+        row = col = None
+        if flags & ENCODED_POSITION:
+            m = re.match(r'^(.*?)(?::(\d+))?(?::(\d+))?$', fname)
+            fname, row, col = m.group(1), m.group(2), m.group(3)
+        view = self.find_open_file(fname)
+        if view is None:
+            try:
+                text = Path(fname).read_text()
+            except (OSError, UnicodeDecodeError):
+                text = ''
+            view = View(text, os.path.abspath(fname), self)
+            self._views.append(view)
+            _emit('on_load', view)
+        if row is not None:
+            view.selection.clear()
+            view.selection.add(view.text_point(int(row) - 1, int(col or 1) - 1))
+        self.focus_view(view)
+        return view
+
+    def find_open_file(self, fname: str) -> Optional[View]:
+        fname = os.path.abspath(fname)
+        for view in self._views:
+            if view.file_name() and os.path.abspath(view.file_name()) == fname:
+                return view
+        return None
+
+    def close_view(self, view: View) -> None:
+        """Headless extension: close a view, emitting `on_pre_close` and `on_close`"""
+        _emit('on_pre_close', view)
+        self._views = [x for x in self._views if x != view]
+        if self._active_view == view:
+            self._active_view = self._views[-1] if self._views else None
+        view._valid = False
+        _emit('on_close', view)
+
+    def status_message(self, msg: str) -> None:
+        self.status_messages.append(msg)
+
+    def show_quick_panel(self, items: list, on_select: Callable[[int], None], flags: int = 0,
+                         selected_index: int = -1, on_highlight: Optional[Callable[[int], None]] = None,
+                         placeholder: Optional[str] = None) -> None:
+        self.quick_panel = (items, on_select, on_highlight)
+
+    def select_quick_panel_item(self, index: int) -> None:
+        """Headless extension: pick an item (or -1 to cancel) in the last quick panel shown"""
+        if self.quick_panel is None:
+            raise ValueError('No quick panel is shown')
+        on_select = self.quick_panel[1]
+        self.quick_panel = None
+        on_select(index)
+
+    def show_input_panel(self, caption: str, initial_text: str, on_done: Optional[Callable[[str], None]],
+                         on_change: Optional[Callable[[str], None]], on_cancel: Optional[Callable[[], None]]) -> View:
+        self.input_panel = (caption, initial_text, on_done)
+        return View(initial_text, window=self)
+
+    def create_output_panel(self, name: str, unlisted: bool = False) -> View:
+        view = self._panels.get(name)
+        if view is None:
+            view = self._panels[name] = View(window=self)
+        return view
+
+    def find_output_panel(self, name: str) -> Optional[View]:
+        return self._panels.get(name)
+
+    def destroy_output_panel(self, name: str) -> None:
+        self._panels.pop(name, None)
+
+    def active_panel(self) -> Optional[str]:
+        return self._active_panel
+
+    def run_command(self, cmd: str, args: Optional[Dict[str, Any]] = None) -> None:
+        args = args or {}
+        if cmd == 'show_panel':
+            self._active_panel = args.get('panel')
+        elif cmd == 'hide_panel':
+            self._active_panel = None
+        elif command_hook is not None:
+            command_hook(self, cmd, args)
+
+
+_windows: List[Window] = []
+
+
+def windows() -> List[Window]:
+    return [x for x in _windows if x.is_valid()]
+
+
+def active_window() -> Optional[Window]:
+    open_windows = windows()
+    return open_windows[-1] if open_windows else None
+
+
+def close_window(window: Window) -> None:
+    """Headless extension: close a window and all its views"""
+    for view in window.views():
+        window.close_view(view)
+    window._valid = False
+
+
+def reset() -> None:
+    """Headless extension: close all windows and drop queued timeouts and messages"""
+    for window in windows():
+        close_window(window)
+    _windows.clear()
+    with _timers_lock:
+        _timers.clear()
+    messages.clear()
+
+
+# ------------------------------------------------------------------------------------------------
+# Completions
+
+
+class CompletionItem:
+    def __init__(self, trigger: str, annotation: str = '', completion: str = '',
+                 completion_format: int = COMPLETION_FORMAT_TEXT, kind=KIND_AMBIGUOUS, details: str = ''):
+        self.trigger = trigger
+        self.annotation = annotation
+        self.completion = completion
+        self.completion_format = completion_format
+        self.kind = kind
+        self.details = details
+        self.flags = 0
+
+    def __repr__(self) -> str:
+        return f'CompletionItem({self.trigger!r})'
+
+    @classmethod
+    def snippet_completion(cls, trigger: str, snippet: str, annotation: str = '', kind=KIND_SNIPPET,
+                           details: str = '') -> 'CompletionItem':
+        return cls(trigger, annotation, snippet, COMPLETION_FORMAT_SNIPPET, kind, details)
+
+    @classmethod
+    def command_completion(cls, trigger: str, command: str, args: Optional[dict] = None, annotation: str = '',
+                           kind=KIND_AMBIGUOUS, details: str = '') -> 'CompletionItem':
+        item = cls(trigger, annotation, command, COMPLETION_FORMAT_COMMAND, kind, details)
+        item.args = args or {}
+        return item
+
+
+class CompletionList:
+    def __init__(self, completions: Optional[list] = None, flags: int = 0):
+        self.completions = completions
+        self.flags = flags
+
+    def __repr__(self) -> str:
+        n = 'pending' if self.completions is None else len(self.completions)
+        return f'CompletionList({n})'
+
+    def set_completions(self, completions: list, flags: int = 0) -> None:
+        self.completions = completions
+        self.flags = flags
@@ -0,0 +1,137 @@
+"""Headless stand-in for the Sublime Text ``sublime_plugin`` API module
+
+Plugin classes register themselves on definition so that the headless editor
+can instantiate listeners and look up commands by name.
+"""
+
+from typing import Any, Dict, List, Optional, Type
+
+import sublime
+
+# plugin classes in order of definition (headless extension)
+listener_classes: List[Type['EventListener']] = []
+view_listener_classes: List[Type['ViewEventListener']] = []
+command_classes: List[Type['Command']] = []
+
+
+def command_name(cls: type) -> str:
+    """Get the name a command class is run by, e.g. `NextflowIncludeProcessCommand` -> `nextflow_include_process`"""
+    clsname = cls.__name__
+    name = clsname[0].lower()
+    last_upper = False
+    for c in clsname[1:]:
+        if c.isupper() and not last_upper:
+            name += '_' + c.lower()
+        else:
+            name += c
+        last_upper = c.isupper()
+    if name.endswith('_command'):
+        name = name[:-8]
+    return name
+
+
+class Command:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__name__.endswith('Command') and cls.__module__ != __name__:
+            command_classes.append(cls)
+
+    def name(self) -> str:
+        return command_name(type(self))
+
+    def is_enabled(self, *args, **kwargs) -> bool:
+        return True
+
+    def is_visible(self, *args, **kwargs) -> bool:
+        return True
+
+    def is_checked(self, *args, **kwargs) -> bool:
+        return False
+
+    def description(self, *args, **kwargs) -> Optional[str]:
+        return None
+
+    def input(self, args: Dict[str, Any]):
+        return None
+
+
+class ApplicationCommand(Command):
+    def run(self, **kwargs) -> None:
+        pass
+
+
+class WindowCommand(Command):
+    def __init__(self, window: sublime.Window):
+        self.window = window
+
+    def run(self, **kwargs) -> None:
+        pass
+
+
+class TextCommand(Command):
+    def __init__(self, view: sublime.View):
+        self.view = view
+
+    def run(self, edit: sublime.Edit, **kwargs) -> None:
+        pass
+
+
+class EventListener:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__module__ != __name__:
+            listener_classes.append(cls)
+
+
+class ViewEventListener:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__module__ != __name__:
+            view_listener_classes.append(cls)
+
+    @classmethod
+    def is_applicable(cls, settings: sublime.Settings) -> bool:
+        return True
+
+    @classmethod
+    def applies_to_primary_view_only(cls) -> bool:
+        return True
+
+    def __init__(self, view: sublime.View):
+        self.view = view
+
+
+class CommandInputHandler:
+    def name(self) -> str:
+        name = command_name(type(self))
+        return name[:-len('_input_handler')] if name.endswith('_input_handler') else name
+
+    def placeholder(self) -> str:
+        return ''
+
+    def initial_text(self) -> str:
+        return ''
+
+    def preview(self, arg):
+        return ''
+
+    def validate(self, arg) -> bool:
+        return True
+
+    def cancel(self) -> None:
+        pass
+
+    def confirm(self, arg) -> None:
+        pass
+
+    def next_input(self, args):
+        return None
+
+
+class TextInputHandler(CommandInputHandler):
+    pass
+
+
+class ListInputHandler(CommandInputHandler):
+    def list_items(self) -> list:
+        return []
@@ -0,0 +1,325 @@
+"""Benchmark completions, popups, quick panels and indexing on a synthetic pipeline
+
+Each benchmark is run `--repeat` times against the headless editor, timing
+wall-clock latency, and then once more with ``tracemalloc`` tracing to get the
+peak memory allocated while it runs. Results are printed and saved as JSON so
+that runs can be compared:
+
+    python -m bench.run --out before.json
+    python -m bench.run --out after.json --compare before.json
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import math
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .editor import PACKAGE_DIR, PACKAGE_NAME, Editor
+from .generate import PipelineSpec, generate_pipeline, module_name, module_path, subworkflow_name
+
+RESULTS_FORMAT = 1
+# p50 time to import the plugins over which `bench.run` exits with an error
+LOAD_BUDGET_MS = 30
+
+# run in a fresh interpreter per run so that modules imported by earlier runs are not reused
+LOAD_SCRIPT = '''
+import json, sys, time, tracemalloc
+from bench.editor import Editor, install_headless_api
+install_headless_api()
+import sublime_plugin
+trace = sys.argv[1] == 'trace'
+before = set(sys.modules)
+if trace:
+    tracemalloc.start()
+start = time.perf_counter()
+Editor.load()
+elapsed = time.perf_counter() - start
+peak = tracemalloc.get_traced_memory()[1] if trace else 0
+imported = [x for x in set(sys.modules) - before if not x.startswith('Nextflow')]
+print(json.dumps(dict(seconds=elapsed, peak=peak, imported=len(imported))))
+'''
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    # check the result of a run, e.g. that a popup was shown
+    check: Callable[[Any], bool]
+    # reset state between runs, e.g. hide popups; not timed
+    setup: Optional[Callable[[], None]] = None
+
+
+def summarize(times_s: List[float], peak_bytes: int) -> Dict[str, float]:
+    # same percentiles as the performance stats panel; the package is importable once `Editor.load()` has run
+    percentile = importlib.import_module(f'{PACKAGE_NAME}.nflib.perf').percentile
+    times_ms = sorted(x * 1000 for x in times_s)
+    return {
+        'n': len(times_ms),
+        'p50_ms': percentile(times_ms, 50),
+        'p95_ms': percentile(times_ms, 95),
+        'mean_ms': sum(times_ms) / len(times_ms),
+        'min_ms': times_ms[0],
+        'max_ms': times_ms[-1],
+        'peak_kib': peak_bytes / 1024,
+    }
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        if benchmark.setup is not None:
+            benchmark.setup()
+        start = time.perf_counter()
+        result = benchmark.run()
+        times.append(time.perf_counter() - start)
+        if not benchmark.check(result):
+            raise AssertionError(f'Benchmark {benchmark.name} returned unexpected result: {result!r:.200}')
+    if benchmark.setup is not None:
+        benchmark.setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(times, peak)
+
+
+class Suite:
+    """Benchmarks of the editor features over one synthetic pipeline"""
+
+    def __init__(self, editor: Editor, root_dir: Path, spec: PipelineSpec, edit_between: bool = False):
+        self.editor = editor
+        self.root_dir = root_dir
+        self.spec = spec
+        self.edit_between = edit_between
+        self.window = editor.open_window([root_dir])
+        self.main_view = editor.open_file(self.window, root_dir / 'main.nf')
+        self.pipeline_view = editor.open_file(self.window, root_dir / 'workflows' / 'pipeline.nf')
+        self.module_view = editor.open_file(self.window, root_dir / module_path(0))
+
+    def point_after(self, view: Any, text: str, start: str = '') -> int:
+        """Get the point right after the first `text` following `start` in a view"""
+        buffer = view.substr(self.editor.sublime.Region(0, view.size()))
+        offset = buffer.index(start) if start else 0
+        return buffer.index(text, offset) + len(text)
+
+    def reset(self, view: Any) -> Callable[[], None]:
+        def setup():
+            view.hide_popup()
+            self.window.quick_panel = None
+            if self.edit_between:
+                # drop per-view caches like parsed includes by editing the buffer
+                end = view.size()
+                self.editor.type_text(view, end, ' ')
+                view.erase(self.editor.sublime.Edit(), self.editor.sublime.Region(end, end + 1))
+                self.editor.run_timers()
+                # Sublime Text scopes buffers as they change, so the headless scoper should not be timed
+                view.scope_name(0)
+        return setup
+
+    def completions(self, view: Any, point: int) -> Callable[[], list]:
+        return lambda: self.editor.query_completions(view, point)
+
+    def cursor_popup(self, view: Any, point: int) -> Callable[[], Optional[str]]:
+        return lambda: self.editor.move_cursor(view, point)
+
+    def hover_popup(self, view: Any, point: int) -> Callable[[], Optional[str]]:
+        return lambda: self.editor.hover(view, point)
+
+    def quick_panel(self, view: Any, command: str, args: Optional[dict] = None) -> Callable[[], Optional[list]]:
+        def run():
+            view.selection.clear()
+            view.selection.add(0)
+            view.run_command(command, args)
+            return self.window.quick_panel[0] if self.window.quick_panel else None
+        return run
+
+    def benchmarks(self) -> List[Benchmark]:
+        main, pipeline, module = self.main_view, self.pipeline_view, self.module_view
+        first = module_name(0)
+        call = self.point_after(pipeline, f'    {first}(', 'workflow PIPELINE')
+        out = self.point_after(pipeline, f'{first}.out.', 'workflow PIPELINE')
+        subworkflow = self.point_after(pipeline, f'    {subworkflow_name(0)}', 'workflow PIPELINE') - 1
+        param = self.point_after(main, 'params.')
+        label = self.point_after(module, 'label ')
+        non_empty = bool
+        return [
+            Benchmark('completions.params', self.completions(main, param), non_empty, self.reset(main)),
+            Benchmark('completions.process_label', self.completions(module, label), non_empty, self.reset(module)),
+            Benchmark('completions.process_out', self.completions(pipeline, out), non_empty, self.reset(pipeline)),
+            Benchmark('popup.process_call', self.cursor_popup(pipeline, call - 2), non_empty, self.reset(pipeline)),
+            Benchmark('popup.subworkflow_call', self.cursor_popup(pipeline, subworkflow), non_empty,
+                      self.reset(pipeline)),
+            Benchmark('popup.process_input', self.cursor_popup(pipeline, call), non_empty, self.reset(pipeline)),
+            Benchmark('popup.output_channel', self.cursor_popup(pipeline, out + 2), non_empty, self.reset(pipeline)),
+            Benchmark('popup.param', self.cursor_popup(main, param + 2), non_empty, self.reset(main)),
+            Benchmark('hover.process_resources', self.hover_popup(pipeline, call - 2), non_empty,
+                      self.reset(pipeline)),
+            Benchmark('quick_panel.include_process', self.quick_panel(main, 'nextflow_include_process'), non_empty,
+                      self.reset(main)),
+            Benchmark('quick_panel.include_nf_core',
+                      self.quick_panel(main, 'nextflow_include_process', {'path_prefix': 'modules/nf-core/'}),
+                      non_empty, self.reset(main)),
+            Benchmark('quick_panel.include_functions', self.quick_panel(main, 'nextflow_include_functions'),
+                      non_empty, self.reset(main)),
+        ]
+
+
+def load_benchmark(repeat: int) -> Dict[str, float]:
+    """Time importing the plugins and running `plugin_loaded` as Sublime Text does on start, without any windows"""
+    runs = []
+    for mode in ['time'] * repeat + ['trace']:
+        out = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, mode], cwd=PACKAGE_DIR, capture_output=True,
+                             text=True, check=True)
+        runs.append(json.loads(out.stdout))
+    stats = summarize([x['seconds'] for x in runs[:-1]], runs[-1]['peak'])
+    # modules outside the package imported by the plugins, e.g. `urllib.request`
+    stats['imported_modules'] = runs[-1]['imported']
+    return stats
+
+
+def index_benchmarks(editor: Editor, root_dir: Path, work_dir: Path, repeat: int,
+                     name_filter: str = '') -> Dict[str, Dict[str, float]]:
+    """Time building the project index with an empty store and with a store from a previous build"""
+    index = editor.module('nflib.index')
+    store = editor.module('nflib.store')
+    results = {}
+    for name, fresh_store in (('index.cold', True), ('index.warm', False)):
+        if name_filter not in name:
+            continue
+        times = []
+        peak = 0
+        for i in range(repeat + 1):
+            db_path = work_dir / f'index-{i}.db' if fresh_store else None
+            project_index = index.ProjectIndex(root_dir.resolve(), store.IndexStore(db_path) if db_path
+                                               else store.default_store())
+            gc.collect()
+            traced = i == repeat
+            if traced:
+                tracemalloc.start()
+            start = time.perf_counter()
+            project_index.build()
+            elapsed = time.perf_counter() - start
+            if traced:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            else:
+                times.append(elapsed)
+        results[name] = summarize(times, peak)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PACKAGE_DIR, capture_output=True,
+                             text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None):
+    header = f'{"benchmark":<32} {"p50 ms":>9} {"p95 ms":>9} {"peak KiB":>10}'
+    if baseline:
+        header += f' {"p50 vs base":>12} {"p95 vs base":>12}'
+    print(header)
+    for name, stats in results.items():
+        line = f'{name:<32} {stats["p50_ms"]:>9.3f} {stats["p95_ms"]:>9.3f} {stats["peak_kib"]:>10.1f}'
+        base = (baseline or {}).get(name)
+        if base:
+            for key in ('p50_ms', 'p95_ms'):
+                ratio = stats[key] / base[key] if base[key] else math.inf
+                line += f' {ratio:>11.2f}x'
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    defaults = PipelineSpec()
+    for field in PipelineSpec._fields:
+        parser.add_argument(f'--{field.replace("_", "-")}', type=int, default=getattr(defaults, field),
+                            help=f'pipeline size (default: {getattr(defaults, field)})')
+    parser.add_argument('--repeat', type=int, default=50, help='runs per benchmark (default: 50)')
+    parser.add_argument('--index-repeat', type=int, default=5, help='index builds per benchmark (default: 5)')
+    parser.add_argument('--load-repeat', type=int, default=10, help='plugin loads to time (default: 10)')
+    parser.add_argument('--load-budget-ms', type=float, default=LOAD_BUDGET_MS,
+                        help=f'exit with an error if the p50 plugin load time exceeds this (default: {LOAD_BUDGET_MS})')
+    parser.add_argument('--edit-between', action='store_true',
+                        help='edit the buffer between runs so that per-view caches are not reused')
+    parser.add_argument('--pipeline-dir', type=Path, help='generate the pipeline here instead of a temp dir')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--out', type=Path, help='save results as JSON')
+    parser.add_argument('--compare', type=Path, help='JSON results of a previous run to compare against')
+    args = parser.parse_args(argv)
+
+    spec = PipelineSpec(**{field: getattr(args, field) for field in PipelineSpec._fields})
+    work_dir = Path(tempfile.mkdtemp(prefix='bench-nextflow-'))
+    root_dir = (args.pipeline_dir or work_dir / 'pipeline').resolve()
+    generate_pipeline(root_dir, spec)
+
+    editor = Editor.load()
+    editor.sublime.set_cache_path(str(work_dir / 'cache'))
+    results: Dict[str, Dict[str, float]] = {}
+    files = editor.module('nflib.files')
+    name = 'startup.load_plugins'
+    if args.filter in name:
+        results[name] = load_benchmark(args.load_repeat)
+    try:
+        start = time.perf_counter()
+        suite = Suite(editor, root_dir, spec, args.edit_between)
+        editor.wait_idle()
+        name = 'startup.open_and_index'
+        if args.filter in name:
+            results[name] = summarize([time.perf_counter() - start], 0)
+        for benchmark in suite.benchmarks():
+            if args.filter in benchmark.name:
+                results[benchmark.name] = measure(benchmark, args.repeat)
+        results.update(index_benchmarks(editor, root_dir, work_dir, args.index_repeat, args.filter))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())['results']
+    print_results(results, baseline)
+    # hits and evictions of the parsed file caches over all benchmarks, to size the cache budgets
+    file_caches = files.cache_stats()
+    print(files.format_cache_stats(file_caches))
+    print(f'max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB')
+    if args.out:
+        data = {
+            'format': RESULTS_FORMAT,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'spec': spec._asdict(),
+            'repeat': args.repeat,
+            'edit_between': args.edit_between,
+            'results': results,
+            'file_caches': [x._asdict() for x in file_caches],
+        }
+        args.out.write_text(json.dumps(data, indent=2))
+        print(f'Saved results to {args.out}')
+    load = results.get('startup.load_plugins')
+    if load is not None:
+        print(f'plugin load: {load["imported_modules"]} modules imported outside the package')
+        if load['p50_ms'] > args.load_budget_ms:
+            sys.exit(f'Plugin load p50 of {load["p50_ms"]:.1f} ms exceeds the budget of {args.load_budget_ms} ms')
+
+
+if __name__ == '__main__':
+    main()
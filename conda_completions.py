@@ -1,90 +1,281 @@
 #!/usr/bin/env python
 
-from typing import List, Tuple, Optional
-import subprocess as sp
+from typing import Any, Callable, Dict, List, Tuple, Optional
 
-import pickle
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
 from pathlib import Path
 
 import sublime
 import sublime_plugin
 import threading
 
-pkgs_fetch_lock = threading.Lock()
+from .nflib.cache import CacheFile, cache_dir, open_cache, refresh_if_stale, write_cache
+from .nflib.fetch import FetchJob, fetcher
+from .nflib.files import FileCache
+from .nflib.jsonstream import iter_object_items
+from .nflib.perf import span, timed
+from .nflib.settings import get_setting
+from .nflib.versions import build_number, version_key
+from .nflib.views import is_nextflow
 
+FETCH_KEY = 'conda_packages'
+DEFAULT_MAX_COMPLETIONS = 500
+# most `conda search` processes run at once for the configured channels and subdirs
+MAX_SEARCH_WORKERS = 4
+CACHE_FILENAME = 'conda_packages.cache'
+# caches written by older versions
+OLD_CACHE_FILENAMES = ('conda_search.pickle', 'conda_packages.pickle')
+COLUMNS = ('names', 'channels', 'name_idx', 'channel_idx', 'versions', 'builds', 'name_rows')
 
-def run_conda_search() -> List[Tuple[str, str, str, str]]:
-    p = sp.Popen(['conda', 'search', ], stdout=sp.PIPE, stderr=sp.PIPE)
-    stdout, stderr = p.communicate()
-    stdout =  stdout.decode()
-    lines = stdout.split('\n')
-    for i, line in enumerate(lines):
-        if line[0] == '#':
-            break
-    
-    return [tuple(line.strip().split()) for line in lines[i+1:] if line.split()]
+# prefixes of channel URLs reported by `conda search --json` to strip to get the channel name
+CHANNEL_URL_PREFIXES = ('https://conda.anaconda.org/', 'https://repo.anaconda.com/')
 
 
-def cache_pkgs_list(pkgs: List[Tuple[str, str, str, str]]) -> None:
-    cache_dir = Path(sublime.cache_path()) / 'sublime-nextflow'
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    cache_path = cache_dir / 'conda_search.pickle'
-    with open(cache_path, 'wb') as fh:
-        pickle.dump(pkgs, fh)
+def channel_name(url: str, subdir: str) -> str:
+    """Get the channel name (e.g. `bioconda` or `pkgs/main`) from a channel URL like
+    https://conda.anaconda.org/bioconda/noarch"""
+    if subdir and url.endswith('/' + subdir):
+        url = url[:-len(subdir) - 1]
+    for prefix in CHANNEL_URL_PREFIXES:
+        if url.startswith(prefix):
+            return url[len(prefix):]
+    return url
 
 
-def fetch_pkgs(window: sublime.Window) -> None:
-    pkgs = run_conda_search()
-    cache_pkgs_list(pkgs)
-    window.status_message(f'Retrieved and cached info for {len(pkgs)} Conda packages')
+def _ranks(values: List[str], key: Callable[[str], Any]) -> Dict[str, int]:
+    """Rank the distinct values by a sort key, with equal keys ranked the same"""
+    ranks = {}
+    rank = 0
+    previous = None
+    for value, value_key in sorted(((x, key(x)) for x in set(values)), key=itemgetter(1)):
+        if value_key != previous:
+            rank += 1
+            previous = value_key
+        ranks[value] = rank
+    return ranks
 
 
-def get_cached_pkgs_list() -> Optional[List[Tuple[str, str, str, str]]]:
-    cache_dir = Path(sublime.cache_path()) / 'sublime-nextflow'
-    cache_path = cache_dir / 'conda_search.pickle'
-    if not cache_path.exists():
+class CondaPackagesBuilder:
+    """Collects unique package builds into compact columns with interned names, versions, builds and channels"""
+
+    def __init__(self):
+        self.names: Dict[str, int] = {}
+        self.channels: Dict[str, int] = {}
+        self.strings: Dict[str, str] = {}
+        self.seen = set()
+        self.name_idx = array('I')
+        self.channel_idx = array('H')
+        self.versions: List[str] = []
+        self.builds: List[str] = []
+        self.lock = threading.Lock()
+
+    def intern(self, s: str) -> str:
+        return self.strings.setdefault(s, s)
+
+    def add(self, name: str, version: str, build: str, channel: str) -> None:
+        with self.lock:
+            key = (name, version, build, channel)
+            if key in self.seen:
+                return
+            self.seen.add(key)
+            self.name_idx.append(self.names.setdefault(name, len(self.names)))
+            self.channel_idx.append(self.channels.setdefault(channel, len(self.channels)))
+            self.versions.append(self.intern(version))
+            self.builds.append(self.intern(build))
+
+    def columns(self) -> dict:
+        """Get the columns with rows ordered by package name and then newest version first
+
+        Names are sorted and `name_rows` holds the first row of each name
+        followed by the number of rows, so that the index does not need to sort
+        the rows when loaded.
+        """
+        names = sorted(self.names)
+        new_idx = array('I', bytes(4 * len(names)))
+        for i, name in enumerate(names):
+            new_idx[self.names[name]] = i
+        name_idx = self.name_idx
+        versions = self.versions
+        builds = self.builds
+        # versions and builds are interned, so each distinct one only needs its sort key computed once
+        version_rank = _ranks(versions, version_key)
+        build_rank = _ranks(builds, build_number)
+        # a single int key of name, then version and build descending, sorts much faster than tuples
+        n_builds = len(build_rank) + 1
+        n_keys = (len(version_rank) + 1) * n_builds
+        rows = sorted(range(len(versions)),
+                      key=lambda row: (new_idx[name_idx[row]] * n_keys - version_rank[versions[row]] * n_builds
+                                       - build_rank[builds[row]]))
+        sorted_name_idx = array('I', (new_idx[name_idx[row]] for row in rows))
+        name_rows = array('I', bytes(4 * (len(names) + 1)))
+        for i in sorted_name_idx:
+            name_rows[i + 1] += 1
+        for i in range(len(names)):
+            name_rows[i + 1] += name_rows[i]
+        return dict(
+            names=names,
+            channels=list(self.channels),
+            name_idx=sorted_name_idx,
+            channel_idx=array('H', (self.channel_idx[row] for row in rows)),
+            versions=[versions[row] for row in rows],
+            builds=[builds[row] for row in rows],
+            name_rows=name_rows,
+        )
+
+
+def run_conda_search(job: FetchJob,
+                     builder: CondaPackagesBuilder,
+                     channel: Optional[str] = None,
+                     subdir: Optional[str] = None) -> None:
+    """Stream all package builds from `conda search --json` into `builder`
+
+    If `channel` is not specified, the channels configured for Conda are searched.
+    """
+    import subprocess as sp
+    job.check_cancelled()
+    cmd = ['conda', 'search', '--json']
+    if channel:
+        cmd += ['--override-channels', '--channel', channel]
+    if subdir:
+        cmd += ['--subdir', subdir]
+    p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    job.on_cancel(p.kill)
+    try:
+        for name, pkgs in iter_object_items(p.stdout):
+            job.check_cancelled()
+            if not isinstance(pkgs, list):
+                # error info like {"error": "...", "exception_name": "..."}
+                if name == 'error':
+                    print(f'Error running "{" ".join(cmd)}": {pkgs}')
+                continue
+            for pkg in pkgs:
+                builder.add(pkg['name'], pkg['version'], pkg['build'], channel_name(pkg['channel'], pkg.get('subdir', '')))
+            job.set_progress(f'{len(builder.versions)} package builds')
+    finally:
+        p.stdout.close()
+        p.wait()
+
+
+def cache_pkgs_list(columns: dict, source: str) -> None:
+    write_cache(cache_dir() / CACHE_FILENAME, columns, source)
+    for filename in OLD_CACHE_FILENAMES:
+        (cache_dir() / filename).unlink(missing_ok=True)
+
+
+@timed('fetch.conda_packages')
+def fetch_pkgs(job: FetchJob) -> str:
+    channels = get_setting('nextflow_conda_channels', []) or [None]
+    subdirs = get_setting('nextflow_conda_subdirs', []) or [None]
+    builder = CondaPackagesBuilder()
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(len(channels) * len(subdirs), MAX_SEARCH_WORKERS)) as executor:
+        futures = [executor.submit(run_conda_search, job, builder, channel, subdir)
+                   for channel in channels for subdir in subdirs]
+        for future in futures:
+            future.result()
+    job.check_cancelled()
+    source = ' '.join(['conda search --json'] + [f'--channel {x}' for x in channels if x] + [f'--subdir {x}' for x in subdirs if x])
+    with span('sort'):
+        columns = builder.columns()
+    cache_pkgs_list(columns, source)
+    return f'Retrieved and cached info for {len(builder.versions)} Conda packages'
+
+
+def start_fetch_pkgs(window: sublime.Window) -> FetchJob:
+    """Start fetching Conda package info unless it is already being fetched"""
+    return fetcher.submit(FETCH_KEY, 'Fetching Conda packages information', fetch_pkgs, window)
+
+
+class CondaPackagesIndex:
+    """Conda package builds grouped by package name for fast prefix lookups
+
+    Rows of the cached package columns are ordered by package name and then
+    newest version first when fetched, so that the builds of all packages
+    matching a prefix are a contiguous run of rows.
+    """
+
+    def __init__(self, columns: dict, cache: Optional[CacheFile] = None):
+        self.columns = columns
+        self.cache = cache
+        self.size = len(columns['versions'])
+        self.names: List[str] = columns['names']
+        self.name_rows: array = columns['name_rows']
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str, str, str]]:
+        """Get up to `limit` (name, version, build, channel) for packages with names starting with `prefix`"""
+        prefix = prefix.lower()
+        columns = self.columns
+        channels = columns['channels']
+        out = []
+        for i in range(bisect_left(self.names, prefix), len(self.names)):
+            name = self.names[i]
+            if not name.startswith(prefix):
+                break
+            for row in range(self.name_rows[i], self.name_rows[i + 1]):
+                out.append((name, columns['versions'][row], columns['builds'][row], channels[columns['channel_idx'][row]]))
+                if len(out) >= limit:
+                    return out
+        return out
+
+
+def load_pkgs_index(cache_path: Path) -> Optional[CondaPackagesIndex]:
+    cache = open_cache(cache_path)
+    if cache is None:
         return None
-    with open(cache_path, 'rb') as fh:
-        return pickle.load(fh)
+    columns = {name: cache.read(name) for name in COLUMNS}
+    if any(x is None for x in columns.values()):
+        return None
+    return CondaPackagesIndex(columns, cache)
+
+
+# resident index, only reloaded when the cache file is rewritten
+pkgs_index: FileCache[CondaPackagesIndex] = FileCache(load_pkgs_index)
+
+
+def get_pkgs_index() -> Optional[CondaPackagesIndex]:
+    return pkgs_index.get(cache_dir() / CACHE_FILENAME)
 
 
 class NextflowCondaPackagesInfoFetchCommand(sublime_plugin.WindowCommand):
     def run(self):
-        with pkgs_fetch_lock:
-            self.window.status_message('Fetching Conda package information...')
-            thread = threading.Thread(target=fetch_pkgs, args=(self.window, ))
-            thread.daemon = True
-            thread.start()
+        start_fetch_pkgs(self.window)
 
 
 class NextflowCondaPackagesEventListener(sublime_plugin.EventListener):
     def on_query_completions(self, view, prefix, locations):
+        if not is_nextflow(view):
+            return None
+        return self.conda_completions(view, prefix, locations)
 
-        if view.syntax().name != 'Nextflow':
-            return
+    @timed('completions.conda')
+    def conda_completions(self, view, prefix, locations):
         if len(locations) > 1:
             return
         point = locations[0]
         if not view.score_selector(point, 'source.nextflow meta.definition.process.nextflow meta.definition.conda-directive.nextflow string'):
             return
         window = view.window()
-        window.status_message('Getting Conda packages for completions...')
-        pkgs = get_cached_pkgs_list()
-        if pkgs:
-            window.status_message(f'Retrieved {len(pkgs)} Conda packages from cache')
-        else:
-            window.status_message('Running nextflow_conda_packages_info_fetch command')
-            view.run_command('nextflow_conda_packages_info_fetch')
+        index = get_pkgs_index()
+        if index is None:
+            # skip completions until the single in-flight fetch is done rather than starting more
+            job = fetcher.get(FETCH_KEY) or start_fetch_pkgs(window)
+            window.status_message(job.status())
             return
-        pkgs = pkgs[::-1]
-        flags = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS
-        completions = sublime.CompletionList(
-            completions=[
-                sublime.CompletionItem(
-                    trigger=f'{name}={version}={build}' if channel.startswith('pkgs/') else f'{channel}::{name}={version}={build}',
-                    annotation=f'{channel}::{name}={version}={build}',
-                ) for name,version,build,channel in pkgs
-            ],
-            flags=flags
-        )
+        refresh_if_stale(index.cache, lambda: fetcher.get(FETCH_KEY) or start_fetch_pkgs(window))
+        with span('search'):
+            pkgs = index.search(prefix, get_setting('nextflow_conda_max_completions', DEFAULT_MAX_COMPLETIONS))
+        # re-query as the prefix changes since only packages matching the current prefix are returned
+        flags = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS | sublime.DYNAMIC_COMPLETIONS
+        with span('render'):
+            completions = sublime.CompletionList(
+                completions=[
+                    sublime.CompletionItem(
+                        trigger=f'{name}={version}={build}' if channel.startswith('pkgs/') else f'{channel}::{name}={version}={build}',
+                        annotation=f'{channel}::{name}={version}={build}',
+                    ) for name,version,build,channel in pkgs
+                ],
+                flags=flags
+            )
         return completions
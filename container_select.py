@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 
-from typing import List, Tuple, Optional
-from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 import re
-from urllib.request import urlopen
 from urllib.parse import unquote_plus
-import pickle
 from pathlib import Path
 
 import sublime
 import sublime_plugin
-import threading
 
-container_fetch_lock = threading.Lock()
+from .nflib.cache import CacheFile, cache_dir, open_cache, refresh_if_stale, write_cache
+from .nflib.fetch import FetchJob, fetcher
+from .nflib.files import FileCache
+from .nflib.perf import timed
+from .nflib.settings import get_setting
+from .nflib.versions import build_number, version_key
+
+FETCH_KEY = 'biocontainers_images'
+CACHE_FILENAME = 'biocontainers_images.cache'
+# cache written by older versions
+OLD_CACHE_FILENAME = 'singularity_images.pickle'
 
 
 regex_sing_img = re.compile(r'^<a href="([^"]+)">[^<]+<\/a>\s*(\d{2}-\w{3}-\d{4} \d{2}:\d{2})\s*(\d+)$')
@@ -20,66 +26,165 @@ regex_sing_img = re.compile(r'^<a href="([^"]+)">[^<]+<\/a>\s*(\d{2}-\w{3}-\d{4}
 GALAXY_SINGULARITY_IMAGES_URL = 'https://depot.galaxyproject.org/singularity/'
 BASE_QUAYIO_DOCKER_URL = 'quay.io/biocontainers/'
 
+MONTHS = {m: i for i, m in enumerate(('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                      'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), start=1)}
+
+Image = Tuple[str, str, str]
+# tool name, tool quick panel label, image names and version quick panel labels, newest first
+Tool = Tuple[str, str, List[str], List[str]]
+
 
 def format_size_mb(size: str) -> str:
     size_mb = int(size) / (1024**2)
     return f'{size_mb:0.1f} MB'
 
 
-def to_isodatetime(s: str, fmt: str = '%d-%b-%Y %H:%M') -> str:
-    return datetime.strptime(s, fmt).isoformat()
-
-
-def get_images() -> List[Tuple[str, str, str]]:
-    """Get list of tuples with image name, date modified and size in MB"""
-    images = []
-    print(f'Fetching Biocontainers image info from {GALAXY_SINGULARITY_IMAGES_URL}')
-    with urlopen(GALAXY_SINGULARITY_IMAGES_URL) as response:
-        for line in response:
-            line = line.decode('utf-8').strip()
-            if not line:
-                continue
-            m = regex_sing_img.match(line)
-            if m:
-                image_name, dt, size = m.groups()
-                image_name = unquote_plus(image_name)
-                isodate = to_isodatetime(dt)
-                size_mb = format_size_mb(size)
-                images.append((image_name, isodate, size_mb))
-    print(f'Fetched info for {len(images)} Biocontainer images from {GALAXY_SINGULARITY_IMAGES_URL}')
-    return images
-
-
-def cache_images_list(images: List[Tuple[str, str, str]]) -> None:
-    cache_dir = Path(sublime.cache_path()) / 'sublime-nextflow'
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    cache_path = cache_dir / 'singularity_images.pickle'
-    with open(cache_path, 'wb') as fh:
-        pickle.dump(images, fh)
-
-
-def fetch_images(window: sublime.Window) -> None:
-    images = get_images()
-    cache_images_list(images)
-    window.status_message(f'Retrieved and cached info for {len(images)} Biocontainer images from {GALAXY_SINGULARITY_IMAGES_URL}')
-
-
-def get_cached_images_list() -> Optional[List[Tuple[str, str, str]]]:
-    cache_dir = Path(sublime.cache_path()) / 'sublime-nextflow'
-    cache_path = cache_dir / 'singularity_images.pickle'
-    if not cache_path.exists():
-        return None
-    with open(cache_path, 'rb') as fh:
-        return pickle.load(fh)
+def to_isodatetime(s: str) -> str:
+    """Convert a listing date like `07-Mar-2021 14:05` to ISO format without the cost of `strptime`"""
+    date, time = s.split(' ')
+    day, month, year = date.split('-')
+    return f'{year}-{MONTHS[month]:02d}-{day}T{time}:00'
+
+
+def split_image_name(image_name: str) -> Tuple[str, str, str]:
+    """Split an image name like `fastqc:0.11.9--hdfd78af_1` into tool, version and build"""
+    tool, _, tag = image_name.partition(':')
+    version, _, build = tag.partition('--')
+    return tool, version, build
+
+
+def index_tools(images: List[Image]) -> List[Tool]:
+    """Group images by tool with versions sorted newest first"""
+    by_tool = {}
+    for image in images:
+        tool, version, build = split_image_name(image[0])
+        by_tool.setdefault(tool, []).append((version_key(version), build_number(build), image[1], image))
+    tools = []
+    for tool in sorted(by_tool, key=str.lower):
+        versions = sorted(by_tool[tool], reverse=True)
+        image_names = []
+        labels = []
+        for _, _, _, (image_name, dt, size_mb) in versions:
+            image_names.append(image_name)
+            labels.append(f'{image_name.partition(":")[2] or image_name} ({dt}) [{size_mb}]')
+        n = len(versions)
+        latest = labels[0].split(' ', 1)[0]
+        tools.append((tool, f'{tool} ({n} version{"s" if n > 1 else ""}, latest {latest})', image_names, labels))
+    return tools
+
+
+def images_url() -> str:
+    return get_setting('nextflow_biocontainers_url', GALAXY_SINGULARITY_IMAGES_URL)
+
+
+def parse_images(lines: Iterable[bytes]) -> Iterator[Image]:
+    """Parse image listing lines into tuples with image name, date modified and size in MB"""
+    for line in lines:
+        m = regex_sing_img.match(line.decode('utf-8').strip())
+        if not m:
+            continue
+        image_name, dt, size = m.groups()
+        yield unquote_plus(image_name), to_isodatetime(dt), format_size_mb(size)
+
+
+def get_images(job: Optional[FetchJob] = None,
+               cache: Optional[CacheFile] = None,
+               url: Optional[str] = None) -> Tuple[int, int]:
+    """Refresh the images listing, merging new entries into the images in `cache`
+
+    The listing is requested conditionally with the validators of the cached
+    listing, so an unchanged listing costs a single request. Images are merged
+    and cached as they are parsed so that entries read before a cancelled or
+    dropped refresh are kept for the next one. Returns the number of images
+    and the number of new or changed images.
+    """
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    url = url or images_url()
+    meta = cache.read('meta') if cache is not None else None
+    if meta is None or meta['url'] != url:
+        cache = meta = None
+    headers = {}
+    if meta is not None and meta['etag']:
+        headers['If-None-Match'] = meta['etag']
+    if meta is not None and meta['last_modified']:
+        headers['If-Modified-Since'] = meta['last_modified']
+    images = {x[0]: x for x in cache.read('images', [])} if cache is not None else {}
+    try:
+        response = urlopen(Request(url, headers=headers))
+    except HTTPError as ex:
+        if ex.code == 304 and meta is not None:
+            # rewrite the cache so that it is no longer stale
+            cache_images_list(meta, images, cache.read('tools'))
+            return len(images), 0
+        raise
+    n_changed = 0
+    complete = False
+    with response:
+        if job is not None:
+            job.on_cancel(response.close)
+        try:
+            for image in parse_images(response):
+                if images.get(image[0]) != image:
+                    images[image[0]] = image
+                    n_changed += 1
+                    if job is not None and n_changed % 1000 == 0:
+                        job.set_progress(f'{n_changed} new images')
+            # closing the response on cancellation can end the listing early without an error
+            if job is not None:
+                job.check_cancelled()
+            complete = True
+        finally:
+            # validators are only kept for a listing parsed in full so that an interrupted refresh is not
+            # mistaken for an up-to-date one
+            if complete:
+                meta = dict(url=url,
+                            etag=response.headers.get('ETag'),
+                            last_modified=response.headers.get('Last-Modified'))
+                cache_images_list(meta, images)
+            elif n_changed:
+                cache_images_list(dict(url=url, etag=None, last_modified=None), images)
+    return len(images), n_changed
+
+
+def images_cache_path() -> Path:
+    return cache_dir() / CACHE_FILENAME
+
+
+def cache_images_list(meta: dict, images: Dict[str, Image], tools: Optional[List[Tool]] = None) -> None:
+    """Cache the listing validators, images and the images indexed by tool in separate sections"""
+    image_list = sorted(images.values())
+    if tools is None:
+        tools = index_tools(image_list)
+    write_cache(images_cache_path(), dict(meta=meta, images=image_list, tools=tools), meta['url'])
+    (cache_dir() / OLD_CACHE_FILENAME).unlink(missing_ok=True)
+
+
+# the images cache is kept open so that sections like the tool index are only read once
+images_cache: FileCache[Optional[CacheFile]] = FileCache(open_cache)
+
+
+def load_images_cache() -> Optional[CacheFile]:
+    return images_cache.get(images_cache_path())
+
+
+@timed('fetch.biocontainers')
+def fetch_images(job: FetchJob) -> str:
+    n_images, n_changed = get_images(job, load_images_cache())
+    if not n_changed:
+        return f'Biocontainer images info is up to date ({n_images} images)'
+    return f'Retrieved and cached info for {n_images} Biocontainer images ({n_changed} new)'
+
+
+def start_fetch_images(window: sublime.Window, on_done: Optional[Callable[[FetchJob], None]] = None) -> FetchJob:
+    """Start fetching Biocontainers images info unless it is already being fetched"""
+    return fetcher.submit(FETCH_KEY, 'Fetching Biocontainers Docker and Singularity images information', fetch_images,
+                          window, on_done=on_done)
 
 
 class NextflowBiocontainerInfoFetchCommand(sublime_plugin.WindowCommand):
     def run(self):
-        with container_fetch_lock:
-            self.window.status_message('Fetching Biocontainers Docker and Singularity images information...')
-            thread = threading.Thread(target=fetch_images, args=(self.window, ))
-            thread.daemon = True
-            thread.start()
+        start_fetch_images(self.window)
 
 
 class NextflowBiocontainerDirectiveInsertCommand(sublime_plugin.TextCommand):
@@ -95,7 +200,7 @@ class NextflowBiocontainerDirectiveInsertCommand(sublime_plugin.TextCommand):
             pad_col = ' ' * col
             name = container[0]
             text = "if (workflow.containerEngine == 'singularity' && !params.singularity_pull_docker_container) {\n"
-            text += f"{pad_col}  container '{GALAXY_SINGULARITY_IMAGES_URL}{name}'\n"
+            text += f"{pad_col}  container '{images_url()}{name}'\n"
             text += f"{pad_col}" + "} else {\n"
             text += f"{pad_col}  container '{BASE_QUAYIO_DOCKER_URL}{name}'\n"
             text += f"{pad_col}" + "}\n"
@@ -103,6 +208,7 @@ class NextflowBiocontainerDirectiveInsertCommand(sublime_plugin.TextCommand):
 
 
 class NextflowBiocontainerSelectCommand(sublime_plugin.TextCommand):
+    @timed('command.biocontainer_select')
     def run(self, edit, **kwargs):
         view = self.view
         if len(view.selection) > 1:
@@ -110,20 +216,33 @@ class NextflowBiocontainerSelectCommand(sublime_plugin.TextCommand):
         region = view.selection[0]
         point = region.a
         window = view.window()
-        singularity_images = get_cached_images_list()
-        if singularity_images:
-            window.status_message(f'Retrieved {len(singularity_images)} singularity images from cache')
-        else:
-            window.status_message(f'Getting singularity images from {GALAXY_SINGULARITY_IMAGES_URL}')
-            singularity_images = get_images()
-            window.status_message(f'Retrieved {len(singularity_images)} singularity images')
-            cache_images_list(singularity_images)
-            window.status_message(f'Cached info for {len(singularity_images)} singularity images')
-
-        def on_select(x: int):
+        cache = load_images_cache()
+        tools = cache.read('tools') if cache is not None else None
+        if not tools:
+            start_fetch_images(window, on_done=lambda job: self.on_fetched(window))
+            return
+        refresh_if_stale(cache, lambda: start_fetch_images(window))
+        window.status_message(f'Retrieved singularity images for {len(tools)} tools from cache')
+
+        def on_select_version(tool: Tool, x: int):
             if x == -1:
                 return
-            container = singularity_images[x]
-            view.run_command('nextflow_biocontainer_directive_insert', dict(container=container))
+            image_name = tool[2][x]
+            view.run_command('nextflow_biocontainer_directive_insert', dict(container=[image_name]))
 
-        view.window().show_quick_panel([f'{name} ({dt}) [{size_mb}]' for name, dt, size_mb in singularity_images], on_select=on_select)
+        def on_select_tool(x: int):
+            if x == -1:
+                return
+            tool = tools[x]
+            # the tool panel is still closing when this is called
+            sublime.set_timeout(lambda: window.show_quick_panel(tool[3], on_select=lambda i: on_select_version(tool, i)))
+
+        window.show_quick_panel([tool[1] for tool in tools], on_select=on_select_tool)
+
+    def on_fetched(self, window: sublime.Window):
+        """Show the tools once fetched, unless the listing had none so that fetching is not retried in a loop"""
+        cache = load_images_cache()
+        if cache is None or not cache.read('tools'):
+            window.status_message(f'No Biocontainers images found at {images_url()}')
+            return
+        self.view.run_command('nextflow_biocontainer_select')
@@ -0,0 +1,16 @@
+import sublime_plugin
+
+from .nflib.fetch import fetcher
+
+
+class NextflowCancelFetchCommand(sublime_plugin.WindowCommand):
+    """Cancel in-flight Conda packages and Biocontainers images information fetches"""
+
+    def run(self):
+        jobs = fetcher.cancellable_jobs()
+        for job in jobs:
+            job.cancel()
+        self.window.status_message(f'Cancelled {len(jobs)} fetch(es)')
+
+    def is_enabled(self):
+        return bool(fetcher.cancellable_jobs())
@@ -1,29 +1,100 @@
-import re
-from typing import Iterator
-import sys
 from pathlib import Path
+from typing import Callable, List, Optional, Tuple, TypeVar
 
 import sublime
 import sublime_plugin
 
+from .nflib.fetch import FetchJob
+from .nflib.index import ProjectIndex, get_index
+from .nflib.perf import timed
+
+T = TypeVar('T', bound=tuple)
+
+
+def include_root_dir(view: sublime.View) -> Optional[Path]:
+    """Get the project folder of a script if the cursor is at the start of a line to insert an include at"""
+    if len(view.selection) > 1:
+        return None
+    row, col = view.rowcol(view.selection[0].a)
+    if col != 0:
+        return None
+    window = view.window()
+    if window is None or not view.file_name() or not window.folders():
+        return None
+    return Path(window.folders()[0])
+
+
+class IncludePanel:
+    """Quick panel listing the definitions in the project index as they are, refreshed once indexing is done
+
+    The index lists the definitions stored by the last build right away, so
+    the panel opens without waiting for the project to be walked. If nothing
+    is stored yet, a single indexing item is shown instead. The panel is shown
+    again with the up-to-date list once the build is done, unless it has been
+    closed, the list has not changed or the user has already moved through it,
+    since showing it again would drop their filter text. Only scripts in the
+    project folder can be included.
+    """
+
+    def __init__(self,
+                 window: sublime.Window,
+                 index: ProjectIndex,
+                 list_items: Callable[[], List[T]],
+                 panel_item: Callable[[T], list],
+                 on_select: Callable[[T], None]):
+        self.window = window
+        self.index = index
+        self.list_items = list_items
+        self.panel_item = panel_item
+        self.on_select = on_select
+        self.items: List[T] = []
+        self.highlighted = 0
+        self.moved = False
+        # number of times the panel has been shown so that callbacks of replaced panels are ignored
+        self.shown = 0
+        self.closed = False
+
+    def show(self, job: Optional[FetchJob] = None) -> None:
+        """Show the panel, showing it again once `job` building the index is done"""
+        self._show(self.list_items(), job)
+        if job is not None:
+            job.on_finish(self.refresh)
+
+    def _show(self, items: List[T], job: Optional[FetchJob]) -> None:
+        self.items = items
+        self.highlighted = 0
+        self.moved = False
+        self.shown += 1
+        shown = self.shown
+        placeholder = f'Indexing {self.index.root_dir.name}…' if job is not None else None
+        panel_items = [self.panel_item(x) for x in items] if items else [placeholder or 'No definitions found']
+        self.window.show_quick_panel(panel_items,
+                                     on_select=lambda i: self.select(shown, i),
+                                     selected_index=0,
+                                     on_highlight=lambda i: self.highlight(shown, i),
+                                     placeholder=placeholder)
+
+    def refresh(self) -> None:
+        if self.closed or (self.items and self.moved):
+            return
+        items = self.list_items()
+        if items != self.items or not items:
+            self._show(items, None)
 
-regex_process = re.compile(r'^process +(\w+) *\{\s*$')
-regex_functions = re.compile(r'^def +(\w+) *\([^\)]*\) *\{\s*$')
-
-def find_processes(path: Path) -> Iterator[str]:
-    with open(path) as f:
-        for l in f:
-            m = regex_process.match(l)
-            if m:
-                yield m.group(1)
-
+    def highlight(self, shown: int, i: int) -> None:
+        if shown == self.shown and i != self.highlighted:
+            self.highlighted = i
+            self.moved = True
 
-def find_functions(path: Path) -> Iterator[str]:
-    with open(path) as f:
-        for l in f:
-            m = regex_functions.match(l)
-            if m:
-                yield m.group(1)
+    def select(self, shown: int, i: int) -> None:
+        if shown != self.shown:
+            return
+        self.closed = True
+        if i == -1 or not self.items:
+            return
+        item = self.items[i]
+        if item[1].startswith(f'{self.index.root_dir}/'):
+            self.on_select(item)
 
 
 def relative_path(script_path: Path, import_path: Path) -> str:
@@ -58,37 +129,33 @@ class NextflowIncludeInsertProcessCommand(sublime_plugin.TextCommand):
 
 
 class NextflowIncludeProcessCommand(sublime_plugin.TextCommand):
-    def run(self, edit, **kwargs):
+    @timed('command.include_process')
+    def run(self, edit, path_prefix: str = ''):
+        """List processes and workflows to include, optionally only those in scripts under `path_prefix`
+
+        `path_prefix` is relative to the project folder, e.g. `modules/nf-core/`.
+        """
         view = self.view
-        if len(view.selection) > 1:
-            return
-        region = view.selection[0]
-        point = region.a
-        row, col = view.rowcol(point)
-        if col != 0:
-            return
-        folders = view.window().folders()
-        if not view.file_name():
+        root_dir = include_root_dir(view)
+        if root_dir is None:
             return
-        if not folders:
-            return
-        root_dir = Path(folders[0])
-        nf_files = [(proc, str(p.absolute())) for p in root_dir.rglob('*.nf') for proc in find_processes(p)]
-
-        def on_select(x: int):
-            if x == -1:
-                return
-            proc, nf_path = nf_files[x]
-            root = str(root_dir.absolute())
-            if nf_path.startswith(root):
-                view.run_command(
-                    'nextflow_include_insert_process', 
-                    dict(process=proc,
-                         module_path=nf_path
-                    )
+        index = get_index(root_dir)
+        prefix = f'{index.root_dir}/{path_prefix}'
+
+        def list_items() -> List[Tuple[str, str]]:
+            items = [(entry.name, str(entry.path)) for entry in index.definitions('process', 'workflow')]
+            return [x for x in items if x[1].startswith(prefix)]
+
+        def on_select(item: Tuple[str, str]):
+            proc, nf_path = item
+            view.run_command(
+                'nextflow_include_insert_process',
+                dict(process=proc,
+                     module_path=nf_path
                 )
+            )
 
-        view.window().show_quick_panel(nf_files, on_select=on_select)
+        IncludePanel(view.window(), index, list_items, list, on_select).show(index.start_build())
 
 
 class NextflowIncludeInsertFunctionsCommand(sublime_plugin.TextCommand):
@@ -111,39 +178,36 @@ class NextflowIncludeInsertFunctionsCommand(sublime_plugin.TextCommand):
 
 
 class NextflowIncludeFunctionsCommand(sublime_plugin.TextCommand):
-    def run(self, edit, **kwargs):
+    @timed('command.include_functions')
+    def run(self, edit, path_prefix: str = ''):
+        """List the functions of each script to include, optionally only those in scripts under `path_prefix`"""
         view = self.view
-        if len(view.selection) > 1:
+        root_dir = include_root_dir(view)
+        if root_dir is None:
             return
-        region = view.selection[0]
-        point = region.a
-        row, col = view.rowcol(point)
-        if col != 0:
-            return
-        folders = view.window().folders()
-        if not view.file_name():
-            return
-        if not folders:
-            return
-        root_dir = Path(folders[0])
-        nf_files = []
-        for p in root_dir.rglob('*.nf'):
-            abspath = str(p.absolute())
-            funcs = list(find_functions(p))
-            if funcs:
-                nf_files.append((funcs, abspath))
-
-        def on_select(x: int):
-            if x == -1:
-                return
-            funcs, nf_path = nf_files[x]
-            root = str(root_dir.absolute())
-            if nf_path.startswith(root):
-                view.run_command(
-                    'nextflow_include_insert_functions', 
-                    dict(funcs=funcs,
-                         module_path=nf_path
-                    )
+        index = get_index(root_dir)
+        prefix = f'{index.root_dir}/{path_prefix}'
+
+        def list_items() -> List[Tuple[List[str], str]]:
+            nf_files = []
+            for entry in index.definitions('function'):
+                nf_path = str(entry.path)
+                if not nf_path.startswith(prefix):
+                    continue
+                if nf_files and nf_files[-1][1] == nf_path:
+                    nf_files[-1][0].append(entry.name)
+                else:
+                    nf_files.append(([entry.name], nf_path))
+            return nf_files
+
+        def on_select(item: Tuple[List[str], str]):
+            funcs, nf_path = item
+            view.run_command(
+                'nextflow_include_insert_functions',
+                dict(funcs=funcs,
+                     module_path=nf_path
                 )
+            )
 
-        view.window().show_quick_panel([('; '.join(x), y) for x,y in nf_files], on_select=on_select)
+        IncludePanel(view.window(), index, list_items, lambda x: ['; '.join(x[0]), x[1]], on_select).show(
+            index.start_build())
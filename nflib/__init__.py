@@ -0,0 +1,11 @@
+"""Shared, editor-agnostic helpers for the sublime-nextflow plugins.
+
+Sublime Text only loads the top-level ``*.py`` files of a package as plugins,
+so everything in here is imported on demand by those plugins.
+
+Standard library modules that are slow to import and only needed by some
+features, like ``sqlite3``, ``urllib.request``, ``concurrent.futures`` or
+``pickle``, are imported inside the functions that use them rather than at
+module level, so that they are not imported when Sublime Text loads the
+plugins on start but on the first call that needs them.
+"""
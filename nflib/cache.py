@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Versioned cache files for fetched package and container metadata
+
+A cache file starts with a header recording the format version, when and
+from where the data was fetched, whether sections are compressed and where
+each named section is stored, followed by the pickled (and optionally
+zlib-compressed) sections. Files are written atomically via a temporary file
+so a crash mid-write cannot leave a corrupt cache behind, and sections are
+only read and unpickled when asked for so callers only materialize the data
+they need.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import sublime
+
+from .files import fingerprint
+from .settings import get_setting
+
+# bump when the layout of cache files changes
+FORMAT_VERSION = 1
+MAGIC = b'NFCACHE'
+_header_size = struct.Struct('>I')
+
+DEFAULT_MAX_AGE_HOURS = 24 * 7
+# don't retry a failed background refresh of a stale cache on every lookup
+REFRESH_RETRY_S = 3600
+
+
+class CacheError(Exception):
+    pass
+
+
+def cache_dir() -> Path:
+    return Path(sublime.cache_path()) / 'sublime-nextflow'
+
+
+def write_cache(path: Path, sections: Dict[str, Any], source: str, compress: Optional[bool] = None) -> None:
+    """Atomically write `sections` to a cache file, compressing them unless the `nextflow_cache_compress` setting is false"""
+    if compress is None:
+        compress = get_setting('nextflow_cache_compress', True)
+    import pickle
+    import tempfile
+    blobs = []
+    index = {}
+    offset = 0
+    for name, value in sections.items():
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if compress:
+            blob = zlib.compress(blob, 1)
+        index[name] = (offset, len(blob))
+        offset += len(blob)
+        blobs.append(blob)
+    header = json.dumps(dict(
+        format=FORMAT_VERSION,
+        created=time.time(),
+        source=source,
+        compression='zlib' if compress else None,
+        sections=index,
+    )).encode('utf-8')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(MAGIC)
+            fh.write(_header_size.pack(len(header)))
+            fh.write(header)
+            for blob in blobs:
+                fh.write(blob)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+class CacheFile:
+    """A cache file whose header has been read, with sections read on demand
+
+    Sections are read at most once; if the file has been rewritten since the
+    header was read, `read` returns the default rather than misreading the
+    new file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fingerprint = fingerprint(path)
+        with open(path, 'rb') as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                raise CacheError(f'{path} is not a cache file')
+            size_bytes = fh.read(_header_size.size)
+            if len(size_bytes) != _header_size.size:
+                raise CacheError(f'{path} is truncated')
+            header_bytes = fh.read(_header_size.unpack(size_bytes)[0])
+        try:
+            header = json.loads(header_bytes)
+        except ValueError as ex:
+            raise CacheError(f'{path} has an invalid header: {ex}')
+        if header.get('format') != FORMAT_VERSION:
+            raise CacheError(f'{path} has format version {header.get("format")} instead of {FORMAT_VERSION}')
+        self.created: float = header['created']
+        self.source: str = header['source']
+        self.compression: Optional[str] = header['compression']
+        self.sections: Dict[str, Tuple[int, int]] = header['sections']
+        self.data_start = len(MAGIC) + _header_size.size + len(header_bytes)
+        self.values: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+    def is_stale(self) -> bool:
+        """Whether the cache is older than the `nextflow_cache_max_age_hours` setting (0 to never expire)"""
+        max_age_hours = get_setting('nextflow_cache_max_age_hours', DEFAULT_MAX_AGE_HOURS)
+        return bool(max_age_hours) and self.age > max_age_hours * 3600
+
+    def read(self, name: str, default: Any = None) -> Any:
+        import pickle
+        with self.lock:
+            if name in self.values:
+                return self.values[name]
+            if name not in self.sections:
+                return default
+            offset, size = self.sections[name]
+            try:
+                with open(self.path, 'rb') as fh:
+                    st = os.fstat(fh.fileno())
+                    if (st.st_mtime_ns, st.st_size, st.st_ino) != self.fingerprint:
+                        return default
+                    fh.seek(self.data_start + offset)
+                    blob = fh.read(size)
+                if self.compression == 'zlib':
+                    blob = zlib.decompress(blob)
+                value = pickle.loads(blob)
+            except Exception as ex:
+                print(f'Could not read "{name}" from cache file {self.path}: {ex}')
+                return default
+            self.values[name] = value
+            return value
+
+
+def open_cache(path: Path) -> Optional[CacheFile]:
+    """Open a cache file, returning None if it is missing, corrupt or from another format version"""
+    try:
+        return CacheFile(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, CacheError, KeyError) as ex:
+        print(f'Ignoring cache file {path}: {ex}')
+        return None
+
+
+_refresh_attempts: Dict[Path, float] = {}
+
+
+def refresh_if_stale(cache: Optional[CacheFile], start_refresh: Callable[[], Any]) -> None:
+    """Start a background refresh of a stale cache, at most once per `REFRESH_RETRY_S`"""
+    if cache is None or not cache.is_stale():
+        return
+    now = time.monotonic()
+    last = _refresh_attempts.get(cache.path)
+    if last is not None and now - last < REFRESH_RETRY_S:
+        return
+    _refresh_attempts[cache.path] = now
+    start_refresh()
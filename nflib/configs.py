@@ -0,0 +1,528 @@
+#!/usr/bin/env python
+"""Parsed project config files with the process selectors in them and the config model they add up to
+
+Config files are parsed once per project in the background and then only
+re-parsed when they are saved or their fingerprint changes, so completions
+and popups can be served from memory without walking the project tree.
+
+The ``process`` and ``params`` scopes of each file (including those in
+``profiles``) are parsed into params, ``includeConfig`` statements and an
+ordered table of rules with precompiled ``withLabel`` and ``withName``
+selectors. Starting from the project's ``nextflow.config``, the model
+follows ``includeConfig`` chains over the parsed files. Resolving the
+directives of a process is then a walk over the table, applying rules in
+order of Nextflow's priorities: generic ``process`` settings, then the
+process definition, then ``withLabel`` and finally ``withName`` selectors,
+later rules overriding earlier ones of the same priority.
+"""
+
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Pattern, Tuple, Union
+
+import sublime
+
+from .fetch import FetchJob, fetcher
+from .files import Fingerprint, fingerprint
+from .fs import is_excluded, walk_files
+from .perf import span
+from .tokenizer import Block, scan_blocks
+
+# name of a block from the text before its opening brace on the same line, e.g. `process`, `test` or `withName: 'FOO'`
+regex_block_name = re.compile(r'(?:(withLabel|withName)\s*:\s*(?:([\'"])(.*?)\2|([^\s{]+))|([\w.]+))\s*$')
+regex_include = re.compile(r'\bincludeConfig\s*\(?\s*([\'"])(.+?)\1')
+regex_list_token = re.compile(r'[\[\]]|\'(?:[^\'\\\n]|\\.)*\'|"(?:[^"\\\n]|\\.)*"')
+# a value up to the end of the line, a `;` or a trailing `//` comment, none of which end it within a string
+VALUE_PATTERN = r'(?:[^;\n\'"/]|/(?!/)|\'(?:[^\'\\\n]|\\.)*\'|"(?:[^"\\\n]|\\.)*")*'
+# assignments at the start of a line or after `{` or `;`, e.g. `withName: FOO { cpus = 2; memory = 4.GB }`
+regex_assignment = re.compile(r'(?:^|(?<=[{;]))[ \t]*([\w.]+)\s*=[ \t]*(' + VALUE_PATTERN + ')', re.MULTILINE)
+# references to the project directory at the start of included config paths
+regex_project_dir = re.compile(r'^\$\{?(?:projectDir|baseDir)\}?/')
+
+# rule priorities from lowest to highest, with `definition` for directives in the process definition
+PRIORITIES = ('process', 'definition', 'withLabel', 'withName')
+MAX_VALUE_LENGTH = 80
+
+
+class Directive(NamedTuple):
+    name: str
+    value: str
+    path: Path
+    line: int
+    # selector of the rule the directive comes from, e.g. `withLabel: process_low`
+    selector: str
+    profile: Optional[str]
+
+
+class Rule(NamedTuple):
+    kind: str  # 'process', 'withLabel' or 'withName'
+    pattern: str
+    regex: Optional[Pattern]
+    negate: bool
+    profile: Optional[str]
+    directives: List[Directive]
+    path: Path
+    line: int
+
+    def matches(self, name: str, labels: List[str]) -> bool:
+        if self.kind == 'process':
+            return True
+        if self.regex is None:
+            return False
+        if self.kind == 'withLabel':
+            matched = any(self.regex.fullmatch(x) for x in labels)
+        else:
+            matched = bool(self.regex.fullmatch(name))
+            # a qualified selector like `.*:FASTQC` matches the process in any workflow
+            if not matched and ':' in self.pattern:
+                tail = self.pattern.rsplit(':', 1)[1]
+                try:
+                    matched = bool(re.fullmatch(tail, name))
+                except re.error:
+                    matched = False
+        return matched != self.negate
+
+
+class Include(NamedTuple):
+    path: Path
+    profile: Optional[str]
+
+
+class Param(NamedTuple):
+    name: str
+    value: str
+    path: Path
+    line: int
+    profile: Optional[str]
+
+
+ConfigItem = Union[Rule, Include, Param]
+
+
+def _compile_selector(pattern: str) -> Tuple[Optional[Pattern], bool]:
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+    try:
+        return re.compile(pattern), negate
+    except re.error:
+        return None, negate
+
+
+def collapse_value(value: str) -> str:
+    """Collapse whitespace in a value and shorten it to `MAX_VALUE_LENGTH` characters for display"""
+    value = ' '.join(value.split())
+    if len(value) > MAX_VALUE_LENGTH:
+        value = value[:MAX_VALUE_LENGTH - 1] + '…'
+    return value
+
+
+class _ConfigParser:
+    """Parses the `process` scopes and `includeConfig` statements of a config file in order"""
+
+    def __init__(self, text: str, path: Path, root_dir: Path):
+        self.text = text
+        self.path = path
+        self.root_dir = root_dir
+        self.blocks = scan_blocks(text)
+        self.items: List[ConfigItem] = []
+
+    def parse(self) -> List[ConfigItem]:
+        self._scope(self.blocks[-1], None)
+        return self.items
+
+    def _line(self, pos: int) -> int:
+        return self.text.count('\n', 0, pos)
+
+    def _name(self, block: Block) -> Optional[Tuple[str, str]]:
+        """Get the kind and pattern of a selector block or the name of another block"""
+        line_start = self.text.rfind('\n', 0, block.start) + 1
+        m = regex_block_name.search(self.text, line_start, block.start)
+        if m is None:
+            return None
+        kind, quote, quoted, bare, name = m.groups()
+        if kind:
+            return kind, quoted if quote else bare
+        return 'block', name
+
+    def _gaps(self, block: Block) -> List[Tuple[int, int]]:
+        """Get the ranges of text directly inside a block, outside of its child blocks"""
+        out = []
+        pos = block.start + 1
+        for child in block.children:
+            out.append((pos, child.start))
+            pos = child.end + 1
+        out.append((pos, block.end))
+        return out
+
+    def _assignments(self, block: Block) -> List[Tuple[str, str, int]]:
+        """Get the (name, value, offset) of assignments directly inside a block, with closure values in full"""
+        out = []
+        for start, end in self._gaps(block):
+            for m in regex_assignment.finditer(self.text, start, end):
+                value = m.group(2)
+                value_start = m.start(2)
+                # a closure or map value is a child block, which the gap ends at
+                if value_start in self.blocks:
+                    value = self.text[value_start:self.blocks[value_start].end + 1]
+                elif value.startswith('['):
+                    value = self.text[value_start:self._list_end(value_start)]
+                out.append((m.group(1), value, m.start(1)))
+        return out
+
+    def _list_end(self, start: int) -> int:
+        """Get the offset after the `]` closing a (possibly multi-line) list literal"""
+        depth = 0
+        for m in regex_list_token.finditer(self.text, start):
+            token = m.group()
+            if token == '[':
+                depth += 1
+            elif token == ']':
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        return len(self.text)
+
+    def _includes(self, block: Block, profile: Optional[str]) -> List[Tuple[int, Include]]:
+        out = []
+        for start, end in self._gaps(block):
+            for m in regex_include.finditer(self.text, start, end):
+                path = self._include_path(m.group(2))
+                if path is not None:
+                    out.append((m.start(), Include(path, profile)))
+        return out
+
+    def _include_path(self, value: str) -> Optional[Path]:
+        value = regex_project_dir.sub(str(self.root_dir).replace('\\', '\\\\') + '/', value)
+        if '$' in value or '://' in value:
+            # paths from params or remote configs cannot be resolved in the editor
+            return None
+        path = Path(value)
+        if not path.is_absolute():
+            path = self.path.parent / path
+        return path.resolve()
+
+    def _scope(self, block: Block, profile: Optional[str]) -> None:
+        """Parse the top level of a config file or a profile in order"""
+        items: List[Tuple[int, Union[ConfigItem, Block]]] = self._includes(block, profile)
+        assignments = self._assignments(block)
+        # dotted process settings like `process.cpus = 2`
+        process_assignments = [x for x in assignments if x[0].startswith('process.')]
+        if process_assignments:
+            directives = [self._directive(name[len('process.'):], value, pos, 'process', profile)
+                          for name, value, pos in process_assignments]
+            pos = process_assignments[0][2]
+            items.append((pos, Rule('process', '', None, False, profile, directives, self.path, self._line(pos))))
+        # dotted params like `params.outdir = 'results'`
+        items.extend((pos, self._param(name[len('params.'):], value, pos, profile))
+                     for name, value, pos in assignments if name.startswith('params.'))
+        items.extend((child.start, child) for child in block.children)
+        items.sort(key=lambda x: x[0])
+        for _, item in items:
+            if not isinstance(item, Block):
+                self.items.append(item)
+                continue
+            name = self._name(item)
+            if name is None:
+                continue
+            if name[1] == 'process':
+                self._process(item, 'process', '', profile)
+            elif name[1] == 'params':
+                self._params(item, profile)
+            elif name[1] == 'profiles' and profile is None:
+                for profile_block in item.children:
+                    profile_name = self._name(profile_block)
+                    if profile_name is not None and profile_name[0] == 'block':
+                        self._scope(profile_block, profile_name[1])
+
+    def _directive(self, name: str, value: str, pos: int, selector: str, profile: Optional[str]) -> Directive:
+        return Directive(name, collapse_value(value), self.path, self._line(pos), selector, profile)
+
+    def _param(self, name: str, value: str, pos: int, profile: Optional[str]) -> Param:
+        return Param(name, collapse_value(value), self.path, self._line(pos), profile)
+
+    def _params(self, block: Block, profile: Optional[str]) -> None:
+        """Parse a `params` scope, where nested blocks are map params"""
+        items: List[Tuple[int, Param]] = [(pos, self._param(name, value, pos, profile))
+                                          for name, value, pos in self._assignments(block)]
+        for child in block.children:
+            name = self._name(child)
+            if name is not None and name[0] == 'block':
+                items.append((child.start, self._param(name[1], self.text[child.start:child.end + 1], child.start,
+                                                       profile)))
+        items.sort(key=lambda x: x[0])
+        self.items.extend(x for _, x in items)
+
+    def _process(self, block: Block, kind: str, pattern: str, profile: Optional[str]) -> None:
+        """Parse a `process` scope or a selector block within one"""
+        selector = 'process' if kind == 'process' else f'{kind}: {pattern}'
+        directives = [self._directive(name, value, pos, selector, profile)
+                      for name, value, pos in self._assignments(block)]
+        # selectors are kept even without directives so that their labels can be completed
+        if directives or kind != 'process':
+            regex, negate = _compile_selector(pattern) if kind != 'process' else (None, False)
+            self.items.append(Rule(kind, pattern, regex, negate, profile, directives, self.path,
+                                   self._line(block.start)))
+        for child in block.children:
+            name = self._name(child)
+            if name is not None and name[0] in ('withLabel', 'withName'):
+                self._process(child, name[0], name[1], profile)
+
+
+def parse_config(text: str, path: Path, root_dir: Path) -> List[ConfigItem]:
+    """Get the process rules, params and included configs of a config file in order"""
+    return _ConfigParser(text, path, root_dir).parse()
+
+
+def parse_config_file(path: Path, root_dir: Path) -> List[ConfigItem]:
+    with span('read'):
+        try:
+            text = path.read_text()
+        except (OSError, UnicodeDecodeError) as ex:
+            print(f'Could not read config file {path}: {ex}')
+            return []
+    with span('parse'):
+        return parse_config(text, path, root_dir)
+
+
+class Selector(NamedTuple):
+    kind: str
+    pattern: str
+    path: Path
+    line: int
+    # directives in the selector block, one per line
+    body: str
+    # completion popup details
+    details: str
+
+
+def rule_selector(rule: Rule) -> Selector:
+    body = '\n'.join(f'{x.name} = {x.value}' for x in rule.directives)
+    details = '|'.join(f'<code>{x.replace(" ", "")}</code>' for x in body.split('\n'))
+    return Selector(rule.kind, rule.pattern, rule.path, rule.line, body, details)
+
+
+class ConfigModel:
+    """Process rules and params from a project's `nextflow.config` and the configs it includes, in evaluation order
+
+    `version` is incremented whenever the model is rebuilt.
+    """
+
+    def __init__(self, index: 'ConfigIndex'):
+        self.index = index
+        self.rules: List[Rule] = []
+        self.params: List[Param] = []
+        self.fingerprints: Dict[Path, Optional[Fingerprint]] = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def build(self) -> None:
+        # built aside and swapped in at once, popups resolve against the previous model meanwhile
+        rules: List[Rule] = []
+        params: List[Param] = []
+        fingerprints: Dict[Path, Optional[Fingerprint]] = {}
+        self._add_file(self.index.root_dir / 'nextflow.config', None, rules, params, fingerprints)
+        self.rules, self.params, self.fingerprints = rules, params, fingerprints
+        self.version += 1
+
+    def _add_file(self, path: Path, profile: Optional[str], rules: List[Rule], params: List[Param],
+                  fingerprints: Dict[Path, Optional[Fingerprint]]) -> None:
+        if path in fingerprints:
+            # include cycle
+            return
+        fp, items = self.index.parsed_file(path)
+        fingerprints[path] = fp
+        for item in items:
+            if isinstance(item, Include):
+                self._add_file(item.path, item.profile or profile, rules, params, fingerprints)
+                continue
+            if profile is not None and item.profile is None:
+                # rules and params of configs included from within a profile belong to that profile
+                item = item._replace(profile=profile)
+                if isinstance(item, Rule):
+                    item = item._replace(directives=[x._replace(profile=profile) for x in item.directives])
+            if isinstance(item, Param):
+                params.append(item)
+            else:
+                rules.append(item)
+
+    def is_stale(self) -> bool:
+        return not self.fingerprints or any(fingerprint(path) != fp for path, fp in self.fingerprints.items())
+
+    @property
+    def profiles(self) -> List[str]:
+        out = []
+        for item in self.rules + self.params:
+            if item.profile is not None and item.profile not in out:
+                out.append(item.profile)
+        return out
+
+    def resolve(self,
+                name: str,
+                labels: List[str],
+                definition_directives: Optional[List[Directive]] = None,
+                profile: Optional[str] = None) -> Dict[str, Directive]:
+        """Resolve the directives of a process with the generic, `profile` and matching selector rules"""
+        by_priority: Dict[str, List[Directive]] = {x: [] for x in PRIORITIES}
+        by_priority['definition'] = definition_directives or []
+        for rule in self.rules:
+            if rule.profile is not None and rule.profile != profile:
+                continue
+            if rule.matches(name, labels):
+                by_priority[rule.kind].extend(rule.directives)
+        out = {}
+        for priority in PRIORITIES:
+            for directive in by_priority[priority]:
+                out[directive.name] = directive
+        return out
+
+
+class ConfigIndex:
+    """Parsed config files under a project root directory, with the process selectors in them and the config model"""
+
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        # parsed config files, including configs included from outside the root directory
+        self.files: Dict[Path, List[ConfigItem]] = {}
+        self.fingerprints: Dict[Path, Fingerprint] = {}
+        self._selectors: Optional[List[Selector]] = None
+        self.built = False
+        self.job: Optional[FetchJob] = None
+        self.model = ConfigModel(self)
+        self.lock = threading.RLock()
+
+    def start_build(self, window: Optional[sublime.Window] = None) -> Optional[FetchJob]:
+        """Start parsing the config files in the background unless they are parsed or being parsed
+
+        Selectors are listed from the files parsed so far while they are being parsed.
+        """
+        with self.lock:
+            if self.built:
+                return None
+            if self.job is not None and self.job.running:
+                return self.job
+            self.job = fetcher.submit(f'config_index:{self.root_dir}',
+                                      f'Indexing config files in {self.root_dir.name}',
+                                      self._build,
+                                      window,
+                                      user_cancellable=False)
+            return self.job
+
+    def build(self) -> None:
+        """Parse the config files, waiting for them to be parsed"""
+        job = self.start_build()
+        if job is not None:
+            job.wait()
+
+    def building(self) -> Optional[FetchJob]:
+        """Get the build job if the config files are being parsed"""
+        with self.lock:
+            if self.job is not None and self.job.running:
+                return self.job
+            return None
+
+    def _build(self, job: FetchJob) -> str:
+        with span('walk'):
+            paths = list(walk_files(self.root_dir, ('.config',)))
+        for path in paths:
+            job.check_cancelled()
+            self.update_file(path.resolve())
+        with self.lock:
+            self.built = True
+        return f'Indexed {len(paths)} config files in {self.root_dir}'
+
+    def contains(self, path: Path) -> bool:
+        try:
+            path.relative_to(self.root_dir)
+        except ValueError:
+            return False
+        return not is_excluded(self.root_dir, path)
+
+    def update_file(self, path: Path) -> bool:
+        """Re-parse a config file if its fingerprint has changed, returning whether it changed"""
+        fp = fingerprint(path)
+        with self.lock:
+            if fp == self.fingerprints.get(path):
+                return False
+        # parsed without holding the lock so that lookups are not blocked by the background build
+        items = parse_config_file(path, self.root_dir) if fp is not None else None
+        with self.lock:
+            self._selectors = None
+            if items is None:
+                self.files.pop(path, None)
+                self.fingerprints.pop(path, None)
+            else:
+                self.files[path] = items
+                self.fingerprints[path] = fp
+            return True
+
+    def parsed_file(self, path: Path) -> Tuple[Optional[Fingerprint], List[ConfigItem]]:
+        """Get the fingerprint and items of a config file, re-parsing it if it has changed"""
+        self.update_file(path)
+        with self.lock:
+            return self.fingerprints.get(path), self.files.get(path, [])
+
+    def selectors(self, kind: Optional[str] = None) -> List[Selector]:
+        """Get selectors of a kind (`withLabel` or `withName`) or all selectors in order of path and line
+
+        Only the selectors of the files parsed so far are listed while the config files are being parsed.
+        """
+        self.start_build()
+        with self.lock:
+            if self._selectors is None:
+                self._selectors = [rule_selector(x) for path in sorted(self.files) if self.contains(path)
+                                   for x in self.files[path] if isinstance(x, Rule) and x.kind != 'process']
+            selectors = self._selectors
+        if kind is None:
+            return selectors
+        return [x for x in selectors if x.kind == kind]
+
+    def config_model(self) -> ConfigModel:
+        """Get the config model, rebuilding it if any of its config files have changed"""
+        with self.model.lock:
+            if self.model.is_stale():
+                self.model.build()
+        return self.model
+
+    def short_path(self, path: Path) -> str:
+        return str(path.absolute()).replace(str(self.root_dir.absolute()) + '/', '')
+
+
+_indexes: Dict[Path, ConfigIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def config_changed(path: Path) -> None:
+    """Update config indexes that contain a saved, loaded, closed or deleted config file"""
+    path = path.resolve()
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        if (index.built or index.building()) and index.contains(path):
+            index.update_file(path)
+
+
+def forget_config_roots(open_roots: Iterable[Path]) -> None:
+    """Drop config indexes and models for project folders that are no longer open in any window"""
+    open_roots = {x.resolve() for x in open_roots}
+    with _indexes_lock:
+        for root_dir in list(_indexes):
+            if root_dir not in open_roots:
+                del _indexes[root_dir]
+
+
+def get_config_index(root_dir: Path) -> ConfigIndex:
+    """Get the shared config index for a project root directory"""
+    root_dir = root_dir.resolve()
+    with _indexes_lock:
+        try:
+            return _indexes[root_dir]
+        except KeyError:
+            index = _indexes[root_dir] = ConfigIndex(root_dir)
+            return index
+
+
+def get_config_model(root_dir: Path) -> ConfigModel:
+    """Get the config model for a project, rebuilding it if any of its config files have changed"""
+    return get_config_index(root_dir).config_model()
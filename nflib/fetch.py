@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""Single-flight coordinator for slow background jobs like fetching package and container metadata
+
+Each kind of fetch (e.g. Conda packages or Biocontainers images) has a key and
+only one job per key can be in flight at a time; submitting a job for a key
+that is already being fetched returns the running job. Jobs report progress in
+the status bar and can be cancelled by the user or after a timeout.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import sublime
+
+from .settings import get_setting
+
+DEFAULT_TIMEOUT_S = 900
+STATUS_INTERVAL_MS = 500
+SPINNER = '⣾⣽⣻⢿⡿⣟⣯⣷'
+
+
+class FetchCancelled(Exception):
+    pass
+
+
+class FetchJob:
+    """A background fetch that can be waited on and cooperatively cancelled
+
+    The fetch function is passed the job and should check `cancelled` (or call
+    `check_cancelled`) as it goes and register callbacks with `on_cancel` to
+    abort blocking work like subprocesses or HTTP responses.
+    """
+
+    def __init__(self, key: str, title: str, user_cancellable: bool = True):
+        self.key = key
+        self.title = title
+        # whether the job is cancelled by the cancel fetches command rather than only by its owner or a timeout
+        self.user_cancellable = user_cancellable
+        self.progress = ''
+        self.started = time.monotonic()
+        self.error: Optional[BaseException] = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self._finish_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.running and not self.cancelled and self.error is None
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise FetchCancelled(self.title)
+
+    def set_progress(self, progress: str) -> None:
+        self.progress = progress
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Register a callback to abort blocking work, calling it right away if the job is already cancelled"""
+        with self._lock:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def on_finish(self, callback: Callable[[], None]) -> None:
+        """Register a callback to run on the main thread once the job is done, succeeded or not, or right away if it is"""
+        with self._lock:
+            if self.running:
+                self._finish_callbacks.append(callback)
+                return
+        sublime.set_timeout(callback)
+
+    def _finish(self) -> None:
+        with self._lock:
+            # callbacks are queued before the job is done so that whoever waits on it sees them pending
+            for callback in self._finish_callbacks:
+                sublime.set_timeout(callback)
+            self._done.set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled or not self.running:
+                return
+            self._cancelled.set()
+            callbacks = self._cancel_callbacks[:]
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as ex:
+                print(f'Error cancelling "{self.title}": {ex}')
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the job to finish, returning whether it finished within `timeout` seconds"""
+        return self._done.wait(timeout)
+
+    def status(self) -> str:
+        elapsed = time.monotonic() - self.started
+        spinner = SPINNER[int(elapsed * 1000 / STATUS_INTERVAL_MS) % len(SPINNER)]
+        out = f'{spinner} {self.title} ({elapsed:.0f}s)'
+        if self.progress:
+            out += f': {self.progress}'
+        return out
+
+
+class FetchCoordinator:
+    def __init__(self):
+        self.jobs: Dict[str, FetchJob] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[FetchJob]:
+        """Get the in-flight job for a key, if any"""
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None and job.running:
+            return job
+        return None
+
+    def running_jobs(self) -> List[FetchJob]:
+        with self.lock:
+            return [job for job in self.jobs.values() if job.running]
+
+    def submit(self,
+               key: str,
+               title: str,
+               fetch: Callable[[FetchJob], str],
+               window: Optional[sublime.Window] = None,
+               timeout: Optional[float] = None,
+               on_done: Optional[Callable[[FetchJob], None]] = None,
+               user_cancellable: bool = True) -> FetchJob:
+        """Start a fetch in a background thread unless one is already in flight for `key`
+
+        `fetch` returns a message to show in the status bar when it is done.
+        `on_done` is called on the main thread if the fetch succeeds, including
+        when it is the fetch already in flight. The job is cancelled after
+        `timeout` seconds (the `nextflow_fetch_timeout_s` setting by default).
+        Jobs that are not `user_cancellable` are left out of `cancellable_jobs`.
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            in_flight = job is not None and job.running
+            if not in_flight:
+                job = self.jobs[key] = FetchJob(key, title, user_cancellable)
+        if on_done is not None:
+            job.on_finish(lambda: on_done(job) if job.succeeded else None)
+        if in_flight:
+            return job
+        if timeout is None:
+            timeout = get_setting('nextflow_fetch_timeout_s', DEFAULT_TIMEOUT_S)
+        timer = threading.Timer(timeout, job.cancel)
+        timer.daemon = True
+        timer.start()
+        thread = threading.Thread(target=self._run, args=(job, fetch, window, timer), daemon=True)
+        thread.start()
+        if window is not None:
+            self._show_status(job, window)
+        return job
+
+    def _run(self,
+             job: FetchJob,
+             fetch: Callable[[FetchJob], str],
+             window: Optional[sublime.Window],
+             timer: threading.Timer) -> None:
+        try:
+            message = fetch(job)
+            job.check_cancelled()
+        except Exception as ex:
+            # aborting a subprocess or response on cancellation may surface as some other error
+            if job.cancelled:
+                message = f'Cancelled: {job.title}'
+            else:
+                job.error = ex
+                message = f'Failed: {job.title}: {ex}'
+        timer.cancel()
+        # other outcomes are only shown in the status bar
+        if job.error is not None:
+            print(message)
+        if window is not None:
+            sublime.set_timeout(lambda: window.status_message(message))
+        # finish callbacks are queued after the status message so that messages they show are not overwritten
+        job._finish()
+
+    def _show_status(self, job: FetchJob, window: sublime.Window) -> None:
+        if not job.running:
+            return
+        window.status_message(job.status())
+        sublime.set_timeout(lambda: self._show_status(job, window), STATUS_INTERVAL_MS)
+
+    def cancellable_jobs(self) -> List[FetchJob]:
+        """Get the running jobs that the user can cancel, e.g. fetches but not project indexing"""
+        return [job for job in self.running_jobs() if job.user_cancellable]
+
+    def cancel_all(self) -> None:
+        for job in self.cancellable_jobs():
+            job.cancel()
+
+
+# shared by all plugins
+fetcher = FetchCoordinator()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""File fingerprints and fingerprint-validated caches of parsed file contents
+
+A fingerprint is the modification time, size and inode of a file, which is
+cheap to get with a single ``stat`` call and changes whenever a file is
+rewritten, so parsed results only need to be recomputed for files that have
+actually changed.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+
+from .settings import get_setting
+
+Fingerprint = Tuple[int, int, int]
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_MB = 64
+
+T = TypeVar('T')
+
+
+def fingerprint(path: Path) -> Optional[Fingerprint]:
+    """Get the (mtime, size, inode) fingerprint of a file or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class CacheStats(NamedTuple):
+    name: str
+    entries: int
+    # total size of the files the cached values were parsed from
+    size_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class FileCache(Generic[T]):
+    """Cache of values parsed from files, re-parsing a file only when its fingerprint changes
+
+    Values are kept in least recently used order and evicted once the cache
+    holds more than ``nextflow_file_cache_max_entries`` values or values parsed
+    from more than ``nextflow_file_cache_max_mb`` of files. The most recently
+    used value is always kept.
+    """
+
+    def __init__(self, parse: Callable[[Path], T], name: Optional[str] = None):
+        self.parse = parse
+        self.name = name or parse.__name__
+        self.entries: 'OrderedDict[Path, Tuple[Fingerprint, T]]' = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        _caches.append(self)
+
+    def get(self, path: Path, default: Optional[T] = None) -> Optional[T]:
+        fp = fingerprint(path)
+        if fp is None:
+            self.invalidate(path)
+            return default
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == fp:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = self.parse(path)
+        self.put(path, fp, value)
+        return value
+
+    def put(self, path: Path, fp: Fingerprint, value: T) -> None:
+        """Cache a value parsed from a file with fingerprint `fp`, evicting least recently used values over budget"""
+        max_entries = max(1, get_setting('nextflow_file_cache_max_entries', DEFAULT_MAX_ENTRIES))
+        max_bytes = get_setting('nextflow_file_cache_max_mb', DEFAULT_MAX_MB) * 1024 * 1024
+        with self.lock:
+            self._pop(path)
+            self.entries[path] = (fp, value)
+            self.size_bytes += fp[1]
+            while len(self.entries) > 1 and (len(self.entries) > max_entries or self.size_bytes > max_bytes):
+                self._pop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _pop(self, path: Path) -> None:
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size_bytes -= entry[0][1]
+
+    def invalidate(self, path: Path) -> None:
+        with self.lock:
+            self._pop(path)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(self.name, len(self.entries), self.size_bytes, self.hits, self.misses, self.evictions)
+
+
+_caches: List[FileCache] = []
+
+
+def invalidate_cached(path: Path) -> None:
+    """Drop any cached values for a file from all file caches"""
+    for cache in _caches:
+        cache.invalidate(path)
+
+
+def cache_stats() -> List[CacheStats]:
+    """Get the size, hit, miss and eviction counts of all file caches"""
+    return [cache.stats() for cache in _caches]
+
+
+def reset_cache_stats() -> None:
+    for cache in _caches:
+        cache.reset_stats()
+
+
+def format_cache_stats(stats: List[CacheStats]) -> str:
+    width = max([len(x.name) for x in stats] + [len('cache')]) + 2
+    lines = [f'{"cache":<{width}} {"entries":>8} {"KiB":>10} {"hits":>8} {"misses":>8} {"evictions":>10}']
+    for x in stats:
+        lines.append(f'{x.name:<{width}} {x.entries:>8} {x.size_bytes / 1024:>10.1f} {x.hits:>8} {x.misses:>8} '
+                     f'{x.evictions:>10}')
+    return '\n'.join(lines)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""Project file walker that skips pipeline outputs, ignored files and symlinks
+
+Nextflow ``work/`` directories can hold millions of task directories and
+staged input data, so every feature that enumerates project files goes
+through `walk_files`, which uses ``os.scandir``, skips directories named in
+the ``nextflow_exclude_dirs`` setting, Conda environments and anything
+ignored by ``.gitignore`` files, and never follows symlinks.
+"""
+
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Pattern, Tuple
+
+from .files import FileCache
+from .settings import get_setting
+
+DEFAULT_EXCLUDE_DIRS = ['work', '.nextflow', 'results', '.git', '.hg', '.svn', 'node_modules', '__pycache__']
+GITIGNORE = '.gitignore'
+
+
+class IgnoreRule(NamedTuple):
+    regex: Pattern
+    negate: bool
+    dir_only: bool
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob to a regex matching paths relative to the .gitignore directory"""
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == n:
+            out.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif c == '*':
+            out.append('[^/]*')
+            i += 1
+        elif c == '?':
+            out.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = end + 1
+        elif c == '\\' and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ''.join(out)
+
+
+def parse_gitignore(path: Path) -> List[IgnoreRule]:
+    try:
+        lines = path.read_text().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+    rules = []
+    for line in lines:
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        # patterns with a slash other than at the end are relative to the .gitignore directory
+        anchored = '/' in line
+        line = line.lstrip('/')
+        prefix = '' if anchored else '(?:.*/)?'
+        try:
+            regex = re.compile(f'{prefix}{_translate(line)}$')
+        except re.error:
+            continue
+        rules.append(IgnoreRule(regex, negate, dir_only))
+    return rules
+
+
+gitignores: FileCache[List[IgnoreRule]] = FileCache(parse_gitignore)
+
+# .gitignore rules with the path of their directory relative to the walk root, e.g. `modules/`
+IgnoreRules = List[Tuple[str, List[IgnoreRule]]]
+
+
+def is_ignored(ignore_rules: IgnoreRules, rel_path: str, is_dir: bool) -> bool:
+    """Check whether a path relative to the walk root is ignored, with later (deeper) rules taking precedence"""
+    ignored = False
+    for base, rules in ignore_rules:
+        if not rel_path.startswith(base):
+            continue
+        sub_path = rel_path[len(base):]
+        for rule in rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.negate == ignored and rule.regex.match(sub_path):
+                ignored = not rule.negate
+    return ignored
+
+
+def exclude_patterns() -> List[str]:
+    return get_setting('nextflow_exclude_dirs', DEFAULT_EXCLUDE_DIRS)
+
+
+def is_excluded_dir(name: str, rel_path: str, patterns: List[str]) -> bool:
+    """Check a directory name or relative path against the exclude patterns, e.g. `work` or `tests/data/*`"""
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(rel_path if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def is_conda_env(path: str) -> bool:
+    return os.path.isdir(os.path.join(path, 'conda-meta'))
+
+
+def walk_files(root_dir: Path, suffixes: Tuple[str, ...], use_gitignore: Optional[bool] = None) -> Iterator[Path]:
+    """Iterate over files with any of `suffixes` under `root_dir`, skipping excluded and ignored directories
+
+    Symlinks to files and directories are never followed.
+    """
+    if use_gitignore is None:
+        use_gitignore = get_setting('nextflow_use_gitignore', True)
+    patterns = exclude_patterns()
+    # directories to visit with their path relative to the root and the .gitignore rules that apply to them
+    stack: List[Tuple[str, str, IgnoreRules]] = [(str(root_dir), '', [])]
+    while stack:
+        dir_path, rel_dir, ignore_rules = stack.pop()
+        if use_gitignore:
+            rules = gitignores.get(Path(dir_path) / GITIGNORE, [])
+            if rules:
+                ignore_rules = ignore_rules + [(rel_dir, rules)]
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        entries.sort(key=lambda x: x.name)
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            try:
+                if entry.is_symlink():
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if is_excluded_dir(entry.name, rel_path, patterns) or is_ignored(ignore_rules, rel_path, True):
+                    continue
+                if is_conda_env(entry.path):
+                    continue
+                subdirs.append((entry.path, rel_path + '/', ignore_rules))
+            elif entry.name.endswith(suffixes) and not is_ignored(ignore_rules, rel_path, False):
+                yield Path(entry.path)
+        # visit subdirectories in order
+        stack.extend(reversed(subdirs))
+
+
+def is_excluded(root_dir: Path, path: Path) -> bool:
+    """Check whether a file under `root_dir` would be skipped by `walk_files`"""
+    try:
+        parts = path.relative_to(root_dir).parts
+    except ValueError:
+        return False
+    patterns = exclude_patterns()
+    use_gitignore = get_setting('nextflow_use_gitignore', True)
+    ignore_rules: IgnoreRules = []
+    dir_path = root_dir
+    rel_dir = ''
+    for i, name in enumerate(parts):
+        if use_gitignore:
+            rules = gitignores.get(dir_path / GITIGNORE, [])
+            if rules:
+                ignore_rules = ignore_rules + [(rel_dir, rules)]
+        rel_path = rel_dir + name
+        is_dir = i < len(parts) - 1
+        if is_dir and is_excluded_dir(name, rel_path, patterns):
+            return True
+        if is_ignored(ignore_rules, rel_path, is_dir):
+            return True
+        dir_path = dir_path / name
+        if is_dir and is_conda_env(str(dir_path)):
+            return True
+        rel_dir = rel_path + '/'
+    return False
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Per-view map of names included from other scripts
+
+The ``include { A as B; C } from '...'`` statements of a view are parsed once
+into a map of name (or alias) to the original name and resolved script path,
+which is cached until the view's buffer changes.
+"""
+
+import re
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import sublime
+
+regex_include = re.compile(r'''^[ \t]*include\s*\{([^}]*)\}\s*from\s*['"]([^'"]+)['"]''', re.MULTILINE)
+regex_include_item = re.compile(r'(\w+)(?:\s+as\s+(\w+))?')
+
+
+class Include(NamedTuple):
+    # name of the definition in the included script
+    name: str
+    # resolved path of the included script or None for plugin includes
+    path: Optional[Path]
+
+
+def resolve_include_path(source: str, script_path: Optional[Path]) -> Optional[Path]:
+    if source.startswith('plugin/'):
+        return None
+    if not source.endswith('.nf'):
+        source += '.nf'
+    path = Path(source)
+    if not path.is_absolute():
+        if script_path is None:
+            return None
+        path = script_path.parent / path
+    return path.resolve()
+
+
+def parse_includes(text: str, script_path: Optional[Path]) -> Dict[str, Include]:
+    """Get a map of included name or alias to the included definition name and script path"""
+    out = {}
+    for m in regex_include.finditer(text):
+        names, source = m.groups()
+        path = resolve_include_path(source, script_path)
+        for item in regex_include_item.finditer(names):
+            name, alias = item.groups()
+            out[alias or name] = Include(name, path)
+    return out
+
+
+_view_includes: Dict[int, Tuple[int, Optional[str], Dict[str, Include]]] = {}
+_view_includes_lock = threading.Lock()
+
+
+def view_includes(view: sublime.View) -> Dict[str, Include]:
+    """Get the includes of a view, re-parsing them only if the buffer or file name has changed"""
+    change_count = view.change_count()
+    file_name = view.file_name()
+    with _view_includes_lock:
+        entry = _view_includes.get(view.id())
+    if entry is not None and entry[0] == change_count and entry[1] == file_name:
+        return entry[2]
+    text = view.substr(sublime.Region(0, view.size()))
+    includes = parse_includes(text, Path(file_name) if file_name else None)
+    with _view_includes_lock:
+        _view_includes[view.id()] = (change_count, file_name, includes)
+    return includes
+
+
+def forget_view(view_id: int) -> None:
+    with _view_includes_lock:
+        _view_includes.pop(view_id, None)
@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+"""Project-wide index of Nextflow process, workflow and function definitions
+
+The index is built once per project folder and maps each definition name to
+where it is defined, so that popups, completions and commands no longer need
+to walk and re-parse the whole project tree on every lookup. The channels and
+directives of definitions are only kept for recently used scripts, in a
+`FileCache` with a memory budget, so that the index stays small for projects
+with thousands of scripts. Indexes are built in the background, parsing
+scripts concurrently, and lookups answer from the partial index until the
+build is done.
+"""
+
+import json
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import sublime
+
+from .fetch import FetchJob, fetcher
+from .files import FileCache, Fingerprint, fingerprint
+from .fs import is_excluded, walk_files
+from .parsing import (
+    get_proc_directives,
+    get_proc_inputs,
+    get_proc_outputs,
+    get_wf_emits,
+    get_wf_takes,
+    process_sections,
+    regex_definition,
+    regex_function,
+    workflow_sections,
+)
+from .perf import span, timed
+from .settings import get_setting
+from .store import IndexStore, default_store
+from .tokenizer import Block, scan_blocks
+
+DEFAULT_INDEX_WORKERS = 4
+# indexing a huge project can take a while but should not be cut off like a stuck fetch
+INDEX_TIMEOUT_S = 3600
+# longest time background parsing waits for foreground lookups to finish
+LOOKUP_WAIT_S = 1
+
+
+class Definition:
+    """A process, workflow or function definition parsed from a Nextflow script"""
+
+    __slots__ = ('kind', 'name', 'path', 'span', 'inputs', 'outputs', 'directives')
+
+    def __init__(self,
+                 kind: str,
+                 name: str,
+                 path: Path,
+                 span: Tuple[int, int],
+                 inputs: Iterable[str] = (),
+                 outputs: Iterable[Tuple[str, str]] = (),
+                 directives: Iterable[Tuple[str, str]] = ()):
+        self.kind = sys.intern(kind)  # 'process', 'workflow' or 'function'
+        self.name = name
+        self.path = path
+        self.span = span
+        # process input or workflow take channels
+        self.inputs: Tuple[str, ...] = tuple(inputs)
+        # process output or workflow emit channels as (emit, channel) tuples
+        self.outputs: Tuple[Tuple[str, str], ...] = tuple(outputs)
+        # process resource directives and labels as (directive, value) tuples
+        self.directives: Tuple[Tuple[str, str], ...] = tuple(directives)
+
+    def __repr__(self) -> str:
+        return f'Definition({self.kind!r}, {self.name!r}, {str(self.path)!r}, {self.span!r})'
+
+    @property
+    def labels(self) -> List[str]:
+        return [value for directive, value in self.directives if directive == 'label']
+
+    def moved(self, offset: int) -> 'Definition':
+        """Get the definition with its span moved by `offset` characters"""
+        return Definition(self.kind, self.name, self.path, (self.span[0] + offset, self.span[1] + offset),
+                          self.inputs, self.outputs, self.directives)
+
+
+class IndexEntry:
+    """Where a definition is, kept in the index for every definition in a project"""
+
+    __slots__ = ('kind', 'name', 'path')
+
+    def __init__(self, kind: str, name: str, path: Path):
+        self.kind = sys.intern(kind)
+        self.name = name
+        self.path = path
+
+    def __repr__(self) -> str:
+        return f'IndexEntry({self.kind!r}, {self.name!r}, {str(self.path)!r})'
+
+
+def parse_definitions(text: str, path: Path, blocks: Dict[int, Block]) -> List[Definition]:
+    """Get all process and named workflow definitions in Nextflow script text"""
+    out = []
+    for m in regex_definition.finditer(text):
+        # skip matches in strings and comments, which have no block
+        block = blocks.get(m.end() - 1)
+        if block is None:
+            continue
+        kind, name = m.groups()
+        directives = []
+        if kind == 'process':
+            sections = process_sections(block)
+            inputs = get_proc_inputs(text, sections)
+            outputs = get_proc_outputs(text, sections)
+            directives = get_proc_directives(text, block)
+        else:
+            sections = workflow_sections(block)
+            inputs = get_wf_takes(text, sections)
+            outputs = get_wf_emits(text, sections)
+        out.append(Definition(kind, name, path, (m.start(), block.end + 1), inputs, outputs, directives))
+    return out
+
+
+def parse_functions(text: str, path: Path, blocks: Dict[int, Block]) -> List[Definition]:
+    """Get all function definitions in Nextflow script text"""
+    out = []
+    for m in regex_function.finditer(text):
+        block = blocks.get(m.end() - 1)
+        if block is None:
+            continue
+        out.append(Definition('function', m.group(1), path, (m.start(), block.end + 1), [], []))
+    return out
+
+
+def parse_nf_text(text: str, path: Path) -> List[Definition]:
+    """Get all process, named workflow and function definitions in Nextflow script text"""
+    blocks = scan_blocks(text)
+    return parse_definitions(text, path, blocks) + parse_functions(text, path, blocks)
+
+
+def definitions_to_json(definitions: List[Definition]) -> str:
+    return json.dumps([(d.kind, d.name, d.span, d.inputs, d.outputs, d.directives) for d in definitions])
+
+
+def entries_from_json(data: str, path: Path) -> List[IndexEntry]:
+    return [IndexEntry(kind, name, path) for kind, name, *_ in json.loads(data)]
+
+
+def index_entries(definitions: List[Definition]) -> List[IndexEntry]:
+    return [IndexEntry(defn.kind, defn.name, defn.path) for defn in definitions]
+
+
+def parse_nf_file(path: Path) -> List[Definition]:
+    with span('read'):
+        try:
+            text = path.read_text()
+        except (OSError, UnicodeDecodeError):
+            return []
+    with span('parse'):
+        return parse_nf_text(text, path)
+
+
+# definitions of recently used scripts, re-parsed once evicted
+parsed_scripts: FileCache[List[Definition]] = FileCache(parse_nf_file)
+# definitions of scripts looked up from outside a project or in its excluded directories, which are not indexed
+outside_scripts: FileCache[List[Definition]] = FileCache(parse_nf_file, 'parse_nf_file_outside')
+
+
+class ProjectIndex:
+    """Definitions in all Nextflow scripts under a project root directory
+
+    Each script is stored with its fingerprint so that lookups only re-parse
+    scripts that have changed on disk since they were last parsed. If a store
+    is given, parsed definitions are persisted so that a new session only needs
+    to re-parse scripts that changed since the index was last built.
+    """
+
+    def __init__(self, root_dir: Path, store: Optional[IndexStore] = None):
+        self.root_dir = root_dir
+        self.store = store
+        self.files: Dict[Path, List[IndexEntry]] = {}
+        self.fingerprints: Dict[Path, Fingerprint] = {}
+        self.names: Dict[str, List[IndexEntry]] = {}
+        # scripts added from the store as of the last build that have not been checked against the file yet
+        self.unchecked: Dict[Path, Fingerprint] = {}
+        self.built = False
+        self.job: Optional[FetchJob] = None
+        self.lock = threading.RLock()
+        # number of foreground lookups in progress, which background parsing yields to
+        self.lookups = 0
+        self.idle = threading.Condition()
+
+    def start_build(self, window: Optional[sublime.Window] = None) -> Optional[FetchJob]:
+        """Start building the index in the background unless it is built or being built
+
+        Lookups answer from the partial index while it is being built.
+        """
+        with self.lock:
+            if self.built:
+                return None
+            if self.job is not None and self.job.running:
+                return self.job
+            self.job = fetcher.submit(f'project_index:{self.root_dir}',
+                                      f'Indexing Nextflow scripts in {self.root_dir.name}',
+                                      self._build,
+                                      window,
+                                      timeout=INDEX_TIMEOUT_S,
+                                      user_cancellable=False)
+            return self.job
+
+    def building(self) -> Optional[FetchJob]:
+        """Get the build job if the index is being built"""
+        with self.lock:
+            if self.job is not None and self.job.running:
+                return self.job
+            return None
+
+    def build(self) -> None:
+        """Build the index, waiting for it to be built"""
+        job = self.start_build()
+        if job is not None:
+            job.wait()
+
+    @contextmanager
+    def lookup(self) -> Iterator[None]:
+        """Mark a foreground lookup so that background parsing yields to it"""
+        with self.idle:
+            self.lookups += 1
+        try:
+            yield
+        finally:
+            with self.idle:
+                self.lookups -= 1
+                self.idle.notify_all()
+
+    def _wait_for_lookups(self) -> None:
+        with self.idle:
+            self.idle.wait_for(lambda: self.lookups == 0, timeout=LOOKUP_WAIT_S)
+
+    @timed('index.parse_script')
+    def _parse(self, job: FetchJob, path: Path) -> Optional[List[Definition]]:
+        self._wait_for_lookups()
+        if job.cancelled:
+            return None
+        return parse_nf_file(path)
+
+    def _add_stored(self, stored: Dict[str, Tuple[Fingerprint, str]]) -> None:
+        """Add the definitions stored by the last build so that they can be listed while the project is walked"""
+        with self.lock:
+            for key, (fp, data) in stored.items():
+                path = Path(key)
+                if path in self.fingerprints:
+                    continue
+                try:
+                    entries = entries_from_json(data, path)
+                except (ValueError, TypeError):
+                    continue
+                self._add(path, fp, entries)
+                self.unchecked[path] = fp
+
+    @timed('index.build')
+    def _build(self, job: FetchJob) -> str:
+        """Add stored definitions of unchanged scripts and parse the other scripts concurrently"""
+        stored = self.store.load(self.root_dir) if self.store else {}
+        self._add_stored(stored)
+        to_parse = []
+        n_scripts = 0
+        with span('walk'):
+            paths = list(walk_files(self.root_dir, ('.nf',)))
+        for path in paths:
+            job.check_cancelled()
+            n_scripts += 1
+            path = path.resolve()
+            with self.lock:
+                # already indexed by a cancelled build or a foreground lookup
+                if path in self.fingerprints and path not in self.unchecked:
+                    stored.pop(str(path), None)
+                    continue
+            fp = fingerprint(path)
+            if fp is None:
+                continue
+            key = str(path)
+            try:
+                stored_fp, data = stored.pop(key)
+            except KeyError:
+                stored_fp, data = None, None
+            if fp == stored_fp:
+                with self.lock:
+                    if self.unchecked.pop(path, None) == fp:
+                        continue
+                try:
+                    entries = entries_from_json(data, path)
+                    with self.lock:
+                        if path not in self.fingerprints:
+                            self._add(path, fp, entries)
+                    continue
+                except (ValueError, TypeError):
+                    pass
+            to_parse.append((path, fp))
+        changed = []
+        n_workers = max(1, get_setting('nextflow_index_workers', DEFAULT_INDEX_WORKERS))
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(self._parse, job, path): (path, fp) for path, fp in to_parse}
+            for i, future in enumerate(as_completed(futures), start=1):
+                path, fp = futures[future]
+                definitions = future.result()
+                if definitions is None:
+                    continue
+                with self.lock:
+                    # a script updated by a foreground lookup in the meantime is already up-to-date
+                    if path in self.fingerprints and path not in self.unchecked:
+                        continue
+                    self._remove(path)
+                    self._add(path, fp, index_entries(definitions))
+                changed.append((str(path), fp, definitions_to_json(definitions)))
+                job.set_progress(f'{i}/{len(to_parse)} scripts parsed')
+        if self.store:
+            # save what was parsed even if cancelled so that it does not need to be parsed again
+            self.store.save(self.root_dir, changed)
+        job.check_cancelled()
+        if self.store:
+            # scripts that were deleted since the index was stored
+            self.store.delete(self.root_dir, stored)
+        with self.lock:
+            for path in self.unchecked:
+                self._remove(path)
+            self.unchecked.clear()
+            self.built = True
+        return f'Indexed {n_scripts} Nextflow scripts in {self.root_dir} ({len(to_parse)} parsed)'
+
+    def _add(self, path: Path, fp: Fingerprint, entries: List[IndexEntry]) -> None:
+        self.files[path] = entries
+        self.fingerprints[path] = fp
+        for entry in entries:
+            self.names.setdefault(entry.name, []).append(entry)
+
+    def _remove(self, path: Path) -> None:
+        self.fingerprints.pop(path, None)
+        self.unchecked.pop(path, None)
+        for entry in self.files.pop(path, []):
+            entries = self.names.get(entry.name)
+            if entries is None:
+                continue
+            entries.remove(entry)
+            if not entries:
+                del self.names[entry.name]
+
+    def contains(self, path: Path) -> bool:
+        try:
+            path.relative_to(self.root_dir)
+        except ValueError:
+            return False
+        return not is_excluded(self.root_dir, path)
+
+    def update_file(self, path: Path) -> bool:
+        """Re-parse a script if its fingerprint has changed, returning whether it changed
+
+        Scripts outside the project root or in excluded directories are not
+        indexed. The script is parsed and stored without holding the lock so
+        that other lookups are not blocked on disk I/O.
+        """
+        fp = fingerprint(path) if self.contains(path) else None
+        with self.lock:
+            if fp == self.fingerprints.get(path):
+                self.unchecked.pop(path, None)
+                return False
+            known = path in self.files
+            if fp is None:
+                self._remove(path)
+        if fp is None:
+            if self.store and known:
+                self.store.delete(self.root_dir, [str(path)])
+            return known
+        definitions = parse_nf_file(path)
+        parsed_scripts.put(path, fp, definitions)
+        with self.lock:
+            self._remove(path)
+            self._add(path, fp, index_entries(definitions))
+        if self.store:
+            self.store.save(self.root_dir, [(str(path), fp, definitions_to_json(definitions))])
+        return True
+
+    def file_definitions(self, path: Path) -> List[Definition]:
+        """Get up-to-date definitions in a script, parsing it if it has changed or is outside the project"""
+        self.start_build()
+        if not self.contains(path):
+            return outside_scripts.get(path, [])
+        with self.lookup():
+            self.update_file(path)
+            return parsed_scripts.get(path, [])
+
+    def find(self, name: str, path: Optional[Path] = None) -> Optional[Definition]:
+        """Find a definition by name, preferring the one in `path` if specified
+
+        Returns right away with what the partial index has while it is being
+        built, so callers should look up names not found again once `building`
+        is done.
+        """
+        if path is not None:
+            for defn in self.file_definitions(path):
+                if defn.name == name:
+                    return defn
+        self.start_build()
+        with self.lookup():
+            with self.lock:
+                entries = self.names.get(name)
+                if not entries:
+                    return None
+                path = entries[0].path
+            # make sure the definition has not been changed or removed since it was indexed
+            if self.update_file(path):
+                with self.lock:
+                    entries = self.names.get(name)
+                    if not entries:
+                        return None
+                    path = entries[0].path
+            for defn in parsed_scripts.get(path, []):
+                if defn.name == name:
+                    return defn
+            return None
+
+    def definitions(self, *kinds: str) -> Iterator[IndexEntry]:
+        """Iterate over where all definitions of some kinds are in order of path and position
+
+        Definitions stored by the last build are listed while the project is being walked.
+        """
+        self.start_build()
+        with self.lock:
+            files = [entries for _, entries in sorted(self.files.items(), key=lambda x: str(x[0]))]
+        for entries in files:
+            for entry in entries:
+                if entry.kind in kinds:
+                    yield entry
+
+    def short_path(self, path: Path) -> str:
+        return str(path.absolute()).replace(str(self.root_dir.absolute()) + '/', '')
+
+
+_indexes: Dict[Path, ProjectIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def file_changed(path: Path) -> None:
+    """Update indexes that contain a saved, loaded, closed or deleted Nextflow script"""
+    path = path.resolve()
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        if index.contains(path) or path in index.files:
+            index.update_file(path)
+
+
+def forget_roots(open_roots: Iterable[Path]) -> None:
+    """Drop indexes for project folders that are no longer open in any window"""
+    open_roots = {x.resolve() for x in open_roots}
+    with _indexes_lock:
+        for root_dir in list(_indexes):
+            if root_dir not in open_roots:
+                del _indexes[root_dir]
+
+
+def get_index(root_dir: Path) -> ProjectIndex:
+    """Get the shared definitions index for a project root directory"""
+    root_dir = root_dir.resolve()
+    with _indexes_lock:
+        try:
+            return _indexes[root_dir]
+        except KeyError:
+            index = _indexes[root_dir] = ProjectIndex(root_dir, default_store())
+            return index
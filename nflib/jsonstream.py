@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Incremental parsing of large top-level JSON objects
+
+Only one top-level value is held in memory at a time, so huge outputs like
+``conda search --json`` can be processed as they are streamed from a
+subprocess instead of being buffered and decoded in one go.
+"""
+
+import codecs
+import json
+from typing import Any, BinaryIO, Iterator, Tuple
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+class _Buffer:
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = 0) -> bool:
+        """Read more text, dropping consumed text; returns False at end of stream"""
+        if self.eof:
+            return False
+        data = self.stream.read(size or CHUNK_SIZE)
+        self.eof = not data
+        self.text = self.text[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def skip(self, chars: str) -> None:
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def peek(self) -> str:
+        self.skip(_whitespace)
+        return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f'Expected "{char}" at "{self.text[self.pos:self.pos + 20]}"')
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decode the next JSON value, reading more of the stream until the value is complete"""
+        self.skip(_whitespace)
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # grow reads with the buffer so that a value spanning many chunks is not re-parsed many times
+                if not self.fill(max(CHUNK_SIZE, len(self.text))):
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.text) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_object_items(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    """Iterate over the (key, value) pairs of a JSON object read from a binary stream"""
+    buf = _Buffer(stream)
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+    while True:
+        key = buf.decode()
+        buf.expect(':')
+        yield key, buf.decode()
+        char = buf.peek()
+        buf.pos += 1
+        if char == '}':
+            return
+        if char != ',':
+            raise ValueError(f'Expected "," or "}}" but got "{char}"')
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Pipeline params merged from config files, scripts and the params schema
+
+Params are taken from the ``params`` scopes and ``params.x = ...``
+assignments of ``nextflow.config`` and the configs it includes, from
+``params.x = ...`` assignments in the Nextflow scripts in the project root
+directory and from ``nextflow_schema.json``. The merged params are only
+recomputed when one of their sources has changed.
+"""
+
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .files import FileCache
+from .perf import span
+from .configs import VALUE_PATTERN, Param, collapse_value, get_config_model
+from .schema import SCHEMA_FILENAME, get_schema
+
+regex_script_param = re.compile(r'^[ \t]*params\.(\w+)\s*=[ \t]*(' + VALUE_PATTERN + ')', re.MULTILINE)
+
+
+class ParamInfo(NamedTuple):
+    name: str
+    value: str
+    # where the param is set, e.g. `nextflow.config:12` or `nextflow_schema.json`
+    source: str
+    profile: Optional[str]
+    # completion annotation and popup details
+    annotation: str
+    details: str
+
+
+def read_script_params(path: Path) -> List[Param]:
+    with span('read'):
+        try:
+            text = path.read_text()
+        except (OSError, UnicodeDecodeError):
+            return []
+    out = []
+    for m in regex_script_param.finditer(text):
+        name, value = m.groups()
+        out.append(Param(name, collapse_value(value), path, text.count('\n', 0, m.start()), None))
+    return out
+
+
+script_params: FileCache[List[Param]] = FileCache(read_script_params)
+
+
+def param_info(root_dir: Path, param: Param, description: str = '') -> ParamInfo:
+    try:
+        short_path = str(param.path.relative_to(root_dir))
+    except ValueError:
+        short_path = str(param.path)
+    source = f'{short_path}:{param.line + 1}'
+    annotation = f'default: {param.value}'
+    if param.profile is not None:
+        annotation = f'profile {param.profile}: {param.value}'
+    details = f'<i>{source}</i>: <code>params.<b>{param.name}</b> = {param.value}</code>'
+    if description:
+        details = f'{description}<br>{details}'
+    return ParamInfo(param.name, param.value, source, param.profile, annotation, details)
+
+
+def merge_params(root_dir: Path,
+                 config_params: List[Param],
+                 scripts_params: List[Param],
+                 schema_params: Dict[str, dict]) -> Dict[str, ParamInfo]:
+    """Merge params, with config values taking precedence over script values and both over schema defaults
+
+    Params only set in profiles are included with the value of the first
+    profile setting them.
+    """
+    params: Dict[str, Param] = {}
+    profile_params: Dict[str, Param] = {}
+    for param in scripts_params:
+        params.setdefault(param.name, param)
+    for param in config_params:
+        if param.profile is None:
+            params[param.name] = param
+        else:
+            profile_params.setdefault(param.name, param)
+    for name, param in profile_params.items():
+        params.setdefault(name, param)
+    out = {}
+    for name, param in params.items():
+        description = schema_params.get(name, {}).get('description', '')
+        out[name] = param_info(root_dir, param, description)
+    for name, info in schema_params.items():
+        if name in out:
+            continue
+        value = str(info.get('default', ''))
+        description = info.get('description', '')
+        details = f'<i>{SCHEMA_FILENAME}</i>: <code>params.<b>{name}</b></code>'
+        if description:
+            details = f'{description}<br>{details}'
+        out[name] = ParamInfo(name, value, SCHEMA_FILENAME, None, f'default: {value}', details)
+    return out
+
+
+class ParamsModel:
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        # config model version and the parsed schema and script params the params were merged from
+        self.sources: Optional[Tuple[int, object, List[List[Param]]]] = None
+        self.params: Dict[str, ParamInfo] = {}
+        self.lock = threading.Lock()
+
+    def _unchanged(self, sources: Tuple[int, object, List[List[Param]]]) -> bool:
+        # cached values are replaced rather than mutated when their files change
+        if self.sources is None:
+            return False
+        version, schema, scripts = self.sources
+        return (version == sources[0]
+                and schema is sources[1]
+                and len(scripts) == len(sources[2])
+                and all(a is b for a, b in zip(scripts, sources[2])))
+
+    def get(self) -> Dict[str, ParamInfo]:
+        """Get the merged params, re-merging them only if a config file, root script or the schema changed"""
+        config = get_config_model(self.root_dir)
+        schema = get_schema(self.root_dir)
+        scripts = [script_params.get(path.resolve(), []) for path in sorted(self.root_dir.glob('*.nf'))]
+        sources = (config.version, schema, scripts)
+        with self.lock:
+            if not self._unchanged(sources):
+                with span('parse'):
+                    self.params = merge_params(
+                        self.root_dir,
+                        config.params,
+                        [x for params in scripts for x in params],
+                        schema.params if schema is not None else {},
+                    )
+                self.sources = sources
+            return self.params
+
+
+_models: Dict[Path, ParamsModel] = {}
+_models_lock = threading.Lock()
+
+
+def forget_params_roots(open_roots: Iterable[Path]) -> None:
+    """Drop params models for project folders that are no longer open in any window"""
+    open_roots = {x.resolve() for x in open_roots}
+    with _models_lock:
+        for root_dir in list(_models):
+            if root_dir not in open_roots:
+                del _models[root_dir]
+
+
+def get_params(root_dir: Path) -> Dict[str, ParamInfo]:
+    """Get the params of a project keyed by name"""
+    root_dir = root_dir.resolve()
+    with _models_lock:
+        model = _models.get(root_dir)
+        if model is None:
+            model = _models[root_dir] = ParamsModel(root_dir)
+    return model.get()
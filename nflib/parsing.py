@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import re
+from typing import Dict, Tuple, List
+
+from .tokenizer import Block
+
+# regex to find output channels with emit
+regex_output_channel = re.compile(r'(.*?),\s*emit:\s*(\w+)', re.DOTALL)
+regex_wf_emit = re.compile(r'(\w+)\s*=\s*(.*)')
+
+# process, named workflow and function definitions
+regex_definition = re.compile(r'^[ \t]*(process|workflow)\s+(\w+)\s*\{', re.MULTILINE)
+regex_function = re.compile(r'^[ \t]*def\s+(\w+)\s*\([^\)]*\)\s*\{', re.MULTILINE)
+
+# directive lines like `cpus 2` or `label 'process_low'` before the first section of a process
+regex_directive = re.compile(r'^[ \t]*(\w+)[ \t]+(.+?)[ \t]*$', re.MULTILINE)
+RESOURCE_DIRECTIVES = ('label', 'cpus', 'memory', 'time', 'disk', 'accelerator', 'queue', 'executor',
+                       'errorStrategy', 'maxRetries', 'maxErrors', 'maxForks')
+
+PROCESS_SECTIONS = ('input', 'output', 'when', 'script', 'shell', 'exec', 'stub')
+WORKFLOW_SECTIONS = ('take', 'main', 'emit')
+
+Sections = Dict[str, Tuple[int, int]]
+
+
+def section_lines(text: str, span: Tuple[int, int]) -> List[str]:
+    """Get the non-empty, non-comment lines of a section"""
+    out = []
+    for line in text[span[0]:span[1]].split('\n'):
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        out.append(line)
+    return out
+
+
+def get_output_channels(text: str, start: int, end: int) -> List[Tuple[str, str]]:
+    out = []
+    for m in regex_output_channel.finditer(text, start, end):
+        chan, emit = m.groups()
+        chan = ''.join(x.strip() for x in chan.split('\n'))
+        out.append((emit, chan))
+    return out
+
+
+def get_wf_emit_channels(text: str, start: int, end: int) -> List[Tuple[str, str]]:
+    out = []
+    for m in regex_wf_emit.finditer(text, start, end):
+        chan, emit = m.groups()
+        out.append((chan, emit))
+    return out
+
+
+def output_section_lines(text: str, span: Tuple[int, int]) -> List[Tuple[int, str]]:
+    return list(enumerate(section_lines(text, span)))
+
+
+def process_sections(block: Block) -> Sections:
+    return block.sections(PROCESS_SECTIONS)
+
+
+def workflow_sections(block: Block) -> Sections:
+    return block.sections(WORKFLOW_SECTIONS)
+
+
+def get_proc_inputs(text: str, sections: Sections) -> List[str]:
+    span = sections.get('input')
+    if span is None:
+        return []
+    return section_lines(text, span)
+
+
+def get_proc_outputs(text: str, sections: Sections) -> List[Tuple[str, str]]:
+    span = sections.get('output')
+    if span is None:
+        return []
+    out = get_output_channels(text, *span)
+    if not out:
+        out = output_section_lines(text, span)
+    return out
+
+
+def get_proc_directives(text: str, block: Block) -> List[Tuple[str, str]]:
+    """Get the resource directives and labels of a process as (directive, value) tuples"""
+    end = block.labels[0][1] if block.labels else block.end
+    out = []
+    for m in regex_directive.finditer(text, block.start + 1, end):
+        directive, value = m.groups()
+        if directive not in RESOURCE_DIRECTIVES:
+            continue
+        if directive == 'label':
+            value = value.strip('\'"')
+        out.append((directive, value))
+    return out
+
+
+def get_wf_takes(text: str, sections: Sections) -> List[str]:
+    span = sections.get('take')
+    if span is None:
+        return []
+    return section_lines(text, span)
+
+
+def get_wf_emits(text: str, sections: Sections) -> List[Tuple[str, str]]:
+    span = sections.get('emit')
+    if span is None:
+        return []
+    out = get_wf_emit_channels(text, *span)
+    if not out:
+        out = output_section_lines(text, span)
+    return out
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Latency of listener and command entry points and the steps they spend time in
+
+Entry points are wrapped with `timed(feature)` and steps within them like
+walking the project tree, reading and parsing files and rendering popup HTML
+with `span(step)`. The durations of the last `WINDOW_SIZE` calls of each
+feature and step are kept to report counts and p50/p95/max latencies. The
+next ``nextflow_profile_calls`` entry point calls are also run under cProfile
+with a stats dump written for each.
+"""
+
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, TypeVar
+
+from .cache import cache_dir
+from .settings import get_setting
+
+# number of most recent durations kept per feature or step
+WINDOW_SIZE = 1000
+PROFILES_DIRNAME = 'profiles'
+
+F = TypeVar('F', bound=Callable)
+
+
+class Stats(NamedTuple):
+    name: str
+    calls: int
+    p50_ms: float
+    p95_ms: float
+    max_ms: float
+
+
+def percentile(sorted_values: List[float], p: int) -> float:
+    """Nearest-rank percentile of non-empty sorted values"""
+    return sorted_values[max((len(sorted_values) * p + 99) // 100, 1) - 1]
+
+
+class Histogram:
+    """Rolling window of durations with the total number of durations recorded"""
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self.durations: Deque[float] = deque(maxlen=size)
+        self.calls = 0
+
+    def add(self, seconds: float) -> None:
+        self.durations.append(seconds)
+        self.calls += 1
+
+    def stats(self, name: str) -> Stats:
+        durations = sorted(self.durations)
+        if not durations:
+            return Stats(name, self.calls, 0.0, 0.0, 0.0)
+        return Stats(name, self.calls, percentile(durations, 50) * 1000, percentile(durations, 95) * 1000,
+                     durations[-1] * 1000)
+
+
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+# features being run by each thread, innermost last
+_local = threading.local()
+_profiled_calls = 0
+
+
+def record(name: str, seconds: float) -> None:
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+
+
+def _features() -> List[str]:
+    features = getattr(_local, 'features', None)
+    if features is None:
+        features = _local.features = []
+    return features
+
+
+@contextmanager
+def span(step: str) -> Iterator[None]:
+    """Time a step like `walk`, `read`, `parse` or `render`, recorded as `feature/step` within an entry point"""
+    features = _features()
+    name = f'{features[-1]}/{step}' if features else step
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def _start_profile() -> Optional['cProfile.Profile']:
+    global _profiled_calls
+    max_calls = get_setting('nextflow_profile_calls', 0)
+    with _lock:
+        if _profiled_calls >= max_calls:
+            return None
+        _profiled_calls += 1
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # another profiler is active in this thread
+        return None
+    return profile
+
+
+def _dump_profile(profile: 'cProfile.Profile', feature: str) -> None:
+    profile.disable()
+    out_dir = profiles_dir()
+    path = out_dir / f'{feature}-{time.strftime("%Y%m%d-%H%M%S")}-{_profiled_calls}.prof'
+    try:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(path))
+    except OSError as ex:
+        print(f'Could not write profile {path}: {ex}')
+        return
+    print(f'Wrote profile of {feature} to {path}')
+
+
+def timed(feature: str) -> Callable[[F], F]:
+    """Decorate a listener or command entry point to record its latency as `feature`"""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            features = _features()
+            # nested entry points, e.g. a command running another command, are only profiled as a whole
+            profile = _start_profile() if not features else None
+            features.append(feature)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(feature, time.perf_counter() - start)
+                features.pop()
+                if profile is not None:
+                    _dump_profile(profile, feature)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def all_stats() -> List[Stats]:
+    """Get the stats of every feature, each followed by the stats of its steps"""
+    # listener threads record durations while the stats are computed
+    with _lock:
+        return [histogram.stats(name) for name, histogram in sorted(_histograms.items())]
+
+
+def reset() -> None:
+    global _profiled_calls
+    with _lock:
+        _histograms.clear()
+        _profiled_calls = 0
+
+
+def profiles_dir() -> Path:
+    return cache_dir() / PROFILES_DIRNAME
+
+
+def format_stats(stats: List[Stats]) -> str:
+    """Format stats as a table with steps indented under their feature"""
+    width = max([len(x.name) for x in stats] + [len('feature')]) + 2
+    lines = [f'{"feature":<{width}} {"calls":>8} {"p50 ms":>10} {"p95 ms":>10} {"max ms":>10}']
+    for x in stats:
+        feature, _, step = x.name.partition('/')
+        name = f'  {step}' if step else feature
+        lines.append(f'{name:<{width}} {x.calls:>8} {x.p50_ms:>10.2f} {x.p95_ms:>10.2f} {x.max_ms:>10.2f}')
+    return '\n'.join(lines)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Debounced, cancellable cursor-driven popups
+
+Selection modified events are coalesced per view so that only the last cursor
+position is looked up once the cursor has stopped moving for a short delay.
+Work is dropped if the view has been edited or the selection has moved on by
+the time it runs, and a popup is never shown for a stale position.
+"""
+
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import sublime
+
+from .settings import get_setting
+
+DEFAULT_POPUP_DELAY_MS = 150
+
+ViewState = Tuple[int, Tuple[Tuple[int, int], ...]]
+
+
+def view_state(view: sublime.View) -> ViewState:
+    return view.change_count(), tuple((region.a, region.b) for region in view.sel())
+
+
+class PopupScheduler:
+    """Run popup lookups for the latest selection of each view after a delay"""
+
+    def __init__(self):
+        self.pending: Dict[int, int] = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def schedule(self, view: sublime.View, get_popup: Callable[[sublime.View], Optional[str]]) -> None:
+        """Schedule `get_popup` to run for the current view state, replacing any pending lookup for the view
+
+        `get_popup` returns the popup HTML to show or None to show nothing.
+        """
+        state = view_state(view)
+        with self.lock:
+            self.counter += 1
+            token = self.counter
+            self.pending[view.id()] = token
+        delay = get_setting('nextflow_popup_delay_ms', DEFAULT_POPUP_DELAY_MS)
+        sublime.set_timeout_async(lambda: self._run(view, token, state, get_popup), delay)
+
+    def _is_current(self, view: sublime.View, token: int, state: ViewState) -> bool:
+        with self.lock:
+            if self.pending.get(view.id()) != token:
+                return False
+        return view.is_valid() and view_state(view) == state
+
+    def _run(self, view: sublime.View, token: int, state: ViewState,
+             get_popup: Callable[[sublime.View], Optional[str]]) -> None:
+        try:
+            if not self._is_current(view, token, state):
+                return
+            html = get_popup(view)
+            if not html or not self._is_current(view, token, state):
+                return
+            view.show_popup(html)
+        finally:
+            # the view's entry is dropped once its latest lookup has run, so closed views are not kept around
+            with self.lock:
+                if self.pending.get(view.id()) == token:
+                    del self.pending[view.id()]
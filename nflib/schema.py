@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Param info from a pipeline's ``nextflow_schema.json``
+
+The schema is loaded once and flattened into a dict of param name to param
+info, with params from top-level ``properties`` and from groups under
+``definitions`` or ``$defs`` (as referenced by ``allOf``), with any ``$ref``
+resolved, so looking up a param is a single dict access. Popup HTML is
+rendered at most once per param.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .files import FileCache
+from .perf import span
+
+SCHEMA_FILENAME = 'nextflow_schema.json'
+# give up on `$ref` chains this long, which are most likely cyclic
+MAX_REF_DEPTH = 20
+
+
+def resolve_ref(schema: dict, ref: str) -> dict:
+    """Resolve a local JSON pointer like `#/definitions/input_output_options` or `#/$defs/x`"""
+    if not ref.startswith('#'):
+        return {}
+    node: Any = schema
+    for part in ref[1:].split('/'):
+        if not part:
+            continue
+        part = part.replace('~1', '/').replace('~0', '~')
+        if not isinstance(node, dict) or part not in node:
+            return {}
+        node = node[part]
+    return node if isinstance(node, dict) else {}
+
+
+def resolve(schema: dict, node: dict, depth: int = 0) -> dict:
+    """Resolve `$ref` and merge `allOf` subschemas of a schema node"""
+    if depth > MAX_REF_DEPTH:
+        return node
+    if '$ref' in node:
+        node = {**resolve(schema, resolve_ref(schema, node['$ref']), depth + 1),
+                **{k: v for k, v in node.items() if k != '$ref'}}
+    if 'allOf' in node:
+        merged: Dict[str, Any] = {}
+        properties: Dict[str, Any] = {}
+        for subschema in node['allOf']:
+            if isinstance(subschema, dict):
+                subschema = resolve(schema, subschema, depth + 1)
+                properties.update(subschema.get('properties', {}))
+                merged.update(subschema)
+        merged.update({k: v for k, v in node.items() if k != 'allOf'})
+        if properties:
+            merged['properties'] = {**properties, **node.get('properties', {})}
+        node = merged
+    return node
+
+
+def flatten_schema(schema: dict) -> Dict[str, dict]:
+    """Get the info of every param in a schema keyed by param name
+
+    Params are taken from top-level `properties` and the groups in
+    `definitions` or `$defs` referenced by `allOf`. If there is no `allOf`,
+    every group is taken to be a group of params.
+    """
+    params: Dict[str, dict] = {}
+
+    def add_properties(node: dict) -> None:
+        for name, info in node.get('properties', {}).items():
+            if isinstance(info, dict) and name not in params:
+                params[name] = resolve(schema, info)
+
+    add_properties(resolve(schema, schema))
+    if 'allOf' in schema:
+        return params
+    for key in ('definitions', '$defs'):
+        groups = schema.get(key)
+        if isinstance(groups, dict):
+            for group in groups.values():
+                if isinstance(group, dict):
+                    add_properties(resolve(schema, group))
+    return params
+
+
+def format_param_info(param_info: dict) -> str:
+    param_type = param_info.get('type', 'string')
+    default = param_info.get('default', '?')
+    description = param_info.get('description', 'N/A')
+    out = ''
+    out += f'<p>{description}</p>'
+    out += (
+        f'<p><b>Type:</b> <code>{param_type}</code></p>'
+        f'<p><b>Default:</b> <code>{default}</code></p>'
+    )
+    if 'pattern' in param_info:
+        out += f'<p><b>Pattern:</b> <code>{param_info["pattern"]}</code><p>'
+    if 'enum' in param_info:
+        enum = param_info['enum']
+        if isinstance(enum, list):
+            enum = ', '.join(sorted(str(x) for x in enum))
+        out += f'<p><b>Enum:</b> {enum}</p>'
+    if 'help_text' in param_info:
+        out += f'<p><i>{param_info["help_text"]}</i><p>'
+    return out
+
+
+class ParamsSchema:
+    def __init__(self, params: Dict[str, dict]):
+        self.params = params
+        self.popups: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def info(self, param: str) -> dict:
+        return self.params.get(param, {})
+
+    def popup_html(self, param: str) -> str:
+        """Get the popup HTML for a param, rendering it on first use"""
+        with self.lock:
+            html = self.popups.get(param)
+        if html is None:
+            with span('render'):
+                html = format_param_info(self.info(param))
+            with self.lock:
+                self.popups[param] = html
+        return html
+
+
+def load_schema(path: Path) -> Optional[ParamsSchema]:
+    with span('read'):
+        try:
+            with open(path) as fh:
+                schema = json.load(fh)
+        except (OSError, ValueError) as ex:
+            print(f'Could not load params schema {path}: {ex}')
+            return None
+    if not isinstance(schema, dict):
+        return None
+    with span('parse'):
+        return ParamsSchema(flatten_schema(schema))
+
+
+schemas: FileCache[Optional[ParamsSchema]] = FileCache(load_schema)
+
+
+def get_schema(root_dir: Path) -> Optional[ParamsSchema]:
+    """Get the params schema of a project, reloading it only when the schema file changes"""
+    return schemas.get((root_dir / SCHEMA_FILENAME).resolve())
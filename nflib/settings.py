@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+
+from typing import Any
+
+import sublime
+
+SETTINGS_FILE = 'Nextflow.sublime-settings'
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """Get a sublime-nextflow setting from Nextflow.sublime-settings"""
+    return sublime.load_settings(SETTINGS_FILE).get(name, default)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Definitions of Nextflow scripts read from open views, falling back to the project index
+
+Scripts that are open in a view are read from the view's buffer so that
+unsaved edits are taken into account without reading the file from disk.
+Process and workflow definitions are located with the scopes the Nextflow
+syntax has already assigned to the buffer, so only their text needs to be
+parsed, and the definitions of a view are cached until its buffer changes.
+Scripts that are not open are looked up in the project index.
+"""
+
+import threading
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import sublime
+
+from .index import Definition, ProjectIndex, parse_definitions, parse_functions, parse_nf_text
+from .perf import span
+from .tokenizer import scan_blocks
+from .views import is_nextflow
+
+DEFINITION_SELECTOR = 'meta.definition.process.nextflow | meta.definition.workflow.nextflow'
+FUNCTION_SELECTOR = 'meta.definition.method.nextflow'
+
+
+def find_open_view(path: Path) -> Optional[sublime.View]:
+    """Get a fully loaded view of a file if it is open in any window"""
+    for window in sublime.windows():
+        view = window.find_open_file(str(path))
+        if view is not None and not view.is_loading():
+            return view
+    return None
+
+
+def parse_view(view: sublime.View, path: Path) -> List[Definition]:
+    """Get the definitions in a view, parsing only the regions scoped as definitions"""
+    with span('read'):
+        text = view.substr(sublime.Region(0, view.size()))
+    with span('parse'):
+        if not is_nextflow(view):
+            return parse_nf_text(text, path)
+        out = []
+        regions = view.find_by_selector(DEFINITION_SELECTOR)
+        for region in regions:
+            region_text = text[region.begin():region.end()]
+            definitions = parse_definitions(region_text, path, scan_blocks(region_text))
+            if not definitions:
+                # the syntax scope does not cover the whole definition, e.g. while it is being typed
+                return parse_nf_text(text, path)
+            offset = region.begin()
+            out.extend(defn.moved(offset) for defn in definitions)
+        functions = view.find_by_selector(FUNCTION_SELECTOR)
+        # the scope of a function only covers its signature, so its body is taken to end before the next definition
+        starts = sorted(x.begin() for x in regions + functions)
+        for region in functions:
+            k = bisect_right(starts, region.begin())
+            region_text = text[region.begin():starts[k] if k < len(starts) else len(text)]
+            offset = region.begin()
+            out.extend(defn.moved(offset) for defn in parse_functions(region_text, path, scan_blocks(region_text)))
+        return out
+
+
+_view_definitions: Dict[int, Tuple[int, Optional[str], List[Definition]]] = {}
+_view_definitions_lock = threading.Lock()
+
+
+def view_definitions(view: sublime.View) -> List[Definition]:
+    """Get the definitions in a view, re-parsing them only if the buffer or file name has changed"""
+    change_count = view.change_count()
+    file_name = view.file_name()
+    with _view_definitions_lock:
+        entry = _view_definitions.get(view.id())
+    if entry is not None and entry[0] == change_count and entry[1] == file_name:
+        return entry[2]
+    path = Path(file_name).resolve() if file_name else Path(view.name() or 'untitled')
+    definitions = parse_view(view, path)
+    with _view_definitions_lock:
+        _view_definitions[view.id()] = (change_count, file_name, definitions)
+    return definitions
+
+
+def forget_view_definitions(view_id: int) -> None:
+    with _view_definitions_lock:
+        _view_definitions.pop(view_id, None)
+
+
+def open_script_definitions(path: Path) -> Optional[List[Definition]]:
+    """Get the definitions of a script from its view or None if it is not open"""
+    view = find_open_view(path)
+    if view is None:
+        return None
+    return view_definitions(view)
+
+
+def find_definition(index: ProjectIndex, name: str, path: Optional[Path] = None) -> Optional[Definition]:
+    """Find a definition by name like `ProjectIndex.find`, reading scripts open in a view from their buffer"""
+    if path is not None:
+        definitions = open_script_definitions(path)
+        if definitions is not None:
+            for defn in definitions:
+                if defn.name == name:
+                    return defn
+            path = None
+    defn = index.find(name, path)
+    if defn is None:
+        return None
+    definitions = open_script_definitions(defn.path)
+    if definitions is not None:
+        # prefer the unsaved definition, but keep the saved one if it has been removed from the buffer
+        for x in definitions:
+            if x.name == name:
+                return x
+    return defn
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Persistent on-disk store of parsed per-file project index data
+
+Parsed definitions are saved in a SQLite database under the Sublime Text cache
+directory, keyed by project root and file path along with the fingerprint of
+the file they were parsed from, so that after a restart only files whose
+fingerprint has changed need to be re-parsed.
+"""
+
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import sublime
+
+from .files import Fingerprint
+
+# Bump whenever the table layout, the format of the stored data or what the
+# parser extracts changes so that stale databases from older package versions
+# are discarded on open.
+SCHEMA_VERSION = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (root, path)
+)
+'''
+
+
+class IndexStore:
+    """SQLite database of serialized parsed file data with file fingerprints"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        import sqlite3
+        try:
+            self.conn = self._connect()
+        except sqlite3.DatabaseError:
+            # corrupt or not a database; start over, along with its journal files
+            for path in (db_path, Path(f'{db_path}-wal'), Path(f'{db_path}-shm')):
+                path.unlink(missing_ok=True)
+            self.conn = self._connect()
+
+    def _connect(self) -> 'sqlite3.Connection':
+        import sqlite3
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS files')
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(SCHEMA)
+        except sqlite3.Error:
+            # closed before the files are removed, which would otherwise still be open and locked on Windows
+            conn.close()
+            raise
+        return conn
+
+    def load(self, root: Path) -> Dict[str, Tuple[Fingerprint, str]]:
+        """Get the stored fingerprint and data of each file under a project root"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT path, mtime_ns, size, inode, data FROM files WHERE root = ?',
+                (str(root),),
+            ).fetchall()
+        return {path: ((mtime_ns, size, inode), data) for path, mtime_ns, size, inode, data in rows}
+
+    def save(self, root: Path, rows: Iterable[Tuple[str, Fingerprint, str]]) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO files (root, path, mtime_ns, size, inode, data) VALUES (?, ?, ?, ?, ?, ?)',
+                ((str(root), path, fp[0], fp[1], fp[2], data) for path, fp, data in rows),
+            )
+
+    def delete(self, root: Path, paths: Iterable[str]) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM files WHERE root = ? AND path = ?',
+                ((str(root), path) for path in paths),
+            )
+
+
+_store: Optional[IndexStore] = None
+_store_lock = threading.Lock()
+
+
+def default_store() -> Optional[IndexStore]:
+    """Get the shared project index store in the Sublime Text cache directory
+
+    None is returned if the database cannot be opened, in which case the index
+    is only kept in memory.
+    """
+    global _store
+    import sqlite3
+    with _store_lock:
+        if _store is None:
+            db_path = Path(sublime.cache_path()) / 'sublime-nextflow' / 'project_index.sqlite3'
+            try:
+                _store = IndexStore(db_path)
+            except (OSError, sqlite3.Error) as ex:
+                print(f'Could not open Nextflow project index database "{db_path}": {ex}')
+                return None
+        return _store
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""Single-pass brace block tokenizer for Nextflow scripts and config files
+
+The text is scanned once with regexes that jump straight to the next token of
+interest (braces and string and comment delimiters), skipping over strings,
+comments and GString ``${...}`` interpolation so that braces in embedded shell
+scripts such as ``awk '{print $1}'`` do not throw off block detection.
+
+Section labels are then found with a single regex pass and assigned to the
+innermost block containing them unless they are in a string or comment. The
+result is a tree of ``{...}`` blocks with their offsets and the section labels
+(``input:``, ``output:``, ``take:``, etc) found directly inside each block.
+"""
+
+import re
+from bisect import bisect_right
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+# characters that may change the scanner state when in code; a plain character class lets the regex engine skip
+# straight to the next candidate
+regex_code_token = re.compile(r'["\'$/{}]')
+# a leading newline rather than `^` in multiline mode is much faster to search for
+regex_label = re.compile(r'\n[ \t]*(input|output|when|script|shell|exec|stub|take|main|emit):(?!:)')
+# ends of single-quoted and slashy strings (which cannot contain unescaped newlines or interpolation here)
+regex_single_quote_end = re.compile(r"(?:[^'\\\n]|\\.)*'")
+regex_slashy_end = re.compile(r'(?:[^/\\\n]|\\.)*/')
+# stops within double-quoted GStrings: escapes, interpolation or the end of the string
+regex_double_quote_stop = re.compile(r'\\[\s\S]|\$\{|"|\n')
+regex_triple_double_quote_stop = re.compile(r'\\[\s\S]|\$\{|"""')
+
+SCRIPT_LABELS = ('script', 'shell', 'exec', 'stub')
+# a `/` after one of these (or `&&` and `||`) starts a slashy string rather than a division
+SLASHY_PRECEDING = '(,=~!?:'
+
+
+class Block:
+    """A ``{...}`` block with the offsets of its opening and closing braces
+
+    `end` is the offset of the closing brace or the length of the text if the
+    block is never closed. `labels` holds (name, line start, body start)
+    tuples for each section label directly inside the block.
+    """
+    __slots__ = ('start', 'end', 'parent', 'children', 'labels')
+
+    def __init__(self, start: int, parent: Optional['Block']):
+        self.start = start
+        self.end = -1
+        self.parent = parent
+        self.children: List['Block'] = []
+        self.labels: List[Tuple[str, int, int]] = []
+
+    def sections(self, names: Tuple[str, ...]) -> Dict[str, Tuple[int, int]]:
+        """Get the (start, end) offsets of the body of each section label in `names`
+
+        A section ends where the next section in `names` starts or at the end of the block.
+        """
+        labels = [x for x in self.labels if x[0] in names]
+        out = {}
+        for i, (name, _, body_start) in enumerate(labels):
+            end = labels[i + 1][1] if i + 1 < len(labels) else self.end
+            out.setdefault(name, (body_start, end))
+        return out
+
+
+def _skip_string(text: str, pos: int, kind: str) -> Tuple[int, bool]:
+    """Skip to the end of a string starting at `pos`
+
+    Returns the offset after the string and False, or the offset after a
+    ``${`` and True if a GString interpolation is reached first.
+    """
+    if kind == "'":
+        m = regex_single_quote_end.match(text, pos)
+        if m:
+            return m.end(), False
+        end = text.find('\n', pos)
+        return (len(text) if end == -1 else end), False
+    if kind == '/':
+        m = regex_slashy_end.match(text, pos)
+        return (m.end() if m else pos), False
+    if kind in ("'''", '$/'):
+        end = text.find("'''" if kind == "'''" else '/$', pos)
+        return (len(text) if end == -1 else end + len(kind)), False
+    regex_stop = regex_double_quote_stop if kind == '"' else regex_triple_double_quote_stop
+    while True:
+        m = regex_stop.search(text, pos)
+        if m is None:
+            return len(text), False
+        pos = m.end()
+        stop = m.group()
+        if stop == '${':
+            return pos, True
+        if stop[0] != '\\':
+            return pos, False
+
+
+def _slashy_string_follows(text: str, pos: int) -> bool:
+    """Check whether the `/` at `pos` follows an operator or opening token rather than an operand"""
+    i = pos - 1
+    while i >= 0 and text[i] in ' \t\r\n':
+        i -= 1
+    if i < 0:
+        return False
+    c = text[i]
+    return c in SLASHY_PRECEDING or (c in '&|' and i > 0 and text[i - 1] == c)
+
+
+def scan_blocks(text: str) -> Dict[int, Block]:
+    """Scan text once into a tree of blocks keyed by the offset of their opening brace
+
+    The root block covering the whole text is keyed by -1.
+    """
+    n = len(text)
+    root = Block(-1, None)
+    root.end = n
+    blocks = {-1: root}
+    current = root
+    # open braces as (block, None) and open GString interpolations as (None, string kind to resume)
+    stack: List[Tuple[Optional[Block], Optional[str]]] = []
+    # (start, end) of strings and comments in order, where section labels are ignored
+    skipped: List[Tuple[int, int]] = []
+    # (block, line start, offset) of triple-quoted strings at the start of a line
+    line_strings: List[Tuple[Block, int, int]] = []
+    pos = 0
+    string_kind = None
+    while True:
+        if string_kind is not None:
+            start = pos
+            pos, interpolation = _skip_string(text, pos, string_kind)
+            skipped.append((start, pos))
+            if interpolation:
+                stack.append((None, string_kind))
+            string_kind = None
+            continue
+        m = regex_code_token.search(text, pos)
+        if m is None:
+            break
+        i = m.start()
+        c = text[i]
+        pos = i + 1
+        if c == '{':
+            block = Block(i, current)
+            current.children.append(block)
+            blocks[i] = block
+            stack.append((block, None))
+            current = block
+        elif c == '}':
+            if not stack:
+                continue
+            block, resume = stack.pop()
+            if block is None:
+                string_kind = resume
+            else:
+                block.end = i
+                current = block.parent
+        elif c == '"' or c == "'":
+            if text.startswith(c * 3, i):
+                string_kind = c * 3
+                pos = i + 3
+                line_start = text.rfind('\n', 0, i) + 1
+                if not text[line_start:i].strip():
+                    line_strings.append((current, line_start, i))
+            else:
+                string_kind = c
+        elif c == '/':
+            if text.startswith('/', pos):
+                end = text.find('\n', pos)
+                pos = n if end == -1 else end
+                skipped.append((i, pos))
+            elif text.startswith('*', pos):
+                end = text.find('*/', pos)
+                pos = n if end == -1 else end + 2
+                skipped.append((i, pos))
+            elif _slashy_string_follows(text, i):
+                string_kind = '/'
+        elif c == '$':
+            if text.startswith('/', pos):
+                string_kind = '$/'
+                pos += 1
+    # unclosed blocks extend to the end of the text
+    for block, _ in stack:
+        if block is not None:
+            block.end = n
+    _add_labels(text, blocks, skipped, line_strings)
+    return blocks
+
+
+def _innermost_block(block_starts: List[int], block_list: List[Block], pos: int) -> Block:
+    block = block_list[bisect_right(block_starts, pos) - 1]
+    while block.end < pos:
+        block = block.parent
+    return block
+
+
+def _add_labels(text: str,
+                blocks: Dict[int, Block],
+                skipped: List[Tuple[int, int]],
+                line_strings: List[Tuple[Block, int, int]]) -> None:
+    """Add section labels that are not in strings or comments to the innermost block containing them"""
+    # blocks are added to the dict in order of their opening brace, with the root block first
+    block_list = list(blocks.values())
+    block_starts = [x.start for x in block_list]
+    skipped_starts = [x[0] for x in skipped]
+    for m in regex_label.finditer(text):
+        pos = m.start(1)
+        k = bisect_right(skipped_starts, pos) - 1
+        if k >= 0 and skipped[k][1] > pos:
+            continue
+        block = _innermost_block(block_starts, block_list, pos)
+        block.labels.append((m.group(1), m.start() + 1, m.end()))
+    # a process script string without a preceding `script:` label starts the script section
+    for block, line_start, start in line_strings:
+        previous = [x for x in block.labels if x[1] < line_start]
+        if not previous or previous[-1][0] not in SCRIPT_LABELS:
+            block.labels.append(('script', line_start, start))
+            block.labels.sort(key=itemgetter(1))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import re
+from typing import Tuple
+
+regex_version_part = re.compile(r'\d+|[A-Za-z]+')
+regex_build_number = re.compile(r'(\d+)$')
+
+# sorts after pre-release tags like `rc1` but before post-release tags and further numeric parts, so that
+# 1.0rc1 < 1.0 < 1.0.post1 < 1.0.1
+_RELEASE = (0.5, '')
+_POST = (0.75, 'post')
+
+
+def version_key(version: str) -> Tuple:
+    """Sort key for loosely semantic version strings like 0.11.9, 2.3.4a or 1.0rc1"""
+    parts = []
+    for x in regex_version_part.findall(version):
+        if x.isdigit():
+            parts.append((1, int(x)))
+        else:
+            x = x.lower()
+            parts.append(_POST if x == 'post' else (0, x))
+    parts.append(_RELEASE)
+    return tuple(parts)
+
+
+def build_number(build: str) -> int:
+    """Get the trailing build number of a Conda package or Biocontainers image build string like py_0 or hdfd78af_1"""
+    m = regex_build_number.search(build)
+    return int(m.group(1)) if m else 0
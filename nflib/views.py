@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+"""Checks listeners run first so that they return right away for views that are not Nextflow scripts"""
+
+import sublime
+
+NEXTFLOW_SELECTOR = 'source.nextflow'
+
+
+def is_nextflow(view: sublime.View) -> bool:
+    """Check if a view is a Nextflow script from the scope at its start
+
+    Matching the scope is a single call into the editor while `view.syntax()`
+    creates a new object describing the syntax on every call.
+    """
+    return view.match_selector(0, NEXTFLOW_SELECTOR)
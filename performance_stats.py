@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import sublime_plugin
+
+from .nflib.files import cache_stats, format_cache_stats, reset_cache_stats
+from .nflib.perf import all_stats, format_stats, profiles_dir, reset, WINDOW_SIZE
+from .nflib.settings import get_setting
+
+PANEL_NAME = 'nextflow_performance'
+
+
+class NextflowShowPerformanceStatsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        """Show the latency of each completion, popup and command and the steps they spend time in"""
+        stats = all_stats()
+        text = f'Latency of the last {WINDOW_SIZE} calls of each Nextflow feature and step\n\n'
+        if stats:
+            text += format_stats(stats)
+        else:
+            text += 'No calls yet'
+        # sizes are of the files values were parsed from; see the nextflow_file_cache_max_* settings
+        text += '\n\nParsed file caches\n\n' + format_cache_stats(cache_stats())
+        if get_setting('nextflow_profile_calls', 0):
+            text += f'\n\ncProfile stats dumps are written to {profiles_dir()}'
+        panel = self.window.create_output_panel(PANEL_NAME)
+        panel.settings().set('word_wrap', False)
+        panel.run_command('append', {'characters': text + '\n'})
+        self.window.run_command('show_panel', {'panel': f'output.{PANEL_NAME}'})
+
+
+class NextflowResetPerformanceStatsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        reset()
+        reset_cache_stats()
+        self.window.status_message('Nextflow performance stats reset')
@@ -1,42 +1,36 @@
 #!/usr/bin/env python
-import re
-from typing import Iterator, Tuple, List
-import sys
 from pathlib import Path
-import json
+from typing import List
 
 import sublime
 import sublime_plugin
 
-regex_withlabel = re.compile(r'\s*withLabel\s*:\s*(?:[\'\"])?(\w+)(?:[\'\"])?\s*\{\s*')
+from .nflib.configs import Selector, get_config_index
+from .nflib.perf import span, timed
+from .nflib.views import is_nextflow
 
+LABEL_COMPLETION_FLAGS = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS
 
-def get_config_labels(path: Path) -> List[Tuple[int, str, str]]:
-    out = []
-    text = path.read_text()
-    for m in regex_withlabel.finditer(text):
-        start, end = m.span()
-        bracket_count = 1
-        end_bracket = -1
-        for i in range(end+1, len(text)):
-            c = text[i]
-            if c == '{':
-                bracket_count += 1
-            elif c == '}':
-                bracket_count -= 1
-            if bracket_count == 0:
-                end_bracket = i
-                break
-        subtext = '\n'.join(x.strip() for x in text[end:end_bracket].strip().split('\n'))
-        out.append((path.name, m.group(1), subtext))
-    return out
+
+def label_completions(labels: List[Selector]) -> List[sublime.CompletionItem]:
+    return [
+        sublime.CompletionItem(
+            trigger=f"'{label.pattern}'",
+            annotation=f'{label.path.name}: {label.pattern}',
+            details=label.details
+        ) for label in labels
+    ]
 
 
 class NextflowProcessLabelEventListener(sublime_plugin.ViewEventListener):
     def on_query_completions(self, prefix, locations):
+        if not is_nextflow(self.view):
+            return None
+        return self.label_completions(locations)
+
+    @timed('completions.process_label')
+    def label_completions(self, locations):
         view = self.view
-        if view.syntax().name != 'Nextflow':
-            return
         if len(locations) > 1:
             return
         point = locations[0]
@@ -48,20 +42,16 @@ class NextflowProcessLabelEventListener(sublime_plugin.ViewEventListener):
         if not folders:
             return
         root_dir = Path(folders[0])
-        labels = []
-        for path in root_dir.rglob('**/*.config'):
-            labels += get_config_labels(path)
-        if not labels:
+        index = get_config_index(root_dir)
+        labels = index.selectors('withLabel')
+        if labels:
+            with span('render'):
+                return sublime.CompletionList(completions=label_completions(labels), flags=LABEL_COMPLETION_FLAGS)
+        job = index.building()
+        if job is None:
             return
-        flags = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS
-        completions = sublime.CompletionList(
-            completions=[
-                sublime.CompletionItem(
-                    trigger=f"'{label_name}'",
-                    annotation=f'{config_name}: {label_name}',
-                    details='|'.join(f'<code>{x.replace(" ", "")}</code>' for x in text.split('\n'))
-                ) for config_name, label_name, text in labels
-            ],
-            flags=flags
-        )
-        return completions
+        # complete once the config files are parsed rather than blocking until then
+        completion_list = sublime.CompletionList()
+        job.on_finish(lambda: completion_list.set_completions(label_completions(index.selectors('withLabel')),
+                                                              LABEL_COMPLETION_FLAGS))
+        return completion_list
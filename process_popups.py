@@ -7,114 +7,17 @@ from typing import Tuple, List, Optional
 import sublime
 import sublime_plugin
 
-regex_input_section = re.compile(r'\s*input:\s*')
-regex_output_section = re.compile(r'\s*output:\s*')
-# regex to find output channels with emit
-regex_output_channel = re.compile(r'(.*?),\s*emit:\s*(\w+)', re.DOTALL)
+from .nflib.includes import view_includes
+from .nflib.index import Definition, get_index
+from .nflib.perf import span, timed
+from .nflib.sources import find_definition as find_project_definition, view_definitions
+from .nflib.scheduler import PopupScheduler
+from .nflib.views import is_nextflow
 
-regex_take_section = re.compile(r'\s*take:\s*')
-regex_emit_section = re.compile(r'\s*emit:\s*')
-regex_wf_emit = re.compile(r'(\w+)\s*=\s*(.*)')
-
-
-def find_closing_bracket(text: str, start: int) -> int:
-    count = 1
-    for i in range(start, len(text)):
-        c = text[i]
-        if c == '{':
-            count += 1
-        elif c == '}':
-            count -= 1
-        if count == 0:
-            return i
-    return -1
-
-
-def find_process_name(proc_name: str, text: str) -> int:
-    m = re.search(r'process\s+' + proc_name + r'\s*{', text)
-    if m:
-        return m.end()
-    return -1
-
-
-def find_workflow_name(proc_name: str, text: str) -> int:
-    m = re.search(r'workflow\s+' + proc_name + r'\s*{', text)
-    if m:
-        return m.end()
-    return -1
-
-
-def find_proc_input_section(text: str, start: int, end: int) -> int:
-    m = regex_input_section.search(text[start:end])
-    if m:
-        return m.end()
-    return -1
-
-
-def find_wf_take_section(text: str, start: int, end: int) -> int:
-    m = regex_take_section.search(text[start:end])
-    if m:
-        return m.end()
-    return -1
-
-
-def get_input_channels(text: str, start: int, end: int) -> List[str]:
-    out = []
-    lines = text[start:end].split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('output:') or line.startswith('script:') or line.startswith('when:') or line.startswith(
-                'exec:'):
-            break
-        out.append(line)
-    return out
-
-
-def get_wf_take_channels(text: str, start: int, end: int) -> List[str]:
-    out = []
-    lines = text[start:end].split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('main:'):
-            break
-        out.append(line)
-    return out
-
-
-def get_input_channel_text(path: Path, proc_name: str) -> List[str]:
-    text = path.read_text()
-    proc_start = find_process_name(proc_name, text)
-    if proc_start == -1:
-        return []
-    proc_end = find_closing_bracket(text, proc_start)
-    if proc_end == -1:
-        return []
-    proc_input_section_start = find_proc_input_section(text, proc_start, proc_end)
-    if proc_input_section_start == -1:
-        return []
-    proc_input_section_start += proc_start
-    return get_input_channels(text, proc_input_section_start, proc_end)
-
-
-def get_wf_takes(path: Path, proc_name: str) -> List[str]:
-    text = path.read_text()
-    wf_start = find_workflow_name(proc_name, text)
-    if wf_start == -1:
-        return []
-    wf_end = find_closing_bracket(text, wf_start)
-    if wf_end == -1:
-        return []
-    wf_take_section_start = find_wf_take_section(text, wf_start, wf_end)
-    if wf_take_section_start == -1:
-        return []
-    wf_take_section_start += wf_start
-    return get_wf_take_channels(text, wf_take_section_start, wf_end)
+OUTPUT_COMPLETION_FLAGS = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS
 
 
+@span('render')
 def proc_input_html(path: str, proc_name: str, input_channels_text: List[str]) -> str:
     out = f'<p>Process: <code>{proc_name}</code></p>'
     out += f'<p>File: <small><code>{path}</code></small></p>'
@@ -124,88 +27,7 @@ def proc_input_html(path: str, proc_name: str, input_channels_text: List[str]) -
     return out
 
 
-def find_proc_output_section(text: str, start: int, end: int) -> int:
-    m = regex_output_section.search(text[start:end])
-    if m:
-        return m.end()
-    return -1
-
-
-def find_wf_emit_section(text: str, start: int, end: int) -> int:
-    m = regex_emit_section.search(text[start:end])
-    if m:
-        return m.end()
-    return -1
-
-
-def get_output_channels(text: str, start: int, end: int) -> List[Tuple[str, str]]:
-    out = []
-    t = text[start:end]
-    for m in regex_output_channel.finditer(t):
-        chan, emit = m.groups()
-        chan = ''.join(x.strip() for x in chan.split('\n'))
-        out.append((emit, chan))
-    return out
-
-
-def get_wf_emit_channels(text: str, start: int, end: int) -> List[Tuple[str, str]]:
-    out = []
-    for m in regex_wf_emit.finditer(text[start:end]):
-        chan, emit = m.groups()
-        out.append((chan, emit))
-    return out
-
-
-def output_section_lines(text: str, start: int, end: int) -> List[Tuple[int, str]]:
-    out = []
-    lines = text[start:end].split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('script:') or line.startswith('when:') or line.startswith('exec:'):
-            break
-        out.append((len(out), line))
-    return out
-
-
-def get_output_channel_emits(path: Path, proc_name: str) -> List[Tuple[str, str]]:
-    text = path.read_text()
-    proc_start = find_process_name(proc_name, text)
-    if proc_start == -1:
-        return []
-    proc_end = find_closing_bracket(text, proc_start)
-    if proc_end == -1:
-        return []
-    proc_output_start = find_proc_output_section(text, proc_start, proc_end)
-    proc_output_start += proc_start
-    next_section_match = re.search(r'(when:|exec:|script:|stub:)', text[proc_output_start:])
-    if next_section_match:
-        proc_end = proc_output_start + next_section_match.start()
-    out = get_output_channels(text, proc_output_start, proc_end)
-    if not out:
-        out = output_section_lines(text, proc_output_start, proc_end)
-    return out
-
-
-def get_wf_emits(path: Path, wf_name: str) -> List[Tuple[str, str]]:
-    text = path.read_text()
-    wf_start = find_workflow_name(wf_name, text)
-    if wf_start == -1:
-        return []
-    wf_end = find_closing_bracket(text, wf_start)
-    if wf_end == -1:
-        return []
-    wf_emit_start = find_wf_emit_section(text, wf_start, wf_end)
-    if wf_emit_start == -1:
-        return []
-    wf_emit_start += wf_start
-    out = get_wf_emit_channels(text, wf_emit_start, wf_end)
-    if not out:
-        out = output_section_lines(text, wf_emit_start, wf_end)
-    return out
-
-
+@span('render')
 def proc_output_html(path: str,
                      proc_or_wf_name: str,
                      output_channels_text: List[Tuple[str, str, Path]],
@@ -225,6 +47,7 @@ def proc_output_html(path: str,
     return out
 
 
+@span('render')
 def proc_info_html(
         path: str,
         proc_or_wf_name: str,
@@ -249,65 +72,41 @@ def proc_info_html(
     return out
 
 
-def show_proc_info(root_dir: Path, view: sublime.View, point: int) -> None:
+def proc_info_popup(root_dir: Path, view: sublime.View, point: int) -> Optional[str]:
     proc_name = view.substr(view.word(point))
-    m, proc_name = find_import_proc_name(proc_name, view)
-    path: Optional[Path] = None
-    input_channels_text = []
-    output_channels_text = []
-    wfpath = Path(view.file_name())
-    is_proc = True
-    if m:
-        nf_path = m.group(1) + '.nf'
-        path = (wfpath.parent / nf_path).resolve()
-        input_channels_text = get_input_channel_text(path, proc_name)
-        if not input_channels_text:
-            input_channels_text = get_wf_takes(path, proc_name)
-            if input_channels_text:
-                is_proc = False
-            else:
-                view.window().status_message(f'No input/take channels in {proc_name}!')
-        output_channels_text = get_output_channel_emits(path, proc_name)
-        if not output_channels_text:
-            output_channels_text = get_wf_emits(path, proc_name)
-            print(f'{output_channels_text=}')
-            if output_channels_text:
-                is_proc = False
-    else:
-        for path in root_dir.rglob('**/*.nf'):
-            input_channels_text = get_input_channel_text(path, proc_name)
-            output_channels_text = get_output_channel_emits(path, proc_name)
-            if input_channels_text or output_channels_text:
-                break
-    if not input_channels_text and not output_channels_text:
-        return
-    if path is None:
-        return
-    short_path = str(path.absolute()).replace(str(root_dir.absolute()) + "/", "")
-    view.show_popup(
-        proc_info_html(
-            path=short_path,
-            proc_or_wf_name=proc_name,
-            input_channels_text=input_channels_text,
-            output_channels_text=output_channels_text,
-            is_proc=is_proc,
-        )
+    defn, proc_name = find_definition(root_dir, view, proc_name)
+    if defn is None:
+        return None
+    if not defn.inputs:
+        view.window().status_message(f'No input/take channels in {proc_name}!')
+    if not defn.inputs and not defn.outputs:
+        return None
+    return proc_info_html(
+        path=get_index(root_dir).short_path(defn.path),
+        proc_or_wf_name=proc_name,
+        input_channels_text=defn.inputs,
+        output_channels_text=defn.outputs,
+        is_proc=defn.kind == 'process',
     )
 
 
-def find_import_proc_name(proc_name: str, view: sublime.View) -> Tuple[Optional[re.Match], str]:
-    region = view.find(r'\w+ +as +' + proc_name, 0)
-    if region.a != -1 and region.b != -1:
-        proc_name = view.substr(view.word(sublime.Region(region.a, region.a)))
-    include_str = view.substr(view.find(r'^include +\{\s*' + proc_name + r"\s*[^}]*\}\s+from\s+'[^']+'", 0))
-    print(f'{include_str=}')
-    m = re.match(r".*from\s+'\./([^']+)'", include_str)
-    if m is None:
-        m = re.match(r".*from\s+'([^']+)'", include_str)
-    return m, proc_name
+def find_definition(root_dir: Path, view: sublime.View, proc_name: str) -> Tuple[Optional[Definition], str]:
+    """Find the definition of an included (and possibly aliased) process or workflow in the project index
+
+    The script the process or workflow is included from is preferred, but if that script cannot be found, any
+    definition with the same name in the project is returned. Processes and workflows that are not included are
+    looked up in the view itself first. Scripts open in a view are read from their (possibly unsaved) buffer.
+    """
+    include = view_includes(view).get(proc_name)
+    if include is None:
+        for defn in view_definitions(view):
+            if defn.name == proc_name:
+                return defn, proc_name
+        return find_project_definition(get_index(root_dir), proc_name), proc_name
+    return find_project_definition(get_index(root_dir), include.name, include.path), include.name
 
 
-def show_output_channel_popup(root_dir: Path, view: sublime.View, point: int) -> None:
+def output_channel_popup(root_dir: Path, view: sublime.View, point: int) -> Optional[str]:
     emit_or_out_word_region = view.word(point)
     emit_or_out_word_substr = view.substr(emit_or_out_word_region)
     focus_channel = None
@@ -317,47 +116,41 @@ def show_output_channel_popup(root_dir: Path, view: sublime.View, point: int) ->
         out_word_region = view.word(emit_or_out_word_region.a - 2)
         out_word_substr = view.substr(out_word_region)
         if out_word_substr != 'out':
-            print(f'Could not find "out" output channels keyword for process.')
-            return
+            return None
         focus_channel = emit_or_out_word_substr
         proc_name = view.substr(view.word(out_word_region.a - 2))
-    window = view.window()
+    defn, proc_name = find_definition(root_dir, view, proc_name)
+    if defn is None or not defn.outputs:
+        view.window().status_message(f'No output channels in {proc_name}!')
+        return None
+    return proc_output_html(
+        get_index(root_dir).short_path(defn.path),
+        proc_name,
+        defn.outputs,
+        focus_channel,
+        defn.kind == 'process',
+    )
 
-    m, proc_name = find_import_proc_name(proc_name, view)
-    output_channels_text = []
-    path: Optional[Path] = None
-    wfpath = Path(view.file_name())
-    is_proc: bool = True
-    if m:
-        nf_path = m.group(1) + '.nf'
-        path = (wfpath.parent / nf_path).resolve()
-        if not path.exists():
-            paths = list(root_dir.rglob(nf_path))
-            if not paths:
-                view.window().status_message(f'No output channels in {proc_name}!')
-            path = paths[0]
-            output_channels_text = get_output_channel_emits(path, proc_name)
-            if not output_channels_text:
-                view.window().status_message(f'No output channels in {proc_name}!')
-        else:
-            output_channels_text = get_output_channel_emits(path, proc_name)
-            if not output_channels_text:
-                output_channels_text = get_wf_emits(path, proc_name)
-                is_proc = False
-        if not output_channels_text:
-            window.status_message(f'No output channels in {proc_name}!')
-    else:
-        for path in root_dir.rglob('**/*.nf'):
-            output_channels_text = get_output_channel_emits(path, proc_name)
-            if output_channels_text:
-                break
-    if not output_channels_text or path is None:
-        return
-    short_path = str(path.absolute()).replace(str(root_dir.absolute()) + "/", "")
-    view.show_popup(proc_output_html(short_path, proc_name, output_channels_text, focus_channel, is_proc))
+
+def output_channel_completions(root_dir: Path, view: sublime.View, proc_name: str) -> List[sublime.CompletionItem]:
+    defn, proc_name = find_definition(root_dir, view, proc_name)
+    if defn is None:
+        return []
+    short_path = get_index(root_dir).short_path(defn.path)
+    return [
+        sublime.CompletionItem(
+            trigger=emit,
+            annotation=chan,
+            details=f'<code>{chan}</code><br><p>From "{short_path}"</p>',
+        )
+        for emit, chan in defn.outputs
+    ]
 
 
 class NextflowWorkflowProcessCallEventListener(sublime_plugin.EventListener):
+    def __init__(self):
+        self.popups = PopupScheduler()
+
     def on_selection_modified_async(self, view: sublime.View):
         """Show popups for process calls and output channel property access
 
@@ -368,14 +161,23 @@ class NextflowWorkflowProcessCallEventListener(sublime_plugin.EventListener):
         - named output channel (e.g. FASTQC.out.html) (variable.channel.process-output-emit.nextflow)
 
         A popup will be shown with info about the process input/output channels. For named output channels, the accessed output channel will be highlighted.
+
+        Lookups are debounced so that only the position the cursor stops at is looked up.
         """
-        if view.syntax().name != 'Nextflow':
+        if not is_nextflow(view):
             return
         if len(view.selection) > 1:
             return
-        folders = view.window().folders()
+        self.popups.schedule(view, self.selection_popup)
+
+    @timed('popup.process')
+    def selection_popup(self, view: sublime.View) -> Optional[str]:
+        window = view.window()
+        if window is None:
+            return None
+        folders = window.folders()
         if not folders:
-            return
+            return None
         root_dir = Path(folders[0])
         region = view.selection[0]
         point = region.a
@@ -383,67 +185,42 @@ class NextflowWorkflowProcessCallEventListener(sublime_plugin.EventListener):
         # if cursor on process name, then show popup with input/output channel info
         if view.score_selector(point,
                                'source.nextflow meta.definition.workflow.nextflow entity.name.class.process.nextflow'):
-            show_proc_info(root_dir, view, point)
-            return
+            return proc_info_popup(root_dir, view, point)
         out_chan_scope = '(variable.channel.process-output-emit.nextflow | keyword.process.out.nextflow)'
         if view.score_selector(point, out_chan_scope) or view.score_selector(point - 1, out_chan_scope):
-            show_output_channel_popup(root_dir, view, point)
-            return
+            return output_channel_popup(root_dir, view, point)
         # if cursor on or after `out` or named output channel, then show popup with process output channel info
         # highlighting named process
         proc_call_input_scope = 'source.nextflow meta.definition.workflow.nextflow meta.process-call.nextflow - (' \
                                 'punctuation.accessor.dot.process-out.nextflow | entity | keyword | variable) '
         if not view.score_selector(point, proc_call_input_scope):
-            return
+            return None
         if not view.score_selector(point_before, proc_call_input_scope):
-            return
+            return None
         s = view.substr(point_before)
         if s not in (' ', ',', '('):
-            return
+            return None
         regions = [x for x in view.find_by_selector('meta.process-call.nextflow') if x.contains(point)]
         if not regions:
-            return
-        proc_call_str = view.substr(regions[0])
-        m = re.match(r'^(\w+)', proc_call_str)
-        if not m:
-            return
-        proc_name = m.group(1)
-        m, proc_name = find_import_proc_name(proc_name, view)
-        input_channels_text = []
-        path: Optional[Path] = None
-        wfpath = Path(view.file_name())
-        if m:
-            nf_path = m.group(1) + '.nf'
-            path = (wfpath.parent / nf_path).resolve()
-            if not path.exists():
-                print(f'{path=} does not exist')
-                paths = list(root_dir.rglob(nf_path))
-                if len(paths) == 0:
-                    view.window().status_message(f'No input channels in {proc_name}!')
-                path = paths[0]
-                input_channels_text = get_input_channel_text(path, proc_name)
-                if not input_channels_text:
-                    view.window().status_message(f'No input channels in {proc_name}!')
-            else:
-                input_channels_text = get_input_channel_text(path, proc_name)
-                if not input_channels_text:
-                    view.window().status_message(f'No input channels in {proc_name}!')
-        else:
-            for path in root_dir.rglob('**/*.nf'):
-                input_channels_text = get_input_channel_text(path, proc_name)
-                if input_channels_text:
-                    break
-        if not input_channels_text:
-            return
-        if path is None:
-            return
-        short_path = str(path.absolute()).replace(str(root_dir.absolute()), "")
-        view.show_popup(proc_input_html(short_path, proc_name, input_channels_text))
+            return None
+        # the process call scope starts at the opening parenthesis right after the process name
+        proc_name = view.substr(view.word(regions[0].begin() - 1))
+        if not re.match(r'^\w+$', proc_name):
+            return None
+        defn, proc_name = find_definition(root_dir, view, proc_name)
+        if defn is None or defn.kind != 'process' or not defn.inputs:
+            view.window().status_message(f'No input channels in {proc_name}!')
+            return None
+        return proc_input_html(get_index(root_dir).short_path(defn.path), proc_name, defn.inputs)
 
     def on_query_completions(self, view, prefix, locations):
+        if not is_nextflow(view):
+            return None
+        return self.process_out_completions(view, locations)
+
+    @timed('completions.process_out')
+    def process_out_completions(self, view, locations):
         window = view.window()
-        if view.syntax().name != 'Nextflow':
-            return
         if len(locations) > 1:
             return
         point = locations[0]
@@ -463,37 +240,15 @@ class NextflowWorkflowProcessCallEventListener(sublime_plugin.EventListener):
             return
         root_dir = Path(folders[0])
 
-        m, proc_name = find_import_proc_name(proc_name, view)
-        emits = []
-        path = None
-        wfpath = Path(view.file_name())
-        if m:
-            nf_path = m.group(1) + '.nf'
-            path = (wfpath.parent / nf_path).resolve()
-            if path.exists():
-                emits = get_output_channel_emits(path, proc_name)
-                if not emits:
-                    emits = get_wf_emits(path, proc_name)
-                if not emits:
-                    window.status_message(f'No named output channels in {proc_name}!')
-        else:
-            for path in root_dir.rglob('**/*.nf'):
-                emits = get_output_channel_emits(path, proc_name)
-                if emits:
-                    break
-        if not emits:
-            return
-        if path is None:
-            return
-        flags = sublime.INHIBIT_REORDER | sublime.INHIBIT_WORD_COMPLETIONS
-        return sublime.CompletionList(
-            completions=[
-                sublime.CompletionItem(
-                    trigger=emit,
-                    annotation=chan,
-                    details=f'<code>{chan}</code><br><p>From "{str(path.absolute()).replace(str(root_dir.absolute()) + "/", "")}"</p>',
-                )
-                for emit, chan in emits
-            ],
-            flags=flags,
-        )
+        completions = output_channel_completions(root_dir, view, proc_name)
+        if completions:
+            return sublime.CompletionList(completions=completions, flags=OUTPUT_COMPLETION_FLAGS)
+        job = get_index(root_dir).building()
+        if job is None:
+            window.status_message(f'No named output channels in {proc_name}!')
+            return
+        # complete once the project is indexed rather than blocking until the process is indexed
+        completion_list = sublime.CompletionList()
+        job.on_finish(lambda: completion_list.set_completions(output_channel_completions(root_dir, view, proc_name),
+                                                              OUTPUT_COMPLETION_FLAGS))
+        return completion_list
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import sublime
+import sublime_plugin
+
+from .nflib.index import Definition, get_index
+from .nflib.perf import span, timed
+from .nflib.configs import Directive, get_config_model
+from .nflib.sources import find_open_view
+from .nflib.views import is_nextflow
+from .process_popups import find_definition
+
+
+def definition_line(view: sublime.View, defn: Definition) -> int:
+    if view.file_name() and Path(view.file_name()).resolve() == defn.path:
+        return view.rowcol(defn.span[0])[0]
+    defn_view = find_open_view(defn.path)
+    if defn_view is not None:
+        return defn_view.rowcol(defn.span[0])[0]
+    try:
+        return defn.path.read_text().count('\n', 0, defn.span[0])
+    except (OSError, UnicodeDecodeError):
+        return 0
+
+
+def directive_html(root_dir: Path, directive: Directive) -> str:
+    import html
+    short_path = get_index(root_dir).short_path(directive.path)
+    href = html.escape(f'{directive.path}:{directive.line + 1}')
+    return (f'<p><code>{html.escape(directive.name, False)} = {html.escape(directive.value, False)}</code> '
+            f'<small>{html.escape(directive.selector)} '
+            f'(<a href="{href}">{html.escape(short_path)}:{directive.line + 1}</a>)</small></p>')
+
+
+@span('render')
+def resources_html(root_dir: Path,
+                   proc_name: str,
+                   labels: List[str],
+                   resolved: Dict[str, Directive],
+                   profiles: Dict[str, List[Directive]]) -> str:
+    import html
+    out = f'<h3>Process: <code>{proc_name}</code></h3>'
+    if labels:
+        out += '<p>Labels: ' + ', '.join(f'<code>{html.escape(x)}</code>' for x in labels) + '</p>'
+    out += '<h3>Directives:</h3>'
+    if resolved:
+        for directive in resolved.values():
+            out += directive_html(root_dir, directive)
+    else:
+        out += '<i>No directives set in config or process definition</i>'
+    for profile, directives in profiles.items():
+        out += f'<h3>With profile <code>{html.escape(profile)}</code>:</h3>'
+        for directive in directives:
+            out += directive_html(root_dir, directive)
+    return out
+
+
+def process_resources_popup(root_dir: Path, view: sublime.View, point: int) -> Optional[str]:
+    proc_name = view.substr(view.word(point))
+    defn, proc_name = find_definition(root_dir, view, proc_name)
+    if defn is None or defn.kind != 'process':
+        return None
+    line = definition_line(view, defn)
+    definition_directives = [
+        Directive(name, value, defn.path, line, 'process definition', None)
+        for name, value in defn.directives if name != 'label'
+    ]
+    model = get_config_model(root_dir)
+    labels = defn.labels
+    resolved = model.resolve(proc_name, labels, definition_directives)
+    profiles = {}
+    for profile in model.profiles:
+        changed = [x for name, x in model.resolve(proc_name, labels, definition_directives, profile).items()
+                   if resolved.get(name) != x]
+        if changed:
+            profiles[profile] = changed
+    return resources_html(root_dir, proc_name, labels, resolved, profiles)
+
+
+class NextflowProcessResourcesEventListener(sublime_plugin.EventListener):
+    def on_hover(self, view: sublime.View, point: int, hover_zone: int):
+        """Show the directives a process gets from config files and its definition when hovering over its name
+
+        Directives are resolved from `withLabel` and `withName` selectors in
+        `nextflow.config` and the configs it includes, with the changes made by
+        each profile listed separately.
+        """
+        if hover_zone != sublime.HOVER_TEXT:
+            return
+        if not is_nextflow(view):
+            return
+        if not view.score_selector(point, 'source.nextflow entity.name.class.process.nextflow'):
+            return
+        window = view.window()
+        if window is None or not window.folders():
+            return
+        root_dir = Path(window.folders()[0])
+        sublime.set_timeout_async(lambda: self.show_popup(root_dir, view, point))
+
+    @timed('popup.process_resources')
+    def show_popup(self, root_dir: Path, view: sublime.View, point: int):
+        popup = process_resources_popup(root_dir, view, point)
+        if popup is None:
+            return
+        window = view.window()
+
+        def on_navigate(href: str):
+            if window is not None:
+                window.open_file(href, sublime.ENCODED_POSITION)
+
+        view.show_popup(popup,
+                        flags=sublime.HIDE_ON_MOUSE_MOVE_AWAY,
+                        location=point,
+                        max_width=800,
+                        on_navigate=on_navigate)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import sublime
+import sublime_plugin
+
+from .nflib.configs import config_changed, forget_config_roots, get_config_index
+from .nflib.files import invalidate_cached
+from .nflib.includes import forget_view
+from .nflib.index import file_changed, forget_roots, get_index
+from .nflib.params import forget_params_roots
+from .nflib.perf import timed
+from .nflib.sources import forget_view_definitions
+from .nflib.views import is_nextflow
+
+# file extensions of files whose parsed contents are cached
+INDEXED_SUFFIXES = ('.nf', '.config', '.json')
+
+
+def view_path(view: sublime.View) -> Optional[Path]:
+    file_name = view.file_name()
+    if not file_name or not file_name.endswith(INDEXED_SUFFIXES):
+        return None
+    return Path(file_name)
+
+
+def start_indexing(window: sublime.Window) -> None:
+    """Start indexing the folders of a window in the background"""
+    for folder in window.folders():
+        get_index(Path(folder)).start_build(window)
+        get_config_index(Path(folder)).start_build(window)
+
+
+def plugin_loaded():
+    # projects are indexed once a Nextflow script is opened rather than on every start of the editor
+    for window in sublime.windows():
+        if any(is_nextflow(view) for view in window.views()):
+            start_indexing(window)
+
+
+@timed('index.update_file')
+def update_file(path: Path) -> None:
+    """Bring cached info for a changed file up-to-date
+
+    Only Nextflow scripts and config files whose fingerprint has changed are
+    re-parsed; other cached file contents are dropped and re-parsed on next use.
+    """
+    if path.suffix == '.nf':
+        file_changed(path)
+        return
+    invalidate_cached(path.resolve())
+    if path.suffix == '.config':
+        config_changed(path)
+
+
+class NextflowProjectIndexEventListener(sublime_plugin.EventListener):
+    """Keep the project index and file caches in sync with changes made in the editor"""
+
+    def __init__(self):
+        self.window_folders: Dict[int, Tuple[str, ...]] = {}
+
+    def on_post_save_async(self, view: sublime.View):
+        path = view_path(view)
+        if path:
+            update_file(path)
+
+    def on_load_async(self, view: sublime.View):
+        path = view_path(view)
+        if path:
+            update_file(path)
+
+    def on_close(self, view: sublime.View):
+        forget_view(view.id())
+        forget_view_definitions(view.id())
+        path = view_path(view)
+        if path:
+            sublime.set_timeout_async(lambda: update_file(path))
+
+    def on_activated_async(self, view: sublime.View):
+        if not is_nextflow(view):
+            return
+        window = view.window()
+        if window is None:
+            return
+        folders = tuple(window.folders())
+        if self.window_folders.get(window.id()) == folders:
+            return
+        self.window_folders[window.id()] = folders
+        self.check_folders()
+        start_indexing(window)
+
+    def on_post_window_command(self, window: sublime.Window, command_name: str, args):
+        if command_name in ('remove_folder', 'close_folder_list', 'close_project', 'close_window'):
+            sublime.set_timeout_async(self.check_folders)
+
+    def check_folders(self):
+        """Drop indexes for project folders that have been closed or removed from all windows"""
+        open_roots = [Path(folder) for window in sublime.windows() for folder in window.folders()]
+        forget_roots(open_roots)
+        forget_config_roots(open_roots)
+        forget_params_roots(open_roots)
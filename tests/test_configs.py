@@ -0,0 +1,89 @@
+"""Parsing params and process directives from configs and scripts, run with `python -m pytest tests`"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bench.editor import Editor
+from bench.generate import PipelineSpec, generate_pipeline
+
+CONFIG = '''
+params {
+    url = "http://x.y/z" // trailing
+    pattern = '*.{fq,fastq}' // reads
+    outdir = 'results'
+}
+params.max_cpus = 16 // per task
+
+process {
+    cpus = 2 // default
+    withLabel: 'big' {
+        memory = 4.GB // comment with a ' quote
+        ext.args = '--url http://a.b/c'
+    }
+}
+'''
+
+SCRIPT = '''
+params.input = "s3://bucket/samplesheet.csv" // samplesheet
+params.skip = false
+'''
+
+
+def setUpModule():
+    global editor, configs, params
+    editor = Editor.load()
+    configs = editor.module('nflib.configs')
+    params = editor.module('nflib.params')
+
+
+class TrailingCommentTests(unittest.TestCase):
+
+    def test_config_values(self):
+        items = configs.parse_config(CONFIG, Path('/p/nextflow.config'), Path('/p'))
+        values = {x.name: x.value for x in items if isinstance(x, configs.Param)}
+        self.assertEqual(values, {'url': '"http://x.y/z"', 'pattern': "'*.{fq,fastq}'", 'outdir': "'results'",
+                                  'max_cpus': '16'})
+        rules = [x for x in items if isinstance(x, configs.Rule)]
+        self.assertEqual([(x.kind, x.pattern) for x in rules], [('process', ''), ('withLabel', 'big')])
+        self.assertEqual([(x.name, x.value) for x in rules[0].directives], [('cpus', '2')])
+        self.assertEqual([(x.name, x.value) for x in rules[1].directives],
+                         [('memory', '4.GB'), ('ext.args', "'--url http://a.b/c'")])
+
+    def test_script_values(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'main.nf'
+            path.write_text(SCRIPT)
+            values = {x.name: x.value for x in params.read_script_params(path)}
+        self.assertEqual(values, {'input': '"s3://bucket/samplesheet.csv"', 'skip': 'false'})
+
+
+class ConfigIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp(prefix='test-nextflow-'))
+        self.root_dir = (self.work_dir / 'pipeline').resolve()
+        generate_pipeline(self.root_dir, PipelineSpec(labels=3, work_dirs=0))
+        self.window = editor.open_window([self.root_dir])
+
+    def tearDown(self):
+        editor.wait_idle()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_label_completions_while_parsing(self):
+        text = 'process FOO {\n    label \n}\n'
+        view = editor.new_view(self.window, text)
+        index = configs.get_config_index(self.root_dir)
+        results = [x for x in editor.dispatch('on_query_completions', view, '', [text.index('label ') + 6]) if x]
+        # config files are parsed in the background and not while completing
+        self.assertIsNotNone(index.building())
+        self.assertEqual(len(results), 1)
+        editor.wait_idle()
+        self.assertTrue(index.built)
+        self.assertEqual([x.trigger for x in results[0].completions][:3],
+                         ["'process_single'", "'process_low'", "'process_medium'"])
+
+
+if __name__ == '__main__':
+    unittest.main()
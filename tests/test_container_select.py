@@ -0,0 +1,114 @@
+"""Fetching the Biocontainers images listing from a local stand-in server, run with `python -m pytest tests`"""
+
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from bench.editor import Editor
+
+LISTING_PATH = Path(__file__).resolve().parent / 'fixtures' / 'singularity_listing.html'
+ETAG = '"listing-1"'
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """Serve `server.listing` with an ETag, answering conditional requests for it with a 304"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        server.gate.wait()
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(server.listing)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        self.wfile.write(server.listing)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def setUpModule():
+    global editor, container_select
+    editor = Editor.load()
+    container_select = editor.module('container_select')
+
+
+class ContainerSelectTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test-nextflow-')
+        editor.sublime.set_cache_path(self.work_dir)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ListingHandler)
+        self.server.listing = LISTING_PATH.read_bytes()
+        self.server.requests = []
+        self.server.gate = threading.Event()
+        self.server.gate.set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings = editor.sublime.load_settings('Nextflow.sublime-settings')
+        settings.set('nextflow_biocontainers_url', f'http://127.0.0.1:{self.server.server_port}/singularity/')
+        self.window = editor.open_window([self.work_dir])
+        self.view = editor.new_view(self.window, 'process FOO {\n    \n}\n')
+        self.view.set_cursor(18)
+
+    def tearDown(self):
+        self.server.gate.set()
+        editor.wait_idle()
+        self.server.shutdown()
+        self.server.server_close()
+        editor.sublime.load_settings('Nextflow.sublime-settings').erase('nextflow_biocontainers_url')
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_parse_listing(self):
+        images = list(container_select.parse_images(LISTING_PATH.read_bytes().splitlines()))
+        self.assertEqual(len(images), 9)
+        self.assertEqual(images[0], ('bwa:0.7.17--h5bf99c6_8', '2021-07-21T10:12:00', '22.4 MB'))
+        tools = container_select.index_tools(images)
+        self.assertEqual([x[0] for x in tools], ['bwa', 'fastqc', 'multiqc', 'samtools'])
+        # versions are sorted newest first, by version rather than as strings
+        self.assertEqual(tools[3][2], ['samtools:1.17--h00cdaf9_0', 'samtools:1.9--h91753b0_8'])
+
+    def test_unchanged_listing_is_not_downloaded_again(self):
+        self.assertEqual(container_select.get_images(), (9, 9))
+        self.assertEqual(container_select.get_images(cache=container_select.load_images_cache()), (9, 0))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+        self.assertEqual(self.server.requests[1]['If-None-Match'], ETAG)
+        self.assertEqual(len(container_select.load_images_cache().read('tools')), 4)
+
+    def test_select_fetches_then_shows_tools(self):
+        self.view.run_command('nextflow_biocontainer_select')
+        editor.wait_idle()
+        items, _, _ = self.window.quick_panel
+        self.assertEqual(len(items), 4)
+        self.assertTrue(items[0].startswith('bwa (3 versions, latest 0.7.18--he4a0461_0'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_select_with_fetch_in_flight(self):
+        self.server.gate.clear()
+        job = container_select.start_fetch_images(self.window)
+        self.view.run_command('nextflow_biocontainer_select')
+        self.assertIs(container_select.start_fetch_images(self.window), job)
+        self.server.gate.set()
+        editor.wait_idle()
+        self.assertIsNotNone(self.window.quick_panel)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_select_with_empty_listing_stops(self):
+        self.server.listing = b'<html><body><pre><a href="../">../</a>\n</pre></body></html>\n'
+        self.view.run_command('nextflow_biocontainer_select')
+        editor.wait_idle()
+        self.assertIsNone(self.window.quick_panel)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(self.window.status_messages[-1].startswith('No Biocontainers images found'))
+
+
+if __name__ == '__main__':
+    unittest.main()
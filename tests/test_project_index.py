@@ -0,0 +1,91 @@
+"""Lookups while a generated pipeline is being indexed, run with `python -m pytest tests`"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bench.editor import Editor
+from bench.generate import PipelineSpec, generate_pipeline, module_name, module_path
+
+
+def setUpModule():
+    global editor
+    editor = Editor.load()
+
+
+class ProjectIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp(prefix='test-nextflow-'))
+        self.root_dir = (self.work_dir / 'pipeline').resolve()
+        generate_pipeline(self.root_dir, PipelineSpec(work_dirs=0))
+        editor.sublime.set_cache_path(str(self.work_dir / 'cache'))
+        # the store is shared by all indexes, open it again in this test's cache directory
+        self.store = editor.module('nflib.store')
+        self.store._store = None
+        self.window = editor.open_window([self.root_dir])
+        self.index = editor.module('nflib.index').get_index(self.root_dir)
+
+    def tearDown(self):
+        editor.wait_idle()
+        if self.store._store is not None:
+            self.store._store.conn.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_out_completions_answer_once_indexed(self):
+        text = f'workflow X {{\n    {module_name(5)}.out.\n}}\n'
+        view = editor.new_view(self.window, text)
+        results = [x for x in editor.dispatch('on_query_completions', view, '', [text.index('.out.') + 5]) if x]
+        self.assertEqual(len(results), 1)
+        # a process not indexed yet is completed once the build is done rather than blocking until then
+        self.assertIsNone(results[0].completions)
+        self.assertIsNotNone(self.index.building())
+        editor.wait_idle()
+        self.assertEqual([x.trigger for x in results[0].completions], ['results', 'log', 'versions'])
+
+    def test_cancelling_fetches_keeps_indexing(self):
+        job = self.index.start_build()
+        fetcher = editor.module('nflib.fetch').fetcher
+        self.assertNotIn(job, fetcher.cancellable_jobs())
+        fetcher.cancel_all()
+        editor.wait_idle()
+        self.assertFalse(job.cancelled)
+        self.assertTrue(self.index.built)
+
+    def test_new_session_reuses_stored_definitions(self):
+        self.index.build()
+        self.assertEqual(self.store.default_store().db_path.parent.parent, self.work_dir / 'cache')
+        index = editor.module('nflib.index').ProjectIndex(self.root_dir, self.store.default_store())
+        index.start_build(self.window)
+        editor.wait_idle()
+        self.assertTrue(self.window.status_messages[-1].endswith('(0 parsed)'))
+        self.assertIsNotNone(index.find(module_name(5)))
+
+    def test_include_panel_is_shown_again_once_indexed(self):
+        view = editor.open_file(self.window, self.root_dir / 'workflows' / 'pipeline.nf')
+        view.run_command('nextflow_include_process')
+        editor.wait_idle()
+        items, _, _ = self.window.quick_panel
+        self.assertIn([module_name(5), str(self.root_dir / module_path(5))], items)
+        self.assertEqual(len(items), len(list(self.index.definitions('process', 'workflow'))))
+
+    def test_include_panel_is_kept_once_moved_through(self):
+        self.index.build()
+        (self.root_dir / 'modules' / 'local').mkdir(parents=True, exist_ok=True)
+        (self.root_dir / 'modules' / 'local' / 'extra.nf').write_text('process EXTRA {\n}\n')
+        # a new session lists the stored definitions while the index is being built
+        editor.module('nflib.index').forget_roots([])
+        index = editor.module('nflib.index').get_index(self.root_dir)
+        view = editor.open_file(self.window, self.root_dir / 'workflows' / 'pipeline.nf')
+        view.run_command('nextflow_include_process')
+        panel = self.window.quick_panel
+        panel[2](3)
+        editor.wait_idle()
+        self.assertTrue(index.built)
+        self.assertIs(self.window.quick_panel, panel)
+        self.assertNotIn('EXTRA', [x[0] for x in panel[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
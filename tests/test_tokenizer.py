@@ -0,0 +1,103 @@
+"""Regression tests for braces in embedded shell scripts and GStrings, run with `python -m pytest tests`"""
+
+import unittest
+
+from nflib.parsing import get_proc_inputs, get_proc_outputs, process_sections, regex_definition
+from nflib.tokenizer import Block, scan_blocks
+
+AWK_PROCESS = r"""
+process AWK {
+    input:
+    path(tsv)
+
+    output:
+    path('first.txt'), emit: first
+
+    script:
+    '''
+    awk '{print $1}' $tsv > first.txt
+    awk 'BEGIN { FS = "\t" } { n++ } END { print n }' $tsv
+    '''
+}
+
+workflow {
+    AWK(Channel.fromPath(params.input))
+}
+"""
+
+SED_PROCESS = r'''
+process SED {
+    input:
+    tuple val(meta), path(reads)
+
+    output:
+    tuple val(meta), path('*.txt'), emit: txt
+
+    script:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    sed -e '/^>/{s/ .*//}' -e 's/{}/x/g' $reads > ${prefix}.txt
+    echo "${meta.collect { k, v -> "$k=$v" }.join(',')}" >> ${prefix}.txt
+    """
+}
+'''
+
+
+def process_block(text: str, blocks) -> Block:
+    m = regex_definition.search(text)
+    return blocks[m.end() - 1]
+
+
+class ShellBraceTests(unittest.TestCase):
+
+    def test_awk_braces_in_single_quotes(self):
+        blocks = scan_blocks(AWK_PROCESS)
+        block = process_block(AWK_PROCESS, blocks)
+        self.assertEqual(AWK_PROCESS[block.end], '}')
+        self.assertEqual(AWK_PROCESS[block.end + 1:].split(), ['workflow', '{', 'AWK(Channel.fromPath(params.input))',
+                                                               '}'])
+        # the process and workflow are the only top-level blocks
+        self.assertEqual(len(blocks[-1].children), 2)
+        sections = process_sections(block)
+        self.assertEqual(list(sections), ['input', 'output', 'script'])
+        self.assertEqual(get_proc_inputs(AWK_PROCESS, sections), ['path(tsv)'])
+        self.assertEqual(get_proc_outputs(AWK_PROCESS, sections), [('first', "path('first.txt')")])
+        self.assertIn("awk '{print $1}'", AWK_PROCESS[slice(*sections['script'])])
+
+    def test_sed_braces_and_gstring_interpolation(self):
+        blocks = scan_blocks(SED_PROCESS)
+        block = process_block(SED_PROCESS, blocks)
+        self.assertEqual(block.end, SED_PROCESS.rstrip().rindex('}'))
+        sections = process_sections(block)
+        self.assertEqual(list(sections), ['input', 'output', 'script'])
+        self.assertEqual(get_proc_inputs(SED_PROCESS, sections), ['tuple val(meta), path(reads)'])
+        self.assertEqual(get_proc_outputs(SED_PROCESS, sections), [('txt', "tuple val(meta), path('*.txt')")])
+        # only the closure inside the GString interpolation is a block within the process
+        self.assertEqual([SED_PROCESS[x.start:x.end + 1] for x in block.children], ['{ k, v -> "$k=$v" }'])
+
+    def test_labels_in_script_strings_are_ignored(self):
+        text = 'process FOO {\n    script:\n    """\n    awk \'{\n    output:\n    }\' in.txt\n    """\n}\n'
+        block = process_block(text, scan_blocks(text))
+        self.assertEqual(list(process_sections(block)), ['script'])
+        self.assertEqual(block.end, len(text) - 2)
+
+    def test_unbalanced_braces_in_strings(self):
+        text = 'process FOO {\n    script:\n    """\n    echo "}" \'{\' ${x.y}\n    """\n}\nworkflow {\n}\n'
+        blocks = scan_blocks(text)
+        self.assertEqual(len(blocks[-1].children), 2)
+        self.assertEqual(process_block(text, blocks).end, text.index('}\nworkflow'))
+
+    def test_slashy_strings_after_operators(self):
+        text = ("def clean(x) {\n    return x.replaceAll(/\\{/, '') && x =~ /}/ ? x : [x, /{/]\n}\n"
+                "def half(x) {\n    x.size() / 2 + x.size()/ 2\n}\n"
+                "process FOO {\n    script:\n    '''\n    echo\n    '''\n}\n")
+        blocks = scan_blocks(text)
+        # the braces in the slashy strings do not open blocks, nor do divisions start strings
+        self.assertEqual([text[x.end - 1:x.end + 2] for x in blocks[-1].children], ['\n}\n'] * 3)
+        self.assertEqual([len(x.children) for x in blocks[-1].children], [0, 0, 0])
+        self.assertEqual(process_block(text, blocks).end, len(text) - 2)
+        self.assertEqual(list(process_sections(process_block(text, blocks))), ['script'])
+
+
+if __name__ == '__main__':
+    unittest.main()